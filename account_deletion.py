@@ -0,0 +1,268 @@
+"""
+Asynchronous account deletion.
+
+Deleting an account only tombstones the user (`User.deleted_at`) and queues an
+`AccountDeletionJob` in the same transaction, so the request returns at once and
+the user is logged out everywhere with their data hidden. A background thread
+then purges child rows, pets, upload files and finally the user in chunks of at
+most `ACCOUNT_PURGE_BATCH_SIZE` rows. Every chunk is its own short transaction
+that also saves the job's progress, so other users are never blocked on the
+SQLite write lock for long, and a job interrupted by a restart resumes where the
+data left off once its lease expires. A failed attempt is retried after an
+exponential backoff with jitter, like the outbox emails.
+
+Same claim/lease pattern as `mail_outbox.py`.
+"""
+
+import random
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import and_, delete, event, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from extensions import db
+from graph_cache import mark_weight_changed
+from helpers import PET_CHILD_MODELS
+from models import AccountDeletionJob, Pet, Photo, User, utcnow
+from pet_cache import mark_pets_changed
+from upload_store import release_uploads
+
+
+def request_account_deletion(user):
+    """Tombstone the user and queue the purge of their data in the current transaction"""
+    user.deleted_at = utcnow()
+    job = AccountDeletionJob(user_id=user.id)
+    db.session.add(job)
+    db.session.info['account_purge_queued'] = True
+    return job
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_purger(session):
+    if session.info.pop('account_purge_queued', False):
+        purger.notify()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_purge(session):
+    session.info.pop('account_purge_queued', None)
+
+
+class AccountPurger:
+    """Background worker that purges tombstoned accounts chunk by chunk"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.chunks = 0
+        self.completed = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ACCOUNT_PURGE_ENABLED', True)
+        app.config.setdefault('ACCOUNT_PURGE_BATCH_SIZE', 500)
+        # Pause between chunks so requests can take the write lock in between
+        app.config.setdefault('ACCOUNT_PURGE_PAUSE', 0.05)
+        app.config.setdefault('ACCOUNT_PURGE_POLL_INTERVAL', 30)
+        app.config.setdefault('ACCOUNT_PURGE_LEASE_SECONDS', 120)
+        app.config.setdefault('ACCOUNT_PURGE_MAX_ATTEMPTS', 5)
+        # Seconds before the first retry of a failed job, doubled on every further failure
+        app.config.setdefault('ACCOUNT_PURGE_BACKOFF_BASE', 30)
+        app.config.setdefault('ACCOUNT_PURGE_BACKOFF_MAX', 3600)
+
+        self.app = app
+        app.extensions['account_purger'] = self
+
+        # Start lazily on the first request, like the mail outbox
+        @app.before_request
+        def start_account_purger():
+            if self._thread is None and app.config['ACCOUNT_PURGE_ENABLED']:
+                self.start()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="account-purger", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def notify(self):
+        self._wakeup.set()
+
+    def stats(self):
+        counts = dict(db.session.execute(
+            select(AccountDeletionJob.status, func.count(AccountDeletionJob.id)).group_by(AccountDeletionJob.status)
+        ).all())
+        return {"jobs": counts, "chunks": self.chunks, "completed": self.completed}
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    worked = self.run_once()
+            except Exception:
+                self.app.logger.exception("Account purge worker error")
+                worked = False
+
+            if not worked:
+                self._wakeup.wait(self.app.config['ACCOUNT_PURGE_POLL_INTERVAL'])
+                self._wakeup.clear()
+
+    def run_once(self):
+        """Claim one job and purge it to the end; return False if there was nothing to do"""
+        job = self._claim()
+        if job is None:
+            return False
+
+        # Kept aside: the job's own attribute reloads whatever token is stored now
+        token = job.claim_token
+        pause = current_app.config['ACCOUNT_PURGE_PAUSE']
+        try:
+            while not self._stopping.is_set() and self.purge_chunk(job, token):
+                time.sleep(pause)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.warning("Account purge of user %s failed: %s", job.user_id, e)
+            self._reschedule(job, e)
+            db.session.commit()
+        return True
+
+    def _reschedule(self, job, error):
+        """Retry later with exponential backoff and jitter, or give up"""
+        config = current_app.config
+        job.attempts += 1
+        job.last_error = str(error)[:255]
+        job.claim_token = None
+        if job.attempts >= config['ACCOUNT_PURGE_MAX_ATTEMPTS']:
+            job.status = 'failed'
+            return
+        delay = min(config['ACCOUNT_PURGE_BACKOFF_MAX'], config['ACCOUNT_PURGE_BACKOFF_BASE'] * 2 ** (job.attempts - 1))
+        job.status = 'pending'
+        job.next_attempt_at = utcnow() + timedelta(seconds=random.uniform(delay / 2, delay))
+
+    def _claim(self):
+        """Atomically take a pending job that is due, or one whose worker stopped renewing its lease"""
+        now = utcnow()
+        token = uuid.uuid4().hex
+        lease = timedelta(seconds=current_app.config['ACCOUNT_PURGE_LEASE_SECONDS'])
+        due = select(AccountDeletionJob.id).where(
+            or_(
+                and_(AccountDeletionJob.status == 'pending',
+                     or_(AccountDeletionJob.next_attempt_at.is_(None), AccountDeletionJob.next_attempt_at <= now)),
+                and_(AccountDeletionJob.status == 'running', AccountDeletionJob.claimed_at < now - lease),
+            )
+        ).order_by(AccountDeletionJob.id).limit(1)
+
+        db.session.execute(
+            update(AccountDeletionJob)
+            .where(AccountDeletionJob.id.in_(due.scalar_subquery()))
+            .values(status='running', claim_token=token, claimed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return AccountDeletionJob.query.filter_by(claim_token=token).first()
+
+    def purge_chunk(self, job, token):
+        """
+        Delete one bounded chunk of the account in its own transaction, for the
+        worker holding the claim `token`; False once the job is done or lost
+        """
+        batch_size = current_app.config['ACCOUNT_PURGE_BATCH_SIZE']
+        pet_ids = select(Pet.id).where(Pet.user_id == job.user_id)
+        self.chunks += 1
+
+        if job.rows_total is None:
+            job.phase = 'counting'
+            job.pets_total = db.session.scalar(select(func.count()).select_from(pet_ids.subquery()))
+            job.rows_total = sum(
+                db.session.scalar(select(func.count(model.id)).where(model.pet_id.in_(pet_ids)))
+                for model in PET_CHILD_MODELS
+            )
+            return self._commit_chunk(job, token)
+
+        # Child rows first, one table and one chunk at a time
+        for model in PET_CHILD_MODELS:
+            ids = db.session.scalars(select(model.id).where(model.pet_id.in_(pet_ids)).limit(batch_size)).all()
+            if not ids:
+                continue
+            if model is Photo:
+                files = db.session.scalars(select(Photo.image_url).where(Photo.id.in_(ids))).all()
+                self._release_files(job, files)
+            db.session.execute(delete(model).where(model.id.in_(ids)))
+            job.phase = model.__tablename__
+            job.rows_deleted += len(ids)
+            return self._commit_chunk(job, token)
+
+        # Then the pets themselves
+        pets = db.session.execute(select(Pet.id, Pet.pet_profile_photo).where(Pet.user_id == job.user_id)
+                                  .limit(batch_size)).all()
+        if pets:
+            ids = [pet_id for pet_id, _ in pets]
+            self._release_files(job, [profile_photo for _, profile_photo in pets])
+            db.session.execute(delete(Pet).where(Pet.id.in_(ids)))
+            mark_weight_changed(db.session, ids)
+            mark_pets_changed(db.session, (job.user_id,))
+            job.phase = 'pets'
+            job.pets_deleted += len(ids)
+            return self._commit_chunk(job, token)
+
+        # Finally the tombstoned user
+        db.session.execute(delete(User).where(User.id == job.user_id, User.deleted_at.isnot(None)))
+        mark_pets_changed(db.session, (job.user_id,))
+        if not self._still_claimed(job, token):
+            return False
+        job.phase = None
+        job.status = 'done'
+        job.claim_token = None
+        job.finished_at = utcnow()
+        db.session.commit()
+        self.completed += 1
+        return False
+
+    def _commit_chunk(self, job, token):
+        """Commit the chunk if the job is still ours; returns whether it was"""
+        if not self._still_claimed(job, token):
+            return False
+        db.session.commit()
+        return True
+
+    def _still_claimed(self, job, token):
+        """
+        Renew the job's lease in the chunk's transaction, or roll the chunk back
+        if the lease expired and another worker has claimed the job since
+        """
+        renewed = db.session.execute(
+            update(AccountDeletionJob)
+            .where(AccountDeletionJob.id == job.id, AccountDeletionJob.claim_token == token)
+            .values(claimed_at=utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not renewed:
+            db.session.rollback()
+            current_app.logger.warning("Account purge of user %s was taken over by another worker", job.user_id)
+        return bool(renewed)
+
+    @staticmethod
+    def _release_files(job, names):
+        names = [name for name in names if name]
+        release_uploads(db.session, names)
+        job.files_queued += len(names)
+
+
+purger = AccountPurger()
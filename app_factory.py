@@ -3,14 +3,32 @@ from flask import Flask
 from dotenv import load_dotenv
 from flask_mail import Mail
 
-from extensions import db, migrate, session as session_ext, csrf
+from extensions import db, migrate, csrf
+from mail_outbox import dispatcher as mail_dispatcher
+from graph_cache import weight_graph_cache
+from chart_pool import chart_pool
+from pet_cache import pet_list_cache
+from breed_catalog import breed_catalog
+from file_cleanup import file_cleaner
+from thumbnails import thumbnails
+from upload_store import UploadRequest
+from cache_policy import cache_policies
+from page_versions import page_versions
+from session_store import session_store
+from sqlite_profile import sqlite_profile
+from password_pool import password_pool
+from rate_limit import rate_limiter
+from account_deletion import purger as account_purger
+from bootstrap import bootstrap_command
 from routes.__init__ import register_routes
 
-def init_app():
-    """Initialize the Flask application and configurations."""
+def init_app(test_config=None):
+    """Initialize the Flask application and configurations, `test_config` overriding them in tests."""
     # Configure application
     load_dotenv() #Load variables from .env
     app = Flask(__name__)
+    # Uploaded files are hashed and written to disk while the request body is parsed
+    app.request_class = UploadRequest
     app.secret_key = os.getenv("SECRET_KEY")
 
     # Verify if secret key is correctly loaded
@@ -27,14 +45,36 @@ def init_app():
     # Configurations
     app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///petpal.db"
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-    app.config["SESSION_PERMANENT"] = False
-    app.config["SESSION_TYPE"] = "filesystem"
+    if test_config is not None:
+        app.config.update(test_config)
 
     # Initialize extensions
     db.init_app(app)
+    # WAL, pragmas and BEGIN IMMEDIATE with busy retries for several writing processes
+    app.config['SQLITE_PROFILE_ENABLED'] = os.getenv('SQLITE_PROFILE_ENABLED', 'True').lower() in ('true', '1', 't')
+    sqlite_profile.init_app(app)
     migrate.init_app(app, db)
-    session_ext.init_app(app)
+    # `flask bootstrap`: migrate or clone the template database, then seed species and breeds
+    app.cli.add_command(bootstrap_command)
+    # Server-side sessions in their own SQLite file, written only when they change
+    session_store.init_app(app)
     csrf.init_app(app)
+    weight_graph_cache.init_app(app)
+    pet_list_cache.init_app(app)
+    breed_catalog.init_app(app)
+    file_cleaner.init_app(app)
+    app.config['THUMBNAIL_WORKERS'] = int(os.getenv('THUMBNAIL_WORKERS', 1))
+    thumbnails.init_app(app)
+    app.config['CHART_ENGINE'] = os.getenv('CHART_ENGINE', 'svg')
+    chart_pool.init_app(app)
+    # Password hashes and checks run in their own processes, off the web workers
+    app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    app.config['PASSWORD_POOL_SIZE'] = int(os.getenv('PASSWORD_POOL_SIZE', 2))
+    password_pool.init_app(app)
+    # Token buckets per IP and email in front of login, registration and password reset
+    app.config['RATE_LIMIT_ENABLED'] = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() in ('true', '1', 't')
+    rate_limiter.init_app(app)
+    app.config['WEIGHT_GRAPH_MAX_POINTS'] = int(os.getenv('WEIGHT_GRAPH_MAX_POINTS', 1000))
 
     # Configure Flask-Mail: ALL settings are pulled from environment variables (your .env file)
     app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER')
@@ -50,16 +90,25 @@ def init_app():
     app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER')
     mail = Mail(app)
 
+    # Outbox dispatcher: emails are queued in the database and sent by background workers
+    app.config['OUTBOX_ENABLED'] = os.getenv('OUTBOX_ENABLED', 'True').lower() in ('true', '1', 't')
+    app.config['OUTBOX_WORKERS'] = int(os.getenv('OUTBOX_WORKERS', 2))
+    mail_dispatcher.init_app(app)
+
+    # Account purge: deleted accounts are removed in small background chunks
+    app.config['ACCOUNT_PURGE_ENABLED'] = os.getenv('ACCOUNT_PURGE_ENABLED', 'True').lower() in ('true', '1', 't')
+    account_purger.init_app(app)
+
+    # /ops/stats answers only requests sending this bearer token, and is off without it
+    app.config['OPS_STATS_TOKEN'] = os.getenv('OPS_STATS_TOKEN')
+
     # Register blueprints inside app context
     with app.app_context():
         register_routes(app)  # Register all blueprints from routes/__init__.py
 
-    @app.after_request
-    def after_request(response):
-        """Ensure responses aren't cached"""
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Expires"] = 0
-        response.headers["Pragma"] = "no-cache"
-        return response
+    # Cache-Control per endpoint and path: private/no-store HTML, immutable fingerprinted assets
+    cache_policies.init_app(app)
+    # ETags of the pet pages, from the pet and user version counters
+    page_versions.init_app(app)
 
     return app
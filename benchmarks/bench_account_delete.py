@@ -0,0 +1,132 @@
+"""
+Benchmark: deleting an account row by row vs with set-based DELETE statements.
+
+Builds a throwaway SQLite database and upload folder for a "shelter" account
+with 200 pets, thousands of tracker rows, photos (with real files) and logs, and
+times the request-side work of deleting it:
+  - "row by row": previous delete_pet_from_db, every row loaded and deleted
+                  through the session, files unlinked before the commit
+  - "set-based":  helpers.delete_pets_from_db, DELETE ... WHERE pet_id IN (...),
+                  files unlinked by the background cleaner after the commit
+
+Run from the project root:
+    python -m benchmarks.bench_account_delete [tracker_rows]
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from flask import Flask
+from sqlalchemy import delete, select
+
+from extensions import db
+from file_cleanup import file_cleaner
+from helpers import delete_pets_from_db
+from models import Pet, User
+
+PETS = 200
+PHOTOS = 2000
+LOGS = 2000
+
+
+def populate(path, upload_folder, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO users (id, username, email, pw_hash) VALUES (1, 'shelter', 'shelter@petpal.test', 'x')")
+    conn.execute("INSERT INTO species (id, name) VALUES (1, 'dog')")
+    conn.executemany(
+        "INSERT INTO pets (id, user_id, name, sex, species_id, sterilized) VALUES (?, 1, ?, 'M', 1, 0)",
+        ((pet_id, f"pet {pet_id}") for pet_id in range(1, PETS + 1)),
+    )
+    start = date(2015, 1, 1)
+    conn.executemany(
+        "INSERT INTO weight_tracker (pet_id, weight_in_kg, date) VALUES (?, 10, ?)",
+        ((i % PETS + 1, (start + timedelta(days=i // PETS)).isoformat()) for i in range(rows)),
+    )
+    conn.executemany(
+        "INSERT INTO vaccine_tracker (pet_id, vaccine_name, date) VALUES (?, 'rabies', ?)",
+        ((i % PETS + 1, (start + timedelta(days=i // PETS)).isoformat()) for i in range(rows // 4)),
+    )
+    conn.executemany(
+        "INSERT INTO photos (pet_id, image_url, date_uploaded) VALUES (?, ?, '2020-01-01')",
+        ((i % PETS + 1, f"photo_{i}.jpg") for i in range(PHOTOS)),
+    )
+    conn.executemany(
+        "INSERT INTO logs (pet_id, content, date_uploaded) VALUES (?, 'x', '2020-01-01')",
+        ((i % PETS + 1,) for i in range(LOGS)),
+    )
+    conn.commit()
+    conn.close()
+    for i in range(PHOTOS):
+        with open(os.path.join(upload_folder, f"photo_{i}.jpg"), 'wb') as photo:
+            photo.write(b'\0' * 1024)
+
+
+def delete_row_by_row(app):
+    """The previous helpers.delete_pet_from_db, applied to every pet of the user"""
+    for pet in Pet.query.filter_by(user_id=1).all():
+        for photo in pet.photos:
+            photo_path = os.path.join(app.config['UPLOAD_FOLDER'], photo.image_url)
+            if os.path.exists(photo_path):
+                os.remove(photo_path)
+            db.session.delete(photo)
+        for rows in (pet.logs, pet.weight_tracks, pet.vaccines, pet.internal_deworm,
+                     pet.external_deworm, pet.medications):
+            for row in rows:
+                db.session.delete(row)
+        db.session.delete(pet)
+    db.session.commit()
+    db.session.delete(db.session.get(User, 1))
+    db.session.commit()
+
+
+def delete_set_based(app):
+    pet_ids = db.session.scalars(select(Pet.id).where(Pet.user_id == 1)).all()
+    delete_pets_from_db(pet_ids, db)
+    db.session.execute(delete(User).where(User.id == 1))
+    db.session.commit()
+
+
+def run(rows, strategy):
+    workdir = tempfile.mkdtemp()
+    upload_folder = os.path.join(workdir, 'uploads')
+    os.makedirs(upload_folder)
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+                      UPLOAD_FOLDER=upload_folder)
+    db.init_app(app)
+    file_cleaner.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        populate(os.path.join(workdir, 'bench.db'), upload_folder, rows)
+        started = time.perf_counter()
+        strategy(app)
+        elapsed = (time.perf_counter() - started) * 1000
+        file_cleaner.join()
+        left = len(os.listdir(upload_folder))
+        db.session.remove()
+        db.engine.dispose()
+    shutil.rmtree(workdir)
+    return elapsed, left
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    print(f"Deleting an account with {PETS} pets, {rows:,} weight rows, {rows // 4:,} vaccines, "
+          f"{PHOTOS:,} photos and {LOGS:,} logs")
+    results = {name: run(rows, strategy) for name, strategy in
+               (("row by row", delete_row_by_row), ("set-based", delete_set_based))}
+
+    print(f"{'strategy':<14}{'request ms':>12}{'files left':>12}")
+    for name, (elapsed, left) in results.items():
+        print(f"{name:<14}{elapsed:>12.1f}{left:>12}")
+    print(f"speedup: {results['row by row'][0] / results['set-based'][0]:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
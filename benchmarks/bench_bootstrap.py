@@ -0,0 +1,123 @@
+"""
+Benchmark: bootstrapping an empty database.
+
+Times, on temporary database files:
+  - "migrate":    every migration replayed on an empty database (the initial one
+                  seeds the catalog)
+  - "clone":      the migrated database copied with the backup API, what
+                  `flask bootstrap` does once the template exists
+and seeding the catalog of `breeds.py` into empty species and breeds tables:
+  - "row by row": one INSERT per species (with RETURNING id) and per breed, as
+                  the initial migration did
+  - "upsert":     bootstrap.seed_catalog(), two executemany upserts
+  - "re-run":     seed_catalog() again on the seeded tables (nothing to add)
+Each case runs in its own transaction, with the app's SQLite profile.
+
+Run from the project root:
+    python -m benchmarks.bench_bootstrap [repeats]
+"""
+
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from flask import Flask
+from flask_migrate import Migrate, upgrade
+from sqlalchemy import create_engine, text
+
+from bootstrap import clone_database, seed_catalog
+from breeds import breeds
+from extensions import db
+from sqlite_profile import SqliteProfile
+
+CATALOG_TABLES = """
+    CREATE TABLE species (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL UNIQUE);
+    CREATE TABLE breeds (
+        id INTEGER PRIMARY KEY, species_id INTEGER NOT NULL REFERENCES species (id), name VARCHAR(100) NOT NULL
+    );
+    CREATE UNIQUE INDEX ix_breeds_species_id_name ON breeds (species_id, name);
+"""
+
+
+def make_engine(path):
+    engine = create_engine(f"sqlite:///{path}")
+    SqliteProfile().configure(engine)
+    return engine
+
+
+def migrate(path):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{path}"
+    # Read by the upload migration, which has no files to move here
+    app.config["UPLOAD_FOLDER"] = os.path.dirname(path)
+    db.init_app(app)
+    Migrate(app, db)
+    with app.app_context():
+        SqliteProfile().configure(db.engine)
+        started = time.perf_counter()
+        upgrade()
+        elapsed = time.perf_counter() - started
+        db.engine.dispose()
+    return elapsed
+
+
+def seed_row_by_row(connection):
+    for species, breed_list in breeds.items():
+        species_id = connection.execute(text("INSERT INTO species (name) VALUES (:name) RETURNING id"),
+                                        {"name": species}).scalar()
+        for breed in breed_list:
+            connection.execute(text("INSERT INTO breeds (species_id, name) VALUES (:species_id, :name)"),
+                               {"species_id": species_id, "name": breed})
+
+
+def seed(path, seeders):
+    """Seconds taken by each seeder, run one after the other on the catalog tables"""
+    engine = make_engine(path)
+    with engine.begin() as connection:
+        for statement in CATALOG_TABLES.split(';')[:-1]:
+            connection.exec_driver_sql(statement)
+    timings = []
+    for seeder in seeders:
+        started = time.perf_counter()
+        with engine.begin() as connection:
+            seeder(connection)
+        timings.append(time.perf_counter() - started)
+    engine.dispose()
+    return timings
+
+
+def report(name, timings):
+    print(f"{name:<12}{statistics.mean(timings) * 1000:>10.1f}{min(timings) * 1000:>10.1f}")
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    workdir = tempfile.mkdtemp()
+    template = os.path.join(workdir, "template.db")
+    breed_count = sum(len(breed_list) for breed_list in breeds.values())
+    print(f"{len(breeds)} species, {breed_count} breeds, {repeats} runs per case")
+    print(f"{'case':<12}{'mean ms':>10}{'min ms':>10}")
+
+    migrations = [migrate(os.path.join(workdir, f"migrated-{i}.db")) for i in range(repeats)]
+    shutil.copy(os.path.join(workdir, "migrated-0.db"), template)
+    clones = []
+    for i in range(repeats):
+        started = time.perf_counter()
+        clone_database(template, os.path.join(workdir, f"cloned-{i}.db"))
+        clones.append(time.perf_counter() - started)
+    report("migrate", migrations)
+    report("clone", clones)
+
+    row_by_row = [seed(os.path.join(workdir, f"rows-{i}.db"), [seed_row_by_row])[0] for i in range(repeats)]
+    upserts = [seed(os.path.join(workdir, f"upsert-{i}.db"), [seed_catalog, seed_catalog]) for i in range(repeats)]
+    report("row by row", row_by_row)
+    report("upsert", [first for first, _ in upserts])
+    report("re-run", [again for _, again in upserts])
+    shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark: logins during page views, passwords hashed on the request thread vs.
+in password_pool.PasswordPool.
+
+A threaded server process answers:
+  - /login: checks a password against a stored scrypt hash, with werkzeug's
+    check_password_hash() in the request ("inline") or with PasswordPool.check()
+    ("pool")
+  - /page:  renders a page of 200 rows, like a tracker page
+Login clients send logins back to back (a burst) while page clients load pages.
+Reports logins and pages per second and their p50/p99 latency in ms. Pages are
+the requests of logged-in users that the burst should not stall.
+
+Run from the project root:
+    python -m benchmarks.bench_password_pool [seconds] [pool_size] [login_clients]
+"""
+
+import http.client
+import logging
+import multiprocessing
+import statistics
+import sys
+import threading
+import time
+
+from flask import Flask, render_template_string
+from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.serving import make_server
+
+from password_pool import PasswordPool
+
+PAGE_CLIENTS = 4
+PASSWORD = "correct horse battery staple"
+PAGE = "<table>{% for i in rows %}<tr><td>{{ i }}</td><td>{{ i * 0.5 }} kg</td><td>Note {{ i }}</td></tr>{% endfor %}</table>"
+
+
+def make_app(mode, pool_size):
+    app = Flask(__name__)
+    pw_hash = generate_password_hash(PASSWORD)
+    pool = None
+    if mode == "pool":
+        app.config['PASSWORD_POOL_SIZE'] = pool_size
+        pool = PasswordPool(app)
+
+    @app.route("/login")
+    def login():
+        if pool is None:
+            valid = check_password_hash(pw_hash, PASSWORD)
+        else:
+            valid, _ = pool.check(pw_hash, PASSWORD)
+        return "ok" if valid else ("invalid", 403)
+
+    @app.route("/page")
+    def page():
+        return render_template_string(PAGE, rows=range(200))
+
+    return app, pool
+
+
+def serve(mode, pool_size, ports, stop):
+    app, pool = make_app(mode, pool_size)
+    if pool is not None:
+        # Workers start before the clients do, as in a server that has been up for a while
+        pool.check(generate_password_hash("warm up"), "warm up")
+    # No access log line per request
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ports.put(server.server_port)
+    stop.wait()
+    server.shutdown()
+    if pool is not None:
+        pool.shutdown()
+
+
+def client(port, path, deadline, timings):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        connection.request("GET", path)
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f"{path} answered {response.status}")
+        timings.append((time.perf_counter() - started) * 1000)
+    connection.close()
+
+
+def run(mode, seconds, pool_size, login_clients):
+    context = multiprocessing.get_context("spawn")
+    ports = context.Queue()
+    stop = context.Event()
+    server = context.Process(target=serve, args=(mode, pool_size, ports, stop))
+    server.start()
+    port = ports.get()
+
+    logins, pages = [], []
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=client, args=(port, "/login", deadline, logins)) for _ in range(login_clients)]
+    threads += [threading.Thread(target=client, args=(port, "/page", deadline, pages)) for _ in range(PAGE_CLIENTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    server.join()
+    return logins, pages
+
+
+def summary(timings, seconds):
+    percentiles = statistics.quantiles(timings, n=100)
+    return f"{len(timings) / seconds:>8.1f}{percentiles[49]:>8.1f}{percentiles[98]:>8.1f}"
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 15
+    pool_size = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    login_clients = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+    print(f"{login_clients} login and {PAGE_CLIENTS} page clients, {seconds:g} s per mode, "
+          f"pool of {pool_size}, {multiprocessing.cpu_count()} CPUs")
+    print(f"{'mode':<8}{'logins/s':>8}{'p50':>8}{'p99':>8}{'pages/s':>8}{'p50':>8}{'p99':>8}")
+    for mode in ("inline", "pool"):
+        logins, pages = run(mode, seconds, pool_size, login_clients)
+        print(f"{mode:<8}{summary(logins, seconds)}{summary(pages, seconds)}")
+
+
+if __name__ == "__main__":
+    main()
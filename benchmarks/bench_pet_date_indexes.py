@@ -0,0 +1,147 @@
+"""
+Benchmark: child-table queries with and without the (pet_id, date) indexes.
+
+Builds a throwaway SQLite database with one million weight tracker rows spread
+over 2,000 pets (plus photos and logs), then times the queries behind the
+weight graph, the trackers page and the gallery:
+  - "before": no composite index, month filtered in Python (previous code)
+  - "after":  (pet_id, date) indexes, date range pushed into SQL
+
+Run from the project root:
+    python -m benchmarks.bench_pet_date_indexes [rows]
+"""
+
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import Photo, Log, WeightTracker
+
+PETS = 2000
+QUERIES = 200
+INDEXES = {
+    'weight_tracker': 'ix_weight_tracker_pet_id_date',
+    'photos': 'ix_photos_pet_id_date_uploaded',
+    'logs': 'ix_logs_pet_id_date_uploaded',
+}
+
+
+def populate(path, rows):
+    engine = create_engine(f"sqlite:///{path}")
+    db.metadata.create_all(engine)
+    engine.dispose()
+
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO users (id, username, email, pw_hash) VALUES (1, 'bench', 'bench@petpal.test', 'x')")
+    conn.execute("INSERT INTO species (id, name) VALUES (1, 'dog')")
+    conn.executemany(
+        "INSERT INTO pets (id, user_id, name, sex, species_id, sterilized) VALUES (?, 1, ?, 'M', 1, 0)",
+        ((pet_id, f"pet {pet_id}") for pet_id in range(1, PETS + 1)),
+    )
+    start = date(2015, 1, 1)
+    # Rows arrive interleaved between pets, like real inserts over time
+    conn.executemany(
+        "INSERT INTO weight_tracker (pet_id, weight_in_kg, date) VALUES (?, ?, ?)",
+        ((i % PETS + 1, round(random.uniform(3, 40), 1), (start + timedelta(days=i // PETS)).isoformat())
+         for i in range(rows)),
+    )
+    for table in ('photos', 'logs'):
+        column = 'image_url' if table == 'photos' else 'content'
+        conn.executemany(
+            f"INSERT INTO {table} (pet_id, {column}, date_uploaded) VALUES (?, 'x', ?)",
+            ((i % PETS + 1, (start + timedelta(days=i // PETS)).isoformat()) for i in range(rows // 10)),
+        )
+    conn.commit()
+    conn.close()
+
+
+def timed(fn, pet_ids):
+    timings = []
+    for pet_id in pet_ids:
+        started = time.perf_counter()
+        fn(pet_id)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.mean(timings), statistics.quantiles(timings, n=20)[-1]
+
+
+def run_queries(session, month_in_python):
+    year, month = 2016, 3
+    first, last = date(year, month, 1), date(year, month, 31)
+
+    def weight_month(pet_id):
+        if month_in_python:
+            # Previous monthly_weight_data: every row of the pet, filtered in Python
+            rows = session.scalars(select(WeightTracker).where(WeightTracker.pet_id == pet_id)
+                                   .order_by(WeightTracker.date)).all()
+            return [(r.date, r.weight_in_kg) for r in rows if r.date.year == year and r.date.month == month]
+        return session.execute(select(WeightTracker.date, WeightTracker.weight_in_kg)
+                               .where(WeightTracker.pet_id == pet_id,
+                                      WeightTracker.date >= first, WeightTracker.date <= last)
+                               .order_by(WeightTracker.date, WeightTracker.id)).all()
+
+    def trackers_page(pet_id):
+        return session.scalars(select(WeightTracker).where(WeightTracker.pet_id == pet_id)
+                               .order_by(WeightTracker.date.desc()).limit(50)).all()
+
+    def gallery(pet_id):
+        return session.scalars(select(Photo).where(Photo.pet_id == pet_id)
+                               .order_by(Photo.date_uploaded.desc())).all()
+
+    def logs(pet_id):
+        return session.scalars(select(Log).where(Log.pet_id == pet_id)
+                               .order_by(Log.date_uploaded.desc())).all()
+
+    pet_ids = [random.randint(1, PETS) for _ in range(QUERIES)]
+    results = {}
+    for name, fn in (("weight graph month", weight_month), ("trackers page", trackers_page),
+                     ("gallery", gallery), ("logs", logs)):
+        results[name] = timed(fn, pet_ids)
+        session.expunge_all()
+    return results
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    random.seed(7)
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    print(f"Populating {rows:,} weight rows in {path} ...")
+    populate(path, rows)
+
+    conn = sqlite3.connect(path)
+    for index in INDEXES.values():
+        conn.execute(f"DROP INDEX IF EXISTS {index}")
+    conn.execute("ANALYZE")
+    conn.commit()
+
+    engine = create_engine(f"sqlite:///{path}")
+    with Session(engine) as session:
+        before = run_queries(session, month_in_python=True)
+
+    conn.execute("CREATE INDEX ix_weight_tracker_pet_id_date ON weight_tracker (pet_id, date)")
+    conn.execute("CREATE INDEX ix_photos_pet_id_date_uploaded ON photos (pet_id, date_uploaded)")
+    conn.execute("CREATE INDEX ix_logs_pet_id_date_uploaded ON logs (pet_id, date_uploaded)")
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    engine.dispose()
+
+    with Session(engine) as session:
+        after = run_queries(session, month_in_python=False)
+
+    print(f"{'query':<22}{'before ms':>12}{'p95':>10}{'after ms':>12}{'p95':>10}{'speedup':>10}")
+    for name in before:
+        (b_mean, b_p95), (a_mean, a_p95) = before[name], after[name]
+        print(f"{name:<22}{b_mean:>12.2f}{b_p95:>10.2f}{a_mean:>12.3f}{a_p95:>10.3f}{b_mean / a_mean:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
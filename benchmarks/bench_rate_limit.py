@@ -0,0 +1,98 @@
+"""
+Benchmark: cost of a rate_limit.RateLimiter check, and its limits across processes.
+
+Times one check, in microseconds, for:
+  - "admitted, new key":     the first request of an IP (SELECT + UPSERT in a transaction)
+  - "admitted, same key":    requests of one IP while its bucket has tokens
+  - "rejected, stored":      an empty bucket found in the database (SELECT in a transaction)
+  - "rejected, remembered":  an empty bucket this process already knows about
+Then several worker processes flood one IP and one email with login checks,
+the way a credential-stuffing run would. Each worker has its own limiter on
+the shared database. The flood reports how many requests got through, which
+must not be more than the bucket capacity, and the mean cost of a check.
+
+Run from the project root:
+    python -m benchmarks.bench_rate_limit [workers] [checks_per_worker]
+"""
+
+import multiprocessing
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from flask import Flask
+
+from rate_limit import RateLimiter
+
+CHECKS = 20_000
+# A bucket that never empties, and one that empties after a single request
+BENCH_LIMITS = {'open': {'ip': (10 ** 9, 1)}, 'tight': {'ip': (1, 3600)}}
+
+
+def make_limiter(path, limits=None):
+    app = Flask(__name__)
+    app.secret_key = "bench"
+    app.config.update(RATE_LIMIT_DB_PATH=path, RATE_LIMIT_SWEEP_INTERVAL=3600)
+    if limits is not None:
+        app.config['RATE_LIMITS'] = limits
+    return RateLimiter(app)
+
+
+def per_check(check, keys):
+    started = time.perf_counter()
+    for key in keys:
+        check(key)
+    return (time.perf_counter() - started) / len(keys) * 1e6
+
+
+def flood(path, checks, results):
+    limiter = make_limiter(path)
+    admitted = 0
+    started = time.perf_counter()
+    for _ in range(checks):
+        if limiter.check('login', ip="203.0.113.7", email="victim@petpal.test") is None:
+            admitted += 1
+    results.put((admitted, (time.perf_counter() - started) / checks * 1e6))
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    checks = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "rate_limits.db")
+
+    limiter = make_limiter(path, BENCH_LIMITS)
+    # Stored buckets already emptied, seen by a second process (a fresh limiter)
+    for i in range(CHECKS):
+        limiter.check('tight', ip=f"198.51.{i}")
+    other = make_limiter(path, BENCH_LIMITS)
+    cases = {
+        "admitted, new key": per_check(lambda i: limiter.check('open', ip=f"10.{i}"), range(CHECKS)),
+        "admitted, same key": per_check(lambda i: limiter.check('open', ip="10.0.0.1"), range(CHECKS)),
+        "rejected, stored": per_check(lambda i: other.check('tight', ip=f"198.51.{i}"), range(CHECKS)),
+        "rejected, remembered": per_check(lambda i: other.check('tight', ip=f"198.51.{i % 100}"), range(CHECKS)),
+    }
+    print(f"{'case':<24}{'us/check':>10}")
+    for case, micros in cases.items():
+        print(f"{case:<24}{micros:>10.2f}")
+
+    capacity = make_limiter(path).limits['login', 'email'][0]
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [context.Process(target=flood, args=(path, checks, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    admitted = sum(count for count, _ in outcomes)
+    print(f"flood: {workers} workers x {checks:,} login checks, {admitted} admitted "
+          f"(email bucket of {capacity}), {statistics.mean(micros for _, micros in outcomes):.2f} us/check")
+    shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
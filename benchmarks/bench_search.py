@@ -0,0 +1,198 @@
+"""
+Benchmark: journal search on a one million entry corpus.
+
+Builds a throwaway SQLite database (tables, FTS5 index and triggers from
+`db.create_all()`) with logs and tracker entries spread over 5,000 users with
+four pets each, written through the triggers like the app writes them. Then it
+times searches of random users for common, rare, multi-word and prefix queries,
+and the same searches of one user with 20,000 logs:
+  - "like":      LIKE '%word%' over the user's logs and trackers (no index)
+  - "fts+bm25":  FTS5 MATCH ranked by bm25(), pets filtered from the matches
+  - "fts+in":    one MATCH for all the pets, filtered on `rowid >> 32`, ranked in Python
+  - "fts+range": search.search_entries, a UNION ALL of one rowid range per pet, ranked in Python
+
+Reports mean and p95 latency in ms and checks them against the targets, the
+heavy user's searches against their own.
+
+Run from the project root:
+    python -m benchmarks.bench_search [entries]
+"""
+
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from flask import Flask
+from sqlalchemy import text
+
+from extensions import db
+# Not used by name: importing it defines the tables db.create_all() builds below
+import models  # noqa: F401
+from search import MARK_END, MARK_START, MAX_CANDIDATES, PET_SHIFT, PREFIX_CANDIDATES_SQL, match_expression, search_entries
+
+USERS = 5000
+PETS_PER_USER = 4
+SEARCHES = 200
+# Extra logs of one long-time user, whose searches are timed separately
+HEAVY_USER_LOGS = 20000
+# Latency targets (mean, p95) of search_entries on the full corpus
+TARGET_MS = (10, 25)
+HEAVY_TARGET_MS = (25, 40)
+
+QUERIES = {
+    'common': 'walk',
+    'rare': 'rabies',
+    'two words': 'vet visit',
+    'prefix': 'vacc*',
+}
+COMMON_WORDS = ('walk park food ate slept played ball happy tired water treat morning evening long short '
+                'bath brush grooming nails ears teeth toy sofa garden rain sun cold warm friend dog cat').split()
+RARE_WORDS = 'rabies vet visit vaccination vaccine limping allergy itchy vomiting parasite'.split()
+PRODUCTS = ('Drontal', 'Milbemax', 'Frontline', 'Bravecto', 'Advocate', 'Rabies', 'Parvovirus', 'Leptospirosis')
+
+
+def sentence(rng, words):
+    text_words = rng.choices(COMMON_WORDS, k=words)
+    # A few entries mention the rare words
+    if rng.random() < 0.05:
+        text_words[rng.randrange(words)] = rng.choice(RARE_WORDS)
+    return ' '.join(text_words)
+
+
+def populate(path, entries):
+    rng = random.Random(7)
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO species (id, name) VALUES (1, 'dog')")
+    conn.executemany("INSERT INTO users (id, username, email, pw_hash) VALUES (?, 'bench', ?, 'x')",
+                     ((user_id, f"bench{user_id}@petpal.test") for user_id in range(1, USERS + 1)))
+    pets = USERS * PETS_PER_USER
+    conn.executemany(
+        "INSERT INTO pets (id, user_id, name, sex, species_id, sterilized) VALUES (?, ?, 'pet', 'M', 1, 0)",
+        ((pet_id, (pet_id - 1) // PETS_PER_USER + 1) for pet_id in range(1, pets + 1)),
+    )
+    start = date(2015, 1, 1)
+    logs = entries * 6 // 10
+    conn.executemany(
+        "INSERT INTO logs (pet_id, title, content, date_uploaded) VALUES (?, ?, ?, ?)",
+        ((rng.randint(1, pets), sentence(rng, 3), sentence(rng, 40), (start + timedelta(days=i % 3000)).isoformat())
+         for i in range(logs)),
+    )
+    heavy_pets = range(pets - PETS_PER_USER + 1, pets + 1)
+    conn.executemany(
+        "INSERT INTO logs (pet_id, title, content, date_uploaded) VALUES (?, ?, ?, ?)",
+        ((rng.choice(heavy_pets), sentence(rng, 3), sentence(rng, 40), (start + timedelta(days=i % 3000)).isoformat())
+         for i in range(HEAVY_USER_LOGS)),
+    )
+    trackers = entries - logs - HEAVY_USER_LOGS
+    conn.executemany(
+        "INSERT INTO vaccine_tracker (pet_id, vaccine_name, date, notes) VALUES (?, ?, ?, ?)",
+        ((rng.randint(1, pets), rng.choice(PRODUCTS), (start + timedelta(days=i % 3000)).isoformat(), sentence(rng, 6))
+         for i in range(trackers // 2)),
+    )
+    conn.executemany(
+        "INSERT INTO medication_tracker (pet_id, product_name, date, notes) VALUES (?, ?, ?, ?)",
+        ((rng.randint(1, pets), rng.choice(PRODUCTS), (start + timedelta(days=i % 3000)).isoformat(), sentence(rng, 6))
+         for i in range(trackers - trackers // 2)),
+    )
+    conn.commit()
+    conn.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+
+def search_like(query, pet_ids):
+    pets = ', '.join(str(pet_id) for pet_id in pet_ids)
+    words = query.replace('*', '').split()
+    conditions = ' AND '.join(f"(coalesce(title, '') || ' ' || body) LIKE :w{i}" for i in range(len(words)))
+    params = {f"w{i}": f"%{word}%" for i, word in enumerate(words)}
+    return db.session.execute(text(
+        f"SELECT * FROM ("
+        f"SELECT id, pet_id, title, content AS body FROM logs WHERE pet_id IN ({pets}) "
+        f"UNION ALL SELECT id, pet_id, vaccine_name, notes FROM vaccine_tracker WHERE pet_id IN ({pets}) "
+        f"UNION ALL SELECT id, pet_id, product_name, notes FROM medication_tracker WHERE pet_id IN ({pets})"
+        f") WHERE {conditions} LIMIT 21"
+    ), params).all()
+
+
+def search_bm25(query, pet_ids):
+    # Every match in the index is visited, and bm25() counts each term's documents on every query
+    pets = ', '.join(str(pet_id) for pet_id in pet_ids)
+    return db.session.execute(text(
+        "SELECT rowid, snippet(search_index, 1, :start, :end, '…', 16) FROM search_index "
+        f"WHERE search_index MATCH :words AND (rowid >> {PET_SHIFT}) IN ({pets}) "
+        "ORDER BY bm25(search_index, 4.0, 1.0) LIMIT 21"
+    ), {"words": match_expression(query), "start": MARK_START, "end": MARK_END}).all()
+
+
+def search_in(query, pet_ids):
+    pet_ids = list(pet_ids)
+    return db.session.execute(PREFIX_CANDIDATES_SQL, {
+        "expression": match_expression(query), "candidates": MAX_CANDIDATES * len(pet_ids), "pet_ids": pet_ids,
+        "start": MARK_START, "end": MARK_END,
+    }).all()
+
+
+def search_ranges(query, pet_ids):
+    return search_entries(query, pet_ids, limit=21)
+
+
+def timed(fn, query, users):
+    timings = []
+    for user_id in users:
+        pet_ids = range((user_id - 1) * PETS_PER_USER + 1, user_id * PETS_PER_USER + 1)
+        started = time.perf_counter()
+        fn(query, pet_ids)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.mean(timings), statistics.quantiles(timings, n=20)[-1]
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, 'bench.db')
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{path}")
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        populate(path, entries)
+        print(f"{entries:,} entries over {USERS * PETS_PER_USER:,} pets indexed in {time.perf_counter() - started:.0f} s")
+
+        users = random.Random(1).sample(range(1, USERS + 1), SEARCHES)
+        strategies = (("like", search_like), ("fts+bm25", search_bm25), ("fts+in", search_in),
+                      ("fts+range", search_ranges))
+        print(f"{'query':<20}" + ''.join(f"{name + ' mean':>18}{'p95':>8}" for name, _ in strategies))
+        worst = {"users": (0, 0), "heavy user": (0, 0)}
+        cases = [(label, query, users, "users") for label, query in QUERIES.items()]
+        cases += [(f"{label} (heavy)", query, [USERS] * 20, "heavy user") for label, query in QUERIES.items()]
+        for label, query, searched_users, group in cases:
+            row = f"{label:<20}"
+            for name, fn in strategies:
+                fn(query, range(1, PETS_PER_USER + 1))  # warm the page cache
+                mean, p95 = timed(fn, query, searched_users)
+                row += f"{mean:>18.2f}{p95:>8.2f}"
+                if name == "fts+range":
+                    worst[group] = (max(worst[group][0], mean), max(worst[group][1], p95))
+            print(row)
+        db.session.remove()
+        db.engine.dispose()
+    shutil.rmtree(workdir)
+
+    for group, target in (("users", TARGET_MS), ("heavy user", HEAVY_TARGET_MS)):
+        mean, p95 = worst[group]
+        met = mean <= target[0] and p95 <= target[1]
+        print(f"fts+range {group}: worst mean {mean:.2f} ms, p95 {p95:.2f} ms "
+              f"(target {target[0]} / {target[1]} ms): {'met' if met else 'MISSED'}")
+
+
+if __name__ == "__main__":
+    main()
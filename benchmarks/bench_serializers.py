@@ -0,0 +1,115 @@
+"""
+Benchmark: exporting a user with the models' to_dict() vs the compiled serializers.
+
+Builds a throwaway SQLite database with one user owning 50 pets and thousands of
+photos and logs, then times loading and encoding the whole account as JSON:
+  - "to_dict":     User.to_dict(), lazy loads per pet (N+1 queries), json.dumps
+  - "serializers": USER_EXPORT shape, selectinload plan with photos and logs read
+                   as rows, compiled encoder, iter_json
+
+Run from the project root:
+    python -m benchmarks.bench_serializers [photos_and_logs]
+"""
+
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import User
+from serializers import USER_EXPORT, iter_json
+
+PETS = 50
+RUNS = 20
+
+
+def populate(path, rows):
+    engine = create_engine(f"sqlite:///{path}")
+    db.metadata.create_all(engine)
+    engine.dispose()
+
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO users (id, username, email, pw_hash) VALUES (1, 'bench', 'bench@petpal.test', 'x')")
+    conn.execute("INSERT INTO species (id, name) VALUES (1, 'dog')")
+    conn.execute("INSERT INTO breeds (id, species_id, name) VALUES (1, 1, 'Mixed')")
+    conn.executemany(
+        "INSERT INTO pets (id, user_id, name, birth_date, sex, species_id, breed_id, sterilized) "
+        "VALUES (?, 1, ?, '2018-05-04', 'F', 1, 1, 1)",
+        ((pet_id, f"pet {pet_id}") for pet_id in range(1, PETS + 1)),
+    )
+    start = date(2018, 1, 1)
+    conn.executemany(
+        "INSERT INTO photos (pet_id, image_url, title, date_uploaded) VALUES (?, ?, 'A day at the park', ?)",
+        ((i % PETS + 1, f"photo_{i}.jpg", (start + timedelta(days=i % 2000)).isoformat()) for i in range(rows)),
+    )
+    conn.executemany(
+        "INSERT INTO logs (pet_id, title, content, date_uploaded) VALUES (?, 'Vet visit', ?, ?)",
+        ((i % PETS + 1, "Checkup went well. " * 10, (start + timedelta(days=i % 2000)).isoformat()) for i in range(rows)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def export_to_dict(session):
+    return json.dumps(session.get(User, 1).to_dict())
+
+
+def export_serializers(session):
+    user = session.scalars(select(User).options(*USER_EXPORT.loader_options()).where(User.id == 1)).one()
+    return ''.join(iter_json(USER_EXPORT.encode_many([user])[0]))
+
+
+def measure(engine, export):
+    queries = [0]
+
+    def count(*args):
+        queries[0] += 1
+
+    event.listen(engine, 'before_cursor_execute', count)
+    timings = []
+    for _ in range(RUNS):
+        queries[0] = 0
+        with Session(engine) as session:
+            started = time.perf_counter()
+            output = export(session)
+            timings.append((time.perf_counter() - started) * 1000)
+    event.remove(engine, 'before_cursor_execute', count)
+    return statistics.mean(timings), min(timings), queries[0], output
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    random.seed(7)
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    print(f"Populating {PETS} pets with {rows:,} photos and {rows:,} logs in {path} ...")
+    populate(path, rows)
+    engine = create_engine(f"sqlite:///{path}")
+
+    results = {name: measure(engine, export) for name, export in
+               (("to_dict", export_to_dict), ("serializers", export_serializers))}
+
+    # Both exports must describe exactly the same data (collections are unordered in to_dict)
+    exports = [json.loads(results[name][3]) for name in results]
+    for export in exports:
+        for pet in export["pets"]:
+            pet["photos"].sort(key=lambda photo: photo["id"])
+            pet["logs"].sort(key=lambda log: log["id"])
+    assert exports[0] == exports[1]
+
+    print(f"{'export':<14}{'mean ms':>10}{'best ms':>10}{'queries':>10}{'bytes':>12}")
+    for name, (mean, best, queries, output) in results.items():
+        print(f"{name:<14}{mean:>10.1f}{best:>10.1f}{queries:>10}{len(output.encode()):>12,}")
+    print(f"speedup: {results['to_dict'][0] / results['serializers'][0]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Benchmark: Flask-Session's filesystem backend vs session_store.SessionStore.
+
+Fills each backend with 100,000 stored sessions, then times requests of a
+small app through the test client:
+  - "anonymous":  a visitor without a session, nothing stored
+  - "read":       a stored session read and left unchanged (most page views)
+  - "write":      a stored session changed by the request (a flash message)
+  - "new":        a visitor whose first request stores data (a CSRF token)
+Reports mean and p95 latency in ms, the session files or rows written per
+request, the disk used and how long removing the expired half of
+the sessions takes (the filesystem backend never removes them by itself).
+
+Requires Flask-Session, which the app no longer uses.
+
+Run from the project root:
+    python -m benchmarks.bench_session_store [sessions]
+"""
+
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from cachelib import FileSystemCache
+from flask import Flask, flash, session
+from flask_session import Session
+
+from session_store import SessionStore
+
+REQUESTS = 2000
+
+
+def make_app(backend, workdir):
+    app = Flask(__name__)
+    app.secret_key = "bench"
+    if backend == "filesystem":
+        # As configured before: one file per session, no threshold
+        cache = FileSystemCache(os.path.join(workdir, "flask_session"), threshold=0)
+        app.config.update(SESSION_TYPE="cachelib", SESSION_CACHELIB=cache, SESSION_PERMANENT=False)
+        Session(app)
+    else:
+        app.config.update(SESSION_DB_PATH=os.path.join(workdir, "sessions.db"), SESSION_SWEEP_INTERVAL=0)
+        SessionStore(app)
+
+    @app.route("/anonymous")
+    def anonymous():
+        return str(session.get("user_id"))
+
+    @app.route("/read")
+    def read():
+        return str(session.get("user_id"))
+
+    @app.route("/write")
+    def write():
+        flash("Saved")
+        return str(session.get("user_id"))
+
+    @app.route("/new")
+    def new():
+        session["csrf_token"] = os.urandom(20).hex()
+        return "new"
+
+    return app
+
+
+def fill(app, sessions):
+    """Store `sessions` logged-in sessions through the backend and return their ids"""
+    interface = app.session_interface
+    name = interface.get_cookie_name(app)
+    sids = []
+    for user_id in range(sessions):
+        with app.test_request_context():
+            stored = interface.open_session(app, app.request_class({}))
+            stored["user_id"] = user_id
+            response = app.response_class()
+            interface.save_session(app, stored, response)
+            sids.append(response.headers["Set-Cookie"].split(";")[0][len(name) + 1:])
+    return sids
+
+
+def disk_usage(workdir):
+    """Files and allocated bytes (small files still take a whole block each)"""
+    files = 0
+    size = 0
+    for root, _, names in os.walk(workdir):
+        for name in names:
+            files += 1
+            size += os.stat(os.path.join(root, name)).st_blocks * 512
+    return files, size
+
+
+def writes_since(app, backend, workdir, since):
+    """Session files written, or rows written, refreshed and deleted, since `since`"""
+    if backend == "filesystem":
+        # Every write replaces a file, whose mtime moves
+        return sum(1 for entry in os.scandir(os.path.join(workdir, "flask_session"))
+                   if entry.stat().st_mtime_ns >= since)
+    stats = app.session_interface.stats()
+    return stats["writes"] + stats["refreshes"] + stats["deletes"]
+
+
+def timed(app, path, sids, rng):
+    client = app.test_client()
+    name = app.session_interface.get_cookie_name(app)
+    timings = []
+    for _ in range(REQUESTS):
+        client.delete_cookie(name)
+        if sids is not None:
+            client.set_cookie(name, rng.choice(sids))
+        started = time.perf_counter()
+        client.get(path)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.mean(timings), statistics.quantiles(timings, n=20)[-1]
+
+
+def expire_half(app, backend, workdir):
+    """Time removing half of the sessions as expired, the way each backend can"""
+    if backend == "filesystem":
+        # No sweeper: a cron job has to read the expiry header of every file
+        started = time.perf_counter()
+        for i, entry in enumerate(os.scandir(os.path.join(workdir, "flask_session"))):
+            with open(entry.path, "rb") as f:
+                f.read(4)
+            if i % 2:
+                os.remove(entry.path)
+        return (time.perf_counter() - started) * 1000
+
+    conn = sqlite3.connect(os.path.join(workdir, "sessions.db"))
+    conn.execute("UPDATE sessions SET expires_at = 0 WHERE key IN "
+                 "(SELECT key FROM sessions ORDER BY key LIMIT (SELECT count(*) / 2 FROM sessions))")
+    conn.commit()
+    conn.close()
+    started = time.perf_counter()
+    app.session_interface.sweep()
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"{sessions:,} stored sessions, {REQUESTS:,} requests per case")
+    print(f"{'backend':<12}{'case':<11}{'mean':>8}{'p95':>8}{'writes/req':>12}")
+    for backend in ("filesystem", "sqlite"):
+        workdir = tempfile.mkdtemp()
+        app = make_app(backend, workdir)
+        started = time.perf_counter()
+        sids = fill(app, sessions)
+        filled = time.perf_counter() - started
+        rng = random.Random(3)
+
+        for case, with_session in (("anonymous", False), ("read", True), ("write", True), ("new", False)):
+            since = time.time_ns()
+            before = writes_since(app, backend, workdir, since) if backend == "sqlite" else 0
+            mean, p95 = timed(app, f"/{case}", sids if with_session else None, rng)
+            writes = writes_since(app, backend, workdir, since) - before
+            print(f"{backend:<12}{case:<11}{mean:>8.3f}{p95:>8.3f}{writes / REQUESTS:>12.2f}")
+
+        files, size = disk_usage(workdir)
+        sweep_ms = expire_half(app, backend, workdir)
+        print(f"{backend:<12}filled in {filled:.1f} s, {files:,} files, {size / 1e6:.1f} MB on disk, "
+              f"expired half in {sweep_ms:.0f} ms")
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
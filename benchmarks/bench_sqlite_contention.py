@@ -0,0 +1,160 @@
+"""
+Benchmark: tracker writes from several processes on one SQLite database.
+
+Writer processes add weight entries the way `add_tracker` does (check the pet,
+insert, commit) and delete one of every five. Reader processes load tracker
+pages at the same time. Each mode starts from a fresh database:
+  - "default":  SQLite and pysqlite defaults (rollback journal, fsync per commit)
+  - "wal only": the profile's pragmas, transactions still begun deferred
+  - "profile":  sqlite_profile.SqliteProfile, pragmas + BEGIN IMMEDIATE with
+                jittered busy retries
+Reports committed writes and page reads per second, writes that failed with
+"database is locked" and the p95 write latency. A busy timeout given in ms
+replaces the profile's 5 s in the last two modes; short ones show the writes
+the retries save.
+
+Run from the project root:
+    python -m benchmarks.bench_sqlite_contention [seconds] [busy_timeout_ms]
+"""
+
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+from sqlite_profile import DEFAULT_PRAGMAS, SqliteProfile
+
+WRITERS = 8
+READERS = 4
+PETS = 50
+MODES = ("default", "wal only", "profile")
+
+
+def make_engine(path, mode, busy_timeout=None):
+    engine = create_engine(f"sqlite:///{path}")
+    pragmas = dict(DEFAULT_PRAGMAS)
+    if busy_timeout is not None:
+        pragmas['busy_timeout'] = busy_timeout
+    if mode == "wal only":
+        @event.listens_for(engine, 'connect')
+        def set_pragmas(dbapi_connection, connection_record):
+            for name, value in pragmas.items():
+                dbapi_connection.execute(f"PRAGMA {name} = {value}")
+    elif mode == "profile":
+        profile = SqliteProfile()
+        profile.pragmas = pragmas
+        profile.configure(engine)
+    return engine
+
+
+def writer(path, mode, busy_timeout, seconds, seed, results):
+    engine = make_engine(path, mode, busy_timeout)
+    rng = random.Random(seed)
+    committed = failed = 0
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    with engine.connect() as conn:
+        while time.perf_counter() < deadline:
+            pet_id = rng.randint(1, PETS)
+            started = time.perf_counter()
+            try:
+                conn.execute(text("SELECT id FROM pets WHERE id = :pet_id"), {"pet_id": pet_id}).one()
+                conn.execute(text("INSERT INTO weight_tracker (pet_id, weight_in_kg, date) "
+                                  "VALUES (:pet_id, :kg, date('now'))"), {"pet_id": pet_id, "kg": rng.uniform(2, 40)})
+                if rng.random() < 0.2:
+                    conn.execute(text("DELETE FROM weight_tracker WHERE id = "
+                                      "(SELECT min(id) FROM weight_tracker WHERE pet_id = :pet_id)"), {"pet_id": pet_id})
+                conn.commit()
+                committed += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+            except OperationalError as e:
+                conn.rollback()
+                if 'locked' not in str(e):
+                    raise
+                failed += 1
+    results.put(("writer", committed, failed, latencies))
+
+
+def reader(path, mode, busy_timeout, seconds, seed, results):
+    engine = make_engine(path, mode, busy_timeout)
+    rng = random.Random(seed)
+    reads = failed = 0
+    deadline = time.perf_counter() + seconds
+    with engine.connect() as conn:
+        while time.perf_counter() < deadline:
+            try:
+                conn.execute(text("SELECT * FROM weight_tracker WHERE pet_id = :pet_id ORDER BY date DESC, id DESC "
+                                  "LIMIT 20"), {"pet_id": rng.randint(1, PETS)}).all()
+                conn.execute(text("SELECT count(*) FROM weight_tracker WHERE pet_id = :pet_id"),
+                             {"pet_id": rng.randint(1, PETS)}).scalar()
+                conn.rollback()
+                reads += 1
+            except OperationalError as e:
+                conn.rollback()
+                if 'locked' not in str(e):
+                    raise
+                failed += 1
+    results.put(("reader", reads, failed, []))
+
+
+def create_database(path):
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE pets (id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE weight_tracker (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, pet_id INTEGER NOT NULL,
+            weight_in_kg FLOAT NOT NULL, date DATE NOT NULL, notes TEXT
+        );
+        CREATE INDEX ix_weight_tracker_pet_id_date ON weight_tracker (pet_id, date);
+    """)
+    conn.executemany("INSERT INTO pets (id, name) VALUES (?, 'pet')", ((i,) for i in range(1, PETS + 1)))
+    conn.commit()
+    conn.close()
+
+
+def run(mode, busy_timeout, seconds):
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "contention.db")
+    create_database(path)
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [context.Process(target=writer, args=(path, mode, busy_timeout, seconds, i, results))
+                 for i in range(WRITERS)]
+    processes += [context.Process(target=reader, args=(path, mode, busy_timeout, seconds, 100 + i, results))
+                  for i in range(READERS)]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    shutil.rmtree(workdir)
+
+    writes = sum(done for kind, done, _, _ in outcomes if kind == "writer")
+    write_failures = sum(failed for kind, _, failed, _ in outcomes if kind == "writer")
+    reads = sum(done for kind, done, _, _ in outcomes if kind == "reader")
+    latencies = [latency for *_, process_latencies in outcomes for latency in process_latencies]
+    p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else float('nan')
+    return writes / seconds, reads / seconds, write_failures, p95
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    busy_timeout = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    print(f"{WRITERS} writer and {READERS} reader processes, {seconds:g} s per mode, "
+          f"busy timeout {busy_timeout if busy_timeout is not None else DEFAULT_PRAGMAS['busy_timeout']} ms")
+    print(f"{'mode':<10}{'writes/s':>10}{'reads/s':>10}{'locked':>8}{'write p95 ms':>14}")
+    for mode in MODES:
+        writes, reads, failures, p95 = run(mode, busy_timeout, seconds)
+        print(f"{mode:<10}{writes:>10.0f}{reads:>10.0f}{failures:>8}{p95:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
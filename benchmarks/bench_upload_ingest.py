@@ -0,0 +1,182 @@
+"""
+Benchmark: concurrent photo uploads, spooled and copied vs streamed while parsing.
+
+Starts a threaded local server per strategy and sends multipart uploads of
+random JPEG-looking files from concurrent client processes:
+  - "copy":   previous store_upload, werkzeug spools the body to a temporary
+              file, FileStorage.save copies it, then it is read again to hash it
+  - "stream": upload_store.UploadRequest, chunks are hashed and written once
+              by the I/O pool while the body is parsed
+
+Reports wall time, throughput and the file bytes the server read and wrote
+(/proc/self/io) for concurrent 5 MB uploads, then the peak of Python allocations
+(tracemalloc) while handling single uploads of growing sizes. Clients run in
+separate processes so none of this counts them.
+
+Run from the project root:
+    python -m benchmarks.bench_upload_ingest [uploads] [concurrency]
+"""
+
+import hashlib
+import http.client
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from flask import Flask, request
+from werkzeug.serving import make_server
+
+from upload_store import UploadRequest, content_name, store_upload
+
+FILE_SIZE = 5 * 1024 * 1024
+MEMORY_FILE_SIZES = (1 * 1024 * 1024, 5 * 1024 * 1024, 20 * 1024 * 1024)
+BOUNDARY = 'benchboundary7MA4YWxkTrZu0gW'
+
+
+def store_by_copy(file_storage, upload_folder):
+    """store_upload before uploads were streamed"""
+    fd, temp_path = tempfile.mkstemp(dir=upload_folder, prefix='.upload-')
+    with os.fdopen(fd, 'wb') as temp:
+        file_storage.save(temp)
+    with open(temp_path, 'rb') as temp:
+        digest = hashlib.file_digest(temp, 'sha256').hexdigest()
+    path = os.path.join(upload_folder, content_name(digest, '.jpg'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(temp_path, path)
+    return path
+
+
+def make_app(upload_folder, streaming, peaks):
+    app = Flask(__name__)
+    app.config['UPLOAD_FOLDER'] = upload_folder
+    if streaming:
+        app.request_class = UploadRequest
+    store = store_upload if streaming else store_by_copy
+
+    @app.route('/upload', methods=['POST'])
+    def upload():
+        store(request.files['image'], upload_folder)
+        return 'ok'
+
+    wsgi_app = app.wsgi_app
+
+    def measured(environ, start_response):
+        """Peak allocations of the request, body parsing included (only meaningful one at a time)"""
+        if not tracemalloc.is_tracing():
+            return wsgi_app(environ, start_response)
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        response = wsgi_app(environ, start_response)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        return response
+
+    app.wsgi_app = measured
+    return app
+
+
+def io_counters():
+    """(read, written) bytes of this process, None where /proc is not available"""
+    try:
+        with open('/proc/self/io') as io:
+            counters = dict(line.split(': ') for line in io.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except OSError:
+        return None
+
+
+def send(port, path, index, size):
+    head = (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="image"; filename="photo_{index}.jpg"\r\n'
+            'Content-Type: image/jpeg\r\n\r\n').encode()
+    tail = f'\r\n--{BOUNDARY}--\r\n'.encode()
+    # Every upload gets different bytes so none is deduplicated
+    first = b'\xff\xd8\xff' + index.to_bytes(4, 'big')
+
+    def body():
+        yield head + first
+        with open(path, 'rb') as source:
+            source.seek(len(first))
+            while chunk := source.read(64 * 1024):
+                yield chunk
+        yield tail
+
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('POST', '/upload', body=body(), headers={
+        'Content-Type': f'multipart/form-data; boundary={BOUNDARY}',
+        'Content-Length': str(len(head) + size + len(tail)),
+    })
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    assert response.status == 200, response.status
+
+
+def write_source(folder, size):
+    path = os.path.join(folder, f'photo_{size}.bin')
+    with open(path, 'wb') as photo:
+        photo.write(os.urandom(size))
+    return path
+
+
+def run(streaming, sources, uploads, concurrency):
+    workdir = tempfile.mkdtemp()
+    peaks = []
+    server = make_server('127.0.0.1', 0, make_app(workdir, streaming, peaks), threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    with multiprocessing.get_context('spawn').Pool(concurrency) as clients:
+        # Warm the client processes up before measuring
+        clients.map(abs, range(concurrency))
+        before = io_counters()
+        started = time.perf_counter()
+        clients.starmap(send, [(server.port, sources[FILE_SIZE], index, FILE_SIZE) for index in range(uploads)],
+                        chunksize=1)
+        elapsed = time.perf_counter() - started
+        after = io_counters()
+
+        tracemalloc.start()
+        for index, size in enumerate(MEMORY_FILE_SIZES, start=uploads):
+            # The dev server drains every closed connection with a 10 MB read buffer;
+            # let that finish so it does not count against the next upload
+            time.sleep(0.5)
+            clients.apply(send, (server.port, sources[size], index, size))
+        tracemalloc.stop()
+
+    server.shutdown()
+    stored = sum(len(files) for _, _, files in os.walk(workdir))
+    shutil.rmtree(workdir)
+    assert stored == uploads + len(MEMORY_FILE_SIZES), stored
+    io = (after[0] - before[0], after[1] - before[1]) if before and after else None
+    return elapsed, io, peaks
+
+
+def main():
+    uploads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    folder = tempfile.mkdtemp()
+    sources = {size: write_source(folder, size) for size in {FILE_SIZE, *MEMORY_FILE_SIZES}}
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    print(f"{uploads} uploads of {FILE_SIZE // 2**20} MB from {concurrency} concurrent clients")
+
+    results = {name: run(streaming, sources, uploads, concurrency)
+               for name, streaming in (("copy", False), ("stream", True))}
+    shutil.rmtree(folder)
+
+    total_mb = uploads * FILE_SIZE / 2**20
+    peak_headers = ''.join(f"{f'peak KB {size // 2**20}MB':>15}" for size in MEMORY_FILE_SIZES)
+    print(f"{'strategy':<10}{'seconds':>9}{'MB/s':>8}{'read MB':>9}{'written MB':>12}{peak_headers}")
+    for name, (elapsed, io, peaks) in results.items():
+        read, written = (f"{io[0] / 2**20:.0f}", f"{io[1] / 2**20:.0f}") if io else ('-', '-')
+        peak_columns = ''.join(f"{peak / 1024:>15.0f}" for peak in peaks)
+        print(f"{name:<10}{elapsed:>9.2f}{total_mb / elapsed:>8.0f}{read:>9}{written:>12}{peak_columns}")
+    print(f"speedup: {results['copy'][0] / results['stream'][0]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
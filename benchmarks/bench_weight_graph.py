@@ -0,0 +1,101 @@
+"""
+Benchmark: render time and output size of the weight graph.
+
+Compares the NumPy SVG engine (svg_chart.py) used on the request path with the
+previous matplotlib implementation, on a month of daily weigh-ins.
+
+Run from the project root:
+    python -m benchmarks.bench_weight_graph
+"""
+
+import calendar
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import matplotlib
+matplotlib.use('Agg')  # Backend without graphic interface to avoid sockets conflict
+import matplotlib.dates as mdates
+import matplotlib.pyplot as plt
+
+from helpers import create_weight_graph
+
+ROUNDS = 200
+
+
+def create_weight_graph_matplotlib(dates, weights, title, xlabel, ylabel, color, show_days_only=False):
+    """Previous matplotlib implementation of helpers.create_weight_graph, kept for comparison."""
+    # Asked ChatGPT for help to create graphs using matplotlib
+    fig, ax = plt.subplots(figsize=(10, 5))  # Set figure size
+
+    # Filter out None values for plotting the line
+    valid_dates = [date for date, weight in zip(dates, weights) if weight is not None]
+    valid_weights = [weight for weight in weights if weight is not None]
+
+    # Plot only valid points with lines connecting them
+    ax.plot(valid_dates, valid_weights, marker='o', color=color)  # Connect only valid points
+
+    # Set all days of the month on the x-axis
+    ax.set(xlabel=xlabel, ylabel=ylabel, title=title)
+    if show_days_only:
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%d'))  # Show only day numbers
+        ax.set_xticks(dates)  # Set ticks for all days in the month
+        plt.xticks(rotation=45)  # Rotate for readability
+
+    ax.grid()
+
+    # Save plot to a BytesIO buffer as SVG
+    img = BytesIO()
+    fig.savefig(img, format='svg')  # Save as SVG for responsiveness
+    img.seek(0)
+    # pyplot keeps every figure until it is closed
+    plt.close(fig)
+
+    return img.getvalue().decode('utf-8')  # Return SVG content as string
+
+
+def month_of_data(year=2025, month=3, fill=0.8):
+    """All days of a month with a weight on roughly `fill` of them"""
+    first_day = datetime(year, month, 1)
+    all_days = [first_day + timedelta(days=i) for i in range(calendar.monthrange(year, month)[1])]
+    weight = 12.0
+    weights = []
+    for _ in all_days:
+        weight += random.uniform(-0.2, 0.2)
+        weights.append(round(weight, 2) if random.random() < fill else None)
+    return all_days, weights
+
+
+def bench(render, dates, weights, rounds):
+    timings = []
+    svg = ""
+    for _ in range(rounds):
+        started = time.perf_counter()
+        svg = render(
+            dates=dates, weights=weights, title="Pet's Weight for March 2025",
+            xlabel='Day', ylabel='Weight (kg)', color='g', show_days_only=True,
+        )
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings, len(svg.encode())
+
+
+def main():
+    random.seed(42)
+    dates, weights = month_of_data()
+    # Warm up imports and caches so the first round does not skew the numbers
+    create_weight_graph_matplotlib(dates, weights, "warmup", "x", "y", "g", True)
+
+    print(f"{'engine':<12}{'mean ms':>10}{'p95 ms':>10}{'bytes':>10}")
+    for name, render, rounds in (
+        ("svg_chart", create_weight_graph, ROUNDS),
+        ("matplotlib", create_weight_graph_matplotlib, ROUNDS // 10),
+    ):
+        timings, size = bench(render, dates, weights, rounds)
+        p95 = statistics.quantiles(timings, n=20)[-1]
+        print(f"{name:<12}{statistics.mean(timings):>10.2f}{p95:>10.2f}{size:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Soak test: render thousands of weight graphs through the chart process pool and
+check that memory stays flat, both in the web process and in the workers.
+
+Run from the project root (Linux, reads /proc):
+    python -m benchmarks.soak_chart_pool [svg|matplotlib] [renders]
+"""
+
+import sys
+import time
+
+from chart_pool import ChartPool, current_rss
+from benchmarks.bench_weight_graph import month_of_data
+
+MB = 1024 * 1024
+
+
+def process_rss(pid):
+    with open(f'/proc/{pid}/statm') as statm:
+        return int(statm.read().split()[1]) * 4096
+
+
+def main():
+    engine = sys.argv[1] if len(sys.argv) > 1 else 'svg'
+    renders = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    pool = ChartPool()
+    pool.engine = engine
+    pool.start_method = 'forkserver'
+    pool.max_tasks = 250
+    pool.max_rss = 200 * MB
+
+    dates, weights = month_of_data()
+    task = dict(dates=dates, weights=weights, title="Soak", xlabel='Day', ylabel='Weight (kg)',
+                color='g', show_days_only=True)
+
+    # Warm up so imports and the first workers are not counted as growth
+    for _ in range(50):
+        pool.render(**task)
+    baseline = current_rss()
+
+    started = time.perf_counter()
+    worker_peak = 0
+    for i in range(1, renders + 1):
+        pool.render(**task)
+        if i % 500 == 0:
+            workers = [process_rss(w.process.pid) for w in list(pool._idle)]
+            worker_peak = max([worker_peak] + workers)
+            print(f"{i:>6} renders  parent {current_rss() / MB:7.1f} MB  "
+                  f"workers {', '.join(f'{rss / MB:.1f}' for rss in workers)} MB")
+    elapsed = time.perf_counter() - started
+    growth = current_rss() - baseline
+    pool.shutdown()
+
+    print(f"{renders} renders in {elapsed:.1f}s ({renders / elapsed:.0f}/s), stats: {pool.stats()}")
+    print(f"parent growth {growth / MB:.2f} MB, worker peak {worker_peak / MB:.1f} MB")
+    assert growth < 10 * MB, "web process memory grew while rendering"
+    assert worker_peak < pool.max_rss + 50 * MB, "a worker went well over its RSS cap"
+
+
+if __name__ == "__main__":
+    main()
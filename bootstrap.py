@@ -0,0 +1,174 @@
+"""
+Database bootstrap: schema, species and breeds in one `flask bootstrap` command.
+
+The command brings the database to the latest migration, then seeds the catalog
+of `breeds.py` with two `executemany` upserts (species, then breeds) that skip
+the rows already there. It can be re-run at any time, and seeds the breeds
+added to `breeds.py` later.
+
+Migrating an empty database replays every migration. The first bootstrap of an
+empty database saves the result as a template named after the migration head
+(`instance/bootstrap-<revision>.db`). Later fresh databases (a new checkout, a
+reset with `--fresh`, tests calling `clone_template()`) are copied from it with
+SQLite's online backup API. A new migration changes the head, so an outdated
+template is never used.
+
+Databases made with `db.create_all()` before the migrations existed have no
+`alembic_version` table. When their tables are those of the first migration
+(`BASELINE_REVISION`), they are stamped with it and upgraded from there, data
+included.
+
+Upserts as in:
+https://www.sqlite.org/lang_upsert.html
+Online backup API as in:
+https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection.backup
+"""
+
+import glob
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+import click
+from alembic.script import ScriptDirectory
+from flask import current_app
+from flask_migrate import stamp, upgrade
+from sqlalchemy import text
+
+from breeds import breeds
+from extensions import db
+
+INSERT_SPECIES_SQL = text("INSERT INTO species (name) VALUES (:name) ON CONFLICT (name) DO NOTHING")
+# Needs the unique (species_id, name) index
+INSERT_BREEDS_SQL = text(
+    "INSERT INTO breeds (species_id, name) VALUES (:species_id, :name) ON CONFLICT (species_id, name) DO NOTHING"
+)
+
+# First migration, and the tables and columns it creates (the models of the db.create_all() days)
+BASELINE_REVISION = '701e5dd452d4'
+BASELINE_TABLES = {
+    'users': {'id', 'username', 'email', 'pw_hash'},
+    'species': {'id', 'name'},
+    'breeds': {'id', 'species_id', 'name'},
+    'pets': {'id', 'user_id', 'pet_profile_photo', 'name', 'birth_date', 'adoption_date', 'sex', 'species_id',
+             'breed_id', 'sterilized', 'microchip_number', 'insurance_company', 'insurance_number'},
+    'photos': {'id', 'pet_id', 'image_url', 'title', 'date_uploaded'},
+    'logs': {'id', 'pet_id', 'title', 'date_uploaded', 'content'},
+    'weight_tracker': {'id', 'pet_id', 'weight_in_kg', 'date', 'notes'},
+    'vaccine_tracker': {'id', 'pet_id', 'vaccine_name', 'date', 'next_dosis', 'administered_by', 'notes'},
+    'internal_deworming_tracker': {'id', 'pet_id', 'product_name', 'date', 'next_dosis', 'notes'},
+    'external_deworming_tracker': {'id', 'pet_id', 'product_name', 'date', 'next_dosis', 'notes'},
+    'medication_tracker': {'id', 'pet_id', 'product_name', 'date', 'next_dosis', 'notes'},
+}
+
+
+def seed_catalog(connection, catalog=None):
+    """Insert the missing species and breeds of `catalog`, returns how many of each were added"""
+    catalog = breeds if catalog is None else catalog
+    added_species = connection.execute(INSERT_SPECIES_SQL, [{"name": species} for species in catalog]).rowcount
+    species_ids = dict(connection.execute(text("SELECT name, id FROM species")).all())
+    rows = [{"species_id": species_ids[species], "name": breed}
+            for species, breed_list in catalog.items() for breed in breed_list]
+    added_breeds = connection.execute(INSERT_BREEDS_SQL, rows).rowcount if rows else 0
+    return added_species, added_breeds
+
+
+def clone_database(source, target):
+    """Copy the SQLite database at `source` over `target` with the backup API"""
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    with closing(sqlite3.connect(source)) as source_db, closing(sqlite3.connect(target)) as target_db:
+        # All pages in one step: the template is small and nothing else writes to it
+        source_db.backup(target_db)
+
+
+def head_revision():
+    """Latest revision of the migration scripts"""
+    config = current_app.extensions['migrate'].migrate.get_config()
+    return ScriptDirectory.from_config(config).get_current_head()
+
+
+def template_path():
+    """Template database for the current migration head"""
+    return os.path.join(current_app.instance_path, f"bootstrap-{head_revision()}.db")
+
+
+def clone_template(target):
+    """Copy the current template to `target`, False when there is no template yet"""
+    template = template_path()
+    if not os.path.exists(template):
+        return False
+    clone_database(template, target)
+    return True
+
+
+def database_path():
+    return db.engine.url.database
+
+
+def _table_names(path):
+    if not os.path.exists(path):
+        return set()
+    with closing(sqlite3.connect(path)) as connection:
+        return {name for name, in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def _table_columns(path):
+    with closing(sqlite3.connect(path)) as connection:
+        tables = [name for name, in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+        return {table: {row[1] for row in connection.execute(f'PRAGMA table_info("{table}")')} for table in tables}
+
+
+def _remove_database(path):
+    # Journal files of the old database would be replayed into the new one
+    for name in (path, f"{path}-wal", f"{path}-shm", f"{path}-journal"):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+@click.command('bootstrap')
+@click.option('--fresh', is_flag=True, help="Replace the database with an empty one first (deletes all data).")
+@click.option('--no-template', is_flag=True, help="Migrate from scratch instead of cloning the template.")
+def bootstrap_command(fresh, no_template):
+    """Create or upgrade the database and seed species and breeds."""
+    path = database_path()
+    started = time.perf_counter()
+    # Nothing may hold the file while it is replaced
+    db.engine.dispose()
+    if fresh:
+        _remove_database(path)
+
+    tables = _table_names(path)
+    if tables and 'alembic_version' not in tables:
+        # Built with db.create_all(): the later migrations still have to run on it
+        if _table_columns(path) != BASELINE_TABLES:
+            raise click.ClickException(
+                f"{path} was built without migrations (db.create_all()) and its tables are not those of the "
+                f"first migration ({BASELINE_REVISION}). Run `flask db stamp <revision>` with the revision "
+                "they match, then `flask bootstrap` again."
+            )
+        stamp(revision=BASELINE_REVISION)
+        click.echo(f"Stamped {path} with {BASELINE_REVISION}, built without migrations")
+
+    template = template_path()
+    if not tables and not no_template and os.path.exists(template):
+        clone_database(template, path)
+        click.echo(f"Cloned {template}")
+    else:
+        upgrade()
+        db.engine.dispose()
+        click.echo(f"Migrated to {head_revision()}")
+
+    with db.engine.begin() as connection:
+        added_species, added_breeds = seed_catalog(connection)
+    click.echo(f"Seeded {added_species} species and {added_breeds} breeds")
+
+    if not tables and not os.path.exists(template):
+        db.engine.dispose()
+        # Templates of older heads are of no use anymore
+        for old in glob.glob(os.path.join(current_app.instance_path, "bootstrap-*.db")):
+            os.remove(old)
+        clone_database(path, template)
+        click.echo(f"Saved {template}")
+    click.echo(f"Database ready in {time.perf_counter() - started:.2f} s: {path}")
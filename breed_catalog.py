@@ -0,0 +1,171 @@
+"""
+In-memory catalog of species and breeds.
+
+The catalog is static reference data seeded from `breeds.py`, yet the pet forms
+and the breed endpoint used to query it on every request. It is now loaded once
+into an immutable snapshot with a prefix index for typeahead searches. A cheap
+version stamp (row counts, highest ids and total name length) is compared at most
+every `CATALOG_CHECK_INTERVAL` seconds, and edits made through the ORM in this
+process reload it right after commit.
+
+Prefix search with bisect on a sorted list, as in:
+https://docs.python.org/3/library/bisect.html#searching-sorted-lists
+"""
+
+import hashlib
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session, object_session
+
+from extensions import db
+from models import Species, Breed
+
+NamedRef = namedtuple('NamedRef', 'id name')
+
+
+def catalog_stamp():
+    """Cheap fingerprint of the species and breeds tables"""
+    stamps = [
+        select(aggregate).scalar_subquery()
+        for model in (Species, Breed)
+        for aggregate in (func.count(model.id), func.max(model.id), func.total(func.length(model.name)))
+    ]
+    return tuple(db.session.execute(select(*stamps)).one())
+
+
+class Catalog:
+    """Immutable snapshot of the species and breeds"""
+
+    def __init__(self, species, breeds, stamp):
+        self.stamp = stamp
+        self.species = tuple(NamedRef(species_id, name) for species_id, name in species)
+        breeds_by_species = {species_id: [] for species_id, _ in species}
+        for breed_id, species_id, name in breeds:
+            breeds_by_species.setdefault(species_id, []).append(NamedRef(breed_id, name))
+        self._breeds = {species_id: tuple(items) for species_id, items in breeds_by_species.items()}
+
+        # Every word of a name is a search key, so "ret" finds "Golden Retriever"
+        self._prefix_index = sorted(
+            (name.lower()[start:], species_id, NamedRef(breed_id, name))
+            for breed_id, species_id, name in breeds
+            for start in {0} | {i + 1 for i, char in enumerate(name) if char in ' -'}
+        )
+        self._prefix_keys = [key for key, _, _ in self._prefix_index]
+
+        self.version = self._digest(self.species, sorted(self._breeds.items()))
+        self._etags = {species_id: self._digest(items) for species_id, items in self._breeds.items()}
+
+    @staticmethod
+    def _digest(*parts):
+        return hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+
+    def species_choices(self):
+        return [(species.id, species.name) for species in self.species]
+
+    def breeds(self, species_id):
+        """Breeds of a species, in catalog order"""
+        return self._breeds.get(species_id, ())
+
+    def breed_choices(self, species_id):
+        return [(breed.id, breed.name) for breed in self.breeds(species_id)]
+
+    def etag(self, species_id):
+        """Strong validator of the breed list of a species"""
+        return self._etags.get(species_id, self._digest(()))
+
+    def search(self, prefix, species_id=None, limit=20):
+        """Breeds having a word that starts with prefix"""
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        matches = {}
+        for key, breed_species, breed in self._prefix_index[bisect_left(self._prefix_keys, prefix):]:
+            if not key.startswith(prefix) or len(matches) >= limit:
+                break
+            if species_id is None or breed_species == species_id:
+                matches.setdefault(breed.id, breed)
+        return sorted(matches.values(), key=lambda breed: breed.name)
+
+
+def load_catalog():
+    """Read the whole catalog in two queries"""
+    stamp = catalog_stamp()
+    species = db.session.execute(select(Species.id, Species.name).order_by(Species.id)).all()
+    breeds = db.session.execute(select(Breed.id, Breed.species_id, Breed.name).order_by(Breed.id)).all()
+    return Catalog(species, breeds, stamp)
+
+
+class BreedCatalog:
+    """Process-wide holder of the current catalog snapshot"""
+
+    def __init__(self, app=None):
+        self.check_interval = 300
+        self._catalog = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CATALOG_CHECK_INTERVAL', self.check_interval)
+        self.check_interval = app.config['CATALOG_CHECK_INTERVAL']
+        app.extensions['breed_catalog'] = self
+
+    def get(self):
+        """Current catalog, reloaded when its version stamp changed"""
+        catalog = self._catalog
+        if catalog is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return catalog
+
+        with self._lock:
+            if self._catalog is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return self._catalog
+            if self._catalog is None or catalog_stamp() != self._catalog.stamp:
+                self._catalog = load_catalog()
+                self.reloads += 1
+            self._checked_at = time.monotonic()
+            return self._catalog
+
+    def invalidate(self):
+        with self._lock:
+            self._catalog = None
+
+    def stats(self):
+        catalog = self._catalog
+        return {
+            "loaded": catalog is not None,
+            "version": catalog.version if catalog else None,
+            "species": len(catalog.species) if catalog else 0,
+            "reloads": self.reloads,
+        }
+
+
+breed_catalog = BreedCatalog()
+
+
+@event.listens_for(Species, 'after_insert')
+@event.listens_for(Species, 'after_update')
+@event.listens_for(Species, 'after_delete')
+@event.listens_for(Breed, 'after_insert')
+@event.listens_for(Breed, 'after_update')
+@event.listens_for(Breed, 'after_delete')
+def _remember_catalog_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['catalog_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _reload_catalog(session):
+    if session.info.pop('catalog_changed', False):
+        breed_catalog.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_catalog_change(session):
+    session.info.pop('catalog_changed', None)
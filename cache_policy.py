@@ -0,0 +1,126 @@
+"""
+HTTP caching policies.
+
+Every response gets its `Cache-Control` from the first matching rule:
+  1. the header a view set itself (weight graph, breed lists, ...)
+  2. `CACHE_ENDPOINT_POLICIES`, keyed by endpoint name
+  3. static files whose URL carries their current fingerprint: immutable for a year
+  4. `CACHE_PATH_POLICIES`, regular expressions matched against the path
+  5. `CACHE_DEFAULT_POLICY`, private and never stored, for the (authenticated) HTML
+
+`url_for('static', filename=...)` appends `?v=<content hash>` to app assets, so a
+changed file gets a new URL and browsers can keep the old one forever. Uploads
+are excluded: their names are already content hashes (see `upload_store.py`).
+
+Cache busting with url_defaults as in:
+https://flask.palletsprojects.com/en/latest/patterns/urlprocessors/
+"""
+
+import hashlib
+import os
+import re
+import threading
+
+from flask import current_app, request
+from werkzeug.security import safe_join
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+NO_STORE = 'private, no-cache, no-store, must-revalidate'
+
+DEFAULT_PATH_POLICIES = (
+    # Content-addressed uploads and their derivatives never change
+    (r'^/static/uploads/(derived/)?[0-9a-f]{2}/[0-9a-f]{2}/', 'private, max-age=31536000, immutable'),
+    (r'^/static/uploads/', 'private, max-age=86400'),
+    # Assets requested without (or with an outdated) fingerprint are revalidated hourly
+    (r'^/static/', 'public, max-age=3600'),
+)
+
+
+class CachePolicies:
+    """Applies the caching rules to responses and fingerprints static URLs"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._rules = ()
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_DEFAULT_POLICY', NO_STORE)
+        app.config.setdefault('CACHE_FINGERPRINTED_POLICY', IMMUTABLE)
+        app.config.setdefault('CACHE_PATH_POLICIES', DEFAULT_PATH_POLICIES)
+        app.config.setdefault('CACHE_ENDPOINT_POLICIES', {})
+        app.config.setdefault('STATIC_FINGERPRINT_EXCLUDE', ('uploads/',))
+
+        self.app = app
+        self._rules = tuple((re.compile(pattern), policy) for pattern, policy in app.config['CACHE_PATH_POLICIES'])
+        app.extensions['cache_policies'] = self
+        app.url_defaults(self._add_fingerprint)
+        app.after_request(self.apply)
+
+    def fingerprint(self, filename):
+        """Short content hash of a static file, None if it does not exist"""
+        path = safe_join(self.app.static_folder, filename)
+        try:
+            stat = os.stat(path)
+        except (TypeError, OSError):
+            return None
+
+        # Re-hashed only when the file changes
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._fingerprints.get(filename)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with open(path, 'rb') as static_file:
+            digest = hashlib.file_digest(static_file, 'sha256').hexdigest()[:12]
+        with self._lock:
+            self._fingerprints[filename] = (key, digest)
+        return digest
+
+    def _add_fingerprint(self, endpoint, values):
+        if endpoint != 'static' or 'v' in values:
+            return
+        filename = values.get('filename')
+        if not filename or filename.startswith(self.app.config['STATIC_FINGERPRINT_EXCLUDE']):
+            return
+        digest = self.fingerprint(filename)
+        if digest is not None:
+            values['v'] = digest
+
+    def policy_for(self, response):
+        config = current_app.config
+        endpoint_policy = config['CACHE_ENDPOINT_POLICIES'].get(request.endpoint)
+        if endpoint_policy is not None:
+            return endpoint_policy
+
+        if request.endpoint == 'static':
+            version = request.args.get('v')
+            filename = (request.view_args or {}).get('filename')
+            if version and filename and version == self.fingerprint(filename):
+                return config['CACHE_FINGERPRINTED_POLICY']
+
+        for pattern, policy in self._rules:
+            if pattern.match(request.path):
+                return policy
+        return config['CACHE_DEFAULT_POLICY']
+
+    def apply(self, response):
+        """after_request hook setting the caching headers"""
+        # Views that manage their own caching (e.g. the weight graph image) keep their headers
+        if request.endpoint != 'static' and 'Cache-Control' in response.headers:
+            return response
+
+        policy = self.policy_for(response)
+        response.headers['Cache-Control'] = policy
+        if 'no-store' in policy:
+            response.headers['Expires'] = 0
+            response.headers['Pragma'] = 'no-cache'
+        else:
+            response.headers.pop('Expires', None)
+            response.headers.pop('Pragma', None)
+        return response
+
+
+cache_policies = CachePolicies()
@@ -0,0 +1,244 @@
+"""
+Process pool that renders charts away from the web workers.
+
+Each worker is a separate process that owns its own chart state, so a leak or a
+corrupted figure can never reach the web server. Workers are recycled after
+`CHART_POOL_MAX_TASKS` renders or when their resident memory goes over
+`CHART_POOL_MAX_RSS`, and a render that takes longer than `CHART_RENDER_TIMEOUT`
+kills its worker instead of blocking a request forever.
+
+Renders run on the request thread, which waits for its worker. At most
+`CHART_POOL_SIZE` of them run at once; a request that finds every worker busy
+for `CHART_RENDER_TIMEOUT` seconds gets a ChartRenderError, not a queue slot.
+
+The memory check reads /proc, so it only works on Linux. Elsewhere (Windows,
+macOS) workers are only recycled after `CHART_POOL_MAX_TASKS` renders.
+
+With `CHART_ENGINE = 'matplotlib'` every worker draws on one reused `Figure`
+(object-oriented API, no pyplot global state) that is cleared between renders.
+
+Based on the worker/pipe model of the multiprocessing documentation:
+https://docs.python.org/3/library/multiprocessing.html#pipes-and-queues
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+from io import BytesIO
+
+from svg_chart import render_line_chart
+
+
+class ChartRenderError(Exception):
+    """A chart could not be rendered in time or its worker died"""
+
+
+def current_rss():
+    """Resident memory of this process in bytes, or None where /proc is not available (not Linux)"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _new_figure():
+    from matplotlib.figure import Figure
+    return Figure(figsize=(10, 5))
+
+
+def _render_matplotlib(figure, dates, weights, title, xlabel, ylabel, color, show_days_only=False):
+    """Same drawing as the matplotlib renderer of benchmarks/bench_weight_graph.py on a recycled figure"""
+    import matplotlib.dates as mdates
+
+    figure.clf()
+    ax = figure.add_subplot()
+
+    # Plot only valid points with lines connecting them
+    valid_dates = [date for date, weight in zip(dates, weights) if weight is not None]
+    valid_weights = [weight for weight in weights if weight is not None]
+    ax.plot(valid_dates, valid_weights, marker='o', color=color)
+
+    ax.set(xlabel=xlabel, ylabel=ylabel, title=title)
+    if show_days_only:
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%d'))
+        ax.set_xticks(dates)
+        ax.tick_params(axis='x', labelrotation=45)
+    ax.grid()
+
+    img = BytesIO()
+    figure.savefig(img, format='svg')
+    return img.getvalue().decode('utf-8')
+
+
+def _worker_main(conn, engine):
+    """Worker loop: render every task received on the pipe until told to stop"""
+    figure = None
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+
+        try:
+            if engine == 'matplotlib':
+                if figure is None:
+                    figure = _new_figure()
+                result = ('ok', _render_matplotlib(figure, **task))
+            else:
+                result = ('ok', render_line_chart(**task))
+        except Exception as e:
+            result = ('error', repr(e))
+        conn.send(result + (current_rss(),))
+    conn.close()
+
+
+class _Worker:
+    """One rendering process and the parent end of its pipe"""
+
+    def __init__(self, context, engine):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, engine), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def stop(self):
+        """Ask the worker to exit, killing it if it does not"""
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(1)
+        self.conn.close()
+
+
+class ChartPool:
+    """Bounded pool of rendering processes"""
+
+    def __init__(self, app=None):
+        self.size = 2
+        self.engine = 'svg'
+        self.max_tasks = 500
+        self.max_rss = 256 * 1024 * 1024
+        self.timeout = 10
+        self.start_method = None
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = None
+        self._context = None
+        self.renders = 0
+        self.recycled = 0
+        self.timeouts = 0
+        self.busy = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHART_ENGINE', self.engine)
+        app.config.setdefault('CHART_POOL_SIZE', self.size)
+        app.config.setdefault('CHART_POOL_MAX_TASKS', self.max_tasks)
+        # Linux only, see current_rss()
+        app.config.setdefault('CHART_POOL_MAX_RSS', self.max_rss)
+        app.config.setdefault('CHART_RENDER_TIMEOUT', self.timeout)
+        # forkserver forks new workers from a small clean process, spawn is the portable fallback
+        app.config.setdefault('CHART_POOL_START_METHOD',
+                              'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+        self.engine = app.config['CHART_ENGINE']
+        self.size = app.config['CHART_POOL_SIZE']
+        self.max_tasks = app.config['CHART_POOL_MAX_TASKS']
+        self.max_rss = app.config['CHART_POOL_MAX_RSS']
+        self.timeout = app.config['CHART_RENDER_TIMEOUT']
+        self.start_method = app.config['CHART_POOL_START_METHOD']
+        app.extensions['chart_pool'] = self
+
+    def _start(self):
+        with self._lock:
+            if self._slots is None:
+                self._context = multiprocessing.get_context(self.start_method)
+                self._slots = threading.BoundedSemaphore(self.size)
+                atexit.register(self.shutdown)
+
+    def render(self, **task):
+        """Render in the pool, blocking until the SVG is ready"""
+        self._start()
+        # Requests beyond the pool size wait here, for as long as a render may take
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.busy += 1
+            raise ChartRenderError("All chart workers are busy")
+
+        worker = None
+        rss = None
+        try:
+            worker = self._checkout()
+            worker.conn.send(task)
+            if not worker.conn.poll(self.timeout):
+                # A stuck render must not hold the worker (or the request) forever
+                worker.kill()
+                worker = None
+                with self._lock:
+                    self.timeouts += 1
+                raise ChartRenderError(f"Chart render timed out after {self.timeout}s")
+            status, payload, rss = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            if worker is not None:
+                worker.kill()
+                worker = None
+            raise ChartRenderError(f"Chart worker died: {e}") from e
+        finally:
+            if worker is not None:
+                self._checkin(worker, rss)
+            self._slots.release()
+
+        if status != 'ok':
+            raise ChartRenderError(payload)
+        return payload
+
+    def _checkout(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return _Worker(self._context, self.engine)
+
+    def _checkin(self, worker, rss):
+        worker.tasks += 1
+        with self._lock:
+            self.renders += 1
+            recycle = worker.tasks >= self.max_tasks or (rss is not None and rss > self.max_rss)
+            if not recycle:
+                self._idle.append(worker)
+                return
+            self.recycled += 1
+        worker.stop()
+
+    def shutdown(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "engine": self.engine,
+                "size": self.size,
+                "idle_workers": len(self._idle),
+                "renders": self.renders,
+                "recycled": self.recycled,
+                "timeouts": self.timeouts,
+                "busy": self.busy,
+            }
+
+
+chart_pool = ChartPool()
@@ -0,0 +1,54 @@
+"""
+Largest-Triangle-Three-Buckets (LTTB) downsampling for time series.
+
+Keeps the first and last points and, for every bucket in between, the point that
+forms the largest triangle with the point kept in the previous bucket and the
+average of the next bucket. The shape of the series (peaks, drops) survives even
+when thousands of weigh-ins are reduced to a few hundred points.
+
+Algorithm from Sveinn Steinarsson, "Downsampling Time Series for Visual
+Representation" (2013): https://skemman.is/handle/1946/15343
+"""
+
+import numpy as np
+
+
+def lttb_indices(x, y, threshold):
+    """Return the indices of the points LTTB keeps out of (x, y)"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # threshold - 2 buckets between the fixed first and last points
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Average point of the next bucket (the last point for the final bucket)
+        if bucket + 2 < len(edges):
+            next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+            avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+
+        ax, ay = x[previous], y[previous]
+        areas = np.abs((ax - avg_x) * (y[start:end] - ay) - (ax - x[start:end]) * (avg_y - ay))
+        previous = start + int(areas.argmax())
+        kept[bucket + 1] = previous
+
+    return kept
+
+
+def lttb(dates, values, threshold):
+    """Downsample parallel lists of dates and values to at most `threshold` points"""
+    if len(dates) <= threshold:
+        return list(dates), list(values)
+    days = np.array(dates, dtype='datetime64[D]').astype(np.int64)
+    kept = lttb_indices(days, values, threshold)
+    return [dates[i] for i in kept], [values[i] for i in kept]
@@ -0,0 +1,143 @@
+"""
+Removal of uploaded files once the database agrees they are gone.
+
+Routes never unlink files themselves: they call `remove_after_commit()` inside
+their transaction. After a successful commit the paths are handed to a
+background thread that deletes them, and after a rollback they are forgotten,
+so a failed transaction can no longer leave rows pointing at missing files and
+a slow disk never delays the response.
+
+A file may be used again between the commit and its removal (an upload of the
+same bytes, see `upload_store.py`). When reference checks are registered, the
+thread first renames the file aside, then asks the checks whether a committed
+row uses it. A file still in use is renamed back, so it is never removed from
+under a new reference.
+
+Same session event pattern as `mail_outbox.py` and `graph_cache.py`.
+"""
+
+import os
+import queue
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+def remove_after_commit(session, paths):
+    """Queue files to be deleted once `session` commits"""
+    session.info.setdefault('files_to_remove', set()).update(path for path in paths if path)
+
+
+class FileCleaner:
+    """Background thread that unlinks files queued by committed transactions"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._companions = []
+        self._reference_checks = []
+        self.removed = 0
+        self.kept = 0
+        self.missing = 0
+        self.errors = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['file_cleanup'] = self
+
+    def add_companions(self, companions):
+        """Register a function returning the files to delete along with a path (e.g. its thumbnails)"""
+        if companions not in self._companions:
+            self._companions.append(companions)
+
+    def add_reference_check(self, in_use):
+        """Register a function telling whether a committed row still uses a path, run in an app context"""
+        if in_use not in self._reference_checks:
+            self._reference_checks.append(in_use)
+
+    def submit(self, paths):
+        for path in paths:
+            self._queue.put(path)
+        self._start()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="file-cleanup", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            try:
+                if self._remove(path):
+                    for companions in self._companions:
+                        for companion in companions(path):
+                            self._remove(companion, checked=False)
+            finally:
+                self._queue.task_done()
+
+    def _remove(self, path, checked=True):
+        """Delete `path` unless it is in use again, False when it was kept"""
+        try:
+            if not (checked and self._reference_checks and self.app is not None):
+                os.remove(path)
+            else:
+                # Nothing can start using the renamed file, so the check cannot go stale
+                aside = f"{path}.removing"
+                os.replace(path, aside)
+                if self._in_use(path):
+                    os.replace(aside, path)
+                    self.kept += 1
+                    return False
+                os.remove(aside)
+            self.removed += 1
+        except FileNotFoundError:
+            self.missing += 1
+        except OSError as e:
+            self.errors += 1
+            if self.app is not None:
+                self.app.logger.warning("Could not remove %s: %s", path, e)
+        return True
+
+    def _in_use(self, path):
+        try:
+            with self.app.app_context():
+                return any(in_use(path) for in_use in self._reference_checks)
+        except Exception:
+            # Kept when in doubt; an orphaned file is better than a missing one
+            self.app.logger.exception("Could not check the references of %s", path)
+            return True
+
+    def join(self):
+        """Wait until every queued file is handled"""
+        self._queue.join()
+
+    def stats(self):
+        return {
+            "pending": self._queue.qsize(),
+            "removed": self.removed,
+            "kept": self.kept,
+            "missing": self.missing,
+            "errors": self.errors,
+        }
+
+
+file_cleaner = FileCleaner()
+
+
+@event.listens_for(Session, 'after_commit')
+def _remove_committed_files(session):
+    paths = session.info.pop('files_to_remove', None)
+    if paths:
+        file_cleaner.submit(paths)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _keep_files(session):
+    session.info.pop('files_to_remove', None)
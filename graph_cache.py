@@ -0,0 +1,150 @@
+"""
+In-process cache for rendered weight graphs.
+
+Rendered SVGs are kept under (pet_id, year, month, data version) with LRU eviction
+bounded both by number of entries and by total size in bytes. Concurrent requests
+for the same missing graph share a single render (single-flight), and every entry
+of a pet is dropped as soon as one of its `WeightTracker` rows is added, edited
+or deleted.
+
+LRU built on OrderedDict as described in:
+https://docs.python.org/3/library/collections.html#ordereddict-examples-and-recipes
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import WeightTracker
+
+
+def data_version(rows):
+    """Short digest identifying the data a graph is drawn from"""
+    digest = hashlib.blake2b(digest_size=8)
+    for row in rows:
+        digest.update(repr(row).encode())
+    return digest.hexdigest()
+
+
+class GraphCache:
+    """Thread-safe LRU cache of rendered graphs with single-flight rendering"""
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._inflight = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        app.config.setdefault('GRAPH_CACHE_MAX_ENTRIES', self.max_entries)
+        app.config.setdefault('GRAPH_CACHE_MAX_BYTES', self.max_bytes)
+        self.max_entries = app.config['GRAPH_CACHE_MAX_ENTRIES']
+        self.max_bytes = app.config['GRAPH_CACHE_MAX_BYTES']
+        app.extensions['graph_cache'] = self
+
+    def get_or_render(self, key, render):
+        """Return the cached value for key, calling render() once if it is missing"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+                self.misses += 1
+
+        # Somebody else is already rendering this graph, wait for their result
+        if not owner:
+            return future.result()
+
+        try:
+            value = render()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._inflight[key]
+            self._store(key, value)
+        future.set_result(value)
+        return value
+
+    def _store(self, key, value):
+        size = len(value.encode()) if isinstance(value, str) else len(value)
+        # Never keep a single value bigger than the whole budget
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            del self._entries[key]
+            self._size -= self._sizes.pop(key)
+        self._entries[key] = value
+        self._sizes[key] = size
+        self._size += size
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            old_key, _ = self._entries.popitem(last=False)
+            self._size -= self._sizes.pop(old_key)
+
+    def invalidate_pet(self, pet_id):
+        """Drop every graph drawn for a pet"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == pet_id]:
+                del self._entries[key]
+                self._size -= self._sizes.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "rendering": len(self._inflight),
+            }
+
+
+weight_graph_cache = GraphCache()
+
+
+def mark_weight_changed(session, pet_ids):
+    """Drop the graphs of these pets when session commits (for bulk statements that skip mapper events)"""
+    session.info.setdefault('weight_graph_pets', set()).update(pet_ids)
+
+
+@event.listens_for(WeightTracker, 'after_insert')
+@event.listens_for(WeightTracker, 'after_update')
+@event.listens_for(WeightTracker, 'after_delete')
+def _remember_changed_pet(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        mark_weight_changed(session, (target.pet_id,))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_weight_graphs(session):
+    for pet_id in session.info.pop('weight_graph_pets', ()):
+        weight_graph_cache.invalidate_pet(pet_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_pets(session):
+    session.info.pop('weight_graph_pets', None)
@@ -1,13 +1,23 @@
-import os
-from io import BytesIO
+from datetime import date
 from functools import wraps
-from flask import redirect, session, render_template, g, current_app
-from models import Pet
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
+from flask import redirect, session, render_template, g
+from sqlalchemy import delete, select, tuple_
+from models import (Pet, Photo, Log, WeightTracker, VaccineTracker, InternalDewormingTracker,
+                    ExternalDewormingTracker, MedicationTracker)
+from upload_store import release_uploads
+from graph_cache import mark_weight_changed
+from pet_cache import pet_list_cache, mark_pets_changed
+from page_versions import bump_versions
+from svg_chart import render_line_chart
 
 PHOTO_ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
+# Tables holding rows of a pet, deleted before the pet itself
+PET_CHILD_MODELS = (Photo, Log, WeightTracker, VaccineTracker, InternalDewormingTracker,
+                    ExternalDewormingTracker, MedicationTracker)
+# Pet ids per DELETE ... WHERE pet_id IN (...) statement
+PET_DELETE_BATCH = 500
+
 def login_required(f):
     """
     Decorate routes to require login.
@@ -19,6 +29,10 @@ def login_required(f):
     def decorated_function(*args, **kwargs):
         if session.get("user_id") is None:
             return redirect("/welcome")
+        # Accounts being deleted are logged out everywhere
+        if not pet_list_cache.is_active(session["user_id"]):
+            session.clear()
+            return redirect("/welcome")
         return f(*args, **kwargs)
 
     return decorated_function
@@ -28,14 +42,18 @@ def inject_pets(f):
     """Decorator to obtain pets related to a user"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        pets = Pet.query.filter_by(user_id=session.get("user_id")).all()
-        g.pets = pets
+        # Cached summaries, dropped whenever the user's pets change
+        g.pets = pet_list_cache.pets(session.get("user_id"))
         return f(*args, **kwargs)
     return decorated_function
 
 def owned_pet(pet):
-    """Ensure the user owns this pet"""
-    if pet.user_id != session.get("user_id"):
+    """Ensure the user owns this pet (a Pet, or a pet id checked against the cached pet list)"""
+    if isinstance(pet, Pet):
+        owner = pet.user_id == session.get("user_id")
+    else:
+        owner = pet_list_cache.owns(session.get("user_id"), pet)
+    if not owner:
         return error_message("Invalid route",404)
 
 
@@ -53,70 +71,71 @@ def allowed_photo_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in PHOTO_ALLOWED_EXTENSIONS
 
 
+def encode_cursor(day, row_id):
+    """Keyset cursor pointing at a (date, id) position"""
+    return f"{day.isoformat()}_{row_id}"
+
+
+def decode_cursor(cursor):
+    """Parse a cursor made by encode_cursor, None if it is missing or invalid"""
+    try:
+        day, row_id = cursor.split('_')
+        return date.fromisoformat(day), int(row_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def keyset_page(query, date_column, id_column, cursor=None, per_page=20):
+    """
+    Newest-first page of a query using keyset pagination on (date, id).
+    Returns the rows and the cursor of the next page (None on the last page).
+    https://use-the-index-luke.com/no-offset
+    """
+    position = decode_cursor(cursor)
+    if position:
+        query = query.filter(tuple_(date_column, id_column) < position)
+    rows = query.order_by(date_column.desc(), id_column.desc()).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, date_column.key), getattr(last, id_column.key))
+    return rows, next_cursor
+
+
+def delete_pets_from_db(pet_ids, db):
+    """
+    Delete pets and all their associated data with set-based DELETE statements in
+    the current transaction. Profile and gallery photo files no longer used by
+    anything are removed in the background once the transaction commits.
+    """
+    pet_ids = list(pet_ids)
+
+    for start in range(0, len(pet_ids), PET_DELETE_BATCH):
+        batch = pet_ids[start:start + PET_DELETE_BATCH]
+        owners = db.session.execute(select(Pet.user_id, Pet.pet_profile_photo).where(Pet.id.in_(batch))).all()
+        photos = db.session.scalars(select(Photo.image_url).where(Photo.pet_id.in_(batch))).all()
+        files = [profile_photo for _, profile_photo in owners] + photos
+        release_uploads(db.session, files)
+
+        # Photos, logs, weight records, vaccines, medications and deworming, then the pets themselves
+        for model in PET_CHILD_MODELS:
+            db.session.execute(delete(model).where(model.pet_id.in_(batch)))
+        db.session.execute(delete(Pet).where(Pet.id.in_(batch)))
+
+        # Bulk statements skip the mapper events the caches listen to
+        mark_weight_changed(db.session, batch)
+        mark_pets_changed(db.session, {user_id for user_id, _ in owners})
+        bump_versions(db.session, user_ids={user_id for user_id, _ in owners})
+
+
 def delete_pet_from_db(pet, db):
     """Helper function to delete a pet and all its associated data."""
-    # Delete the pet's profile photo
-    if pet.pet_profile_photo:
-        pet_photo_path = os.path.join(current_app.config['UPLOAD_FOLDER'], pet.pet_profile_photo)
-        if os.path.exists(pet_photo_path):
-            os.remove(pet_photo_path)
-    
-    # Delete gallery photos associated with the pet
-    for photo in pet.photos:
-        if photo.image_url:
-            photo_path = os.path.join(current_app.config['UPLOAD_FOLDER'], photo.image_url)
-            if os.path.exists(photo_path):
-                os.remove(photo_path)
-        db.session.delete(photo)
-    
-    # Delete logs, weight tracks, vaccines, medications, and deworming
-    if pet.logs:
-        for log in pet.logs:
-            db.session.delete(log)
-    if pet.weight_tracks:
-        for weight in pet.weight_tracks:
-            db.session.delete(weight)
-    if pet.vaccines:
-        for vaccine in pet.vaccines:
-            db.session.delete(vaccine)
-    if pet.internal_deworm:
-        for deworm in pet.internal_deworm:
-            db.session.delete(deworm)
-    if pet.external_deworm:
-        for deworm in pet.external_deworm:
-            db.session.delete(deworm)
-    if pet.medications:
-        for medication in pet.medications:
-            db.session.delete(medication)
-    
-    # Finally, delete the pet itself
-    db.session.delete(pet)
+    delete_pets_from_db([pet.id], db)
 
 
 def create_weight_graph(dates, weights, title, xlabel, ylabel, color, show_days_only=False):
-    """Helper function to create and save a weight graph."""
-    # Asked ChatGPT for help to create graphs using matplotlib
-    fig, ax = plt.subplots(figsize=(10, 5))  # Set figure size
-
-    # Filter out None values for plotting the line
-    valid_dates = [date for date, weight in zip(dates, weights) if weight is not None]
-    valid_weights = [weight for weight in weights if weight is not None]
-
-    # Plot only valid points with lines connecting them
-    ax.plot(valid_dates, valid_weights, marker='o', color=color)  # Connect only valid points
-
-    # Set all days of the month on the x-axis
-    ax.set(xlabel=xlabel, ylabel=ylabel, title=title)
-    if show_days_only:
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%d'))  # Show only day numbers
-        ax.set_xticks(dates)  # Set ticks for all days in the month
-        plt.xticks(rotation=45)  # Rotate for readability
-
-    ax.grid()
-
-    # Save plot to a BytesIO buffer as SVG
-    img = BytesIO()
-    fig.savefig(img, format='svg')  # Save as SVG for responsiveness
-    img.seek(0)
-    
-    return img.getvalue().decode('utf-8')  # Return SVG content as string
+    """Helper function to create a weight graph as an SVG string."""
+    # Drawn by the NumPy chart engine in svg_chart.py, no matplotlib figure involved
+    return render_line_chart(dates, weights, title, xlabel, ylabel, color, show_days_only=show_days_only)
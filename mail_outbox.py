@@ -0,0 +1,316 @@
+"""
+Durable outbox for transactional emails (confirmation and password reset).
+
+Routes only insert a row in the `email_outbox` table inside their own database
+transaction. A small pool of background threads claims due rows, delivers them
+over a reused SMTP connection and reschedules failures with exponential backoff.
+A circuit breaker stops hammering the relay when it is down.
+
+Pattern adapted from:
+https://microservices.io/patterns/data/transactional-outbox.html
+"""
+
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import timedelta
+
+from flask import current_app
+from flask_mail import Message
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import OutboxEmail, utcnow
+
+
+def enqueue_email(recipient, subject, html, sender=None):
+    """Queue an email in the current database transaction"""
+    email = OutboxEmail(recipient=recipient, sender=sender, subject=subject, html=html)
+    db.session.add(email)
+    db.session.info['outbox_dirty'] = True
+    return email
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_dispatcher(session):
+    """Wake the workers as soon as a queued email is committed"""
+    if session.info.pop('outbox_dirty', False):
+        dispatcher.notify()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_queued(session):
+    session.info.pop('outbox_dirty', None)
+
+
+class CircuitBreaker:
+    """Stop contacting the SMTP relay after repeated failures"""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if self._probing or time.monotonic() - self._opened_at >= self.cooldown:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        """Return True if a send may be attempted now"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            # After the cooldown, let a single probe through
+            if not self._probing and time.monotonic() - self._opened_at >= self.cooldown:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class OutboxMetrics:
+    """Thread-safe counters and send latency samples"""
+
+    def __init__(self, window=500):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    def observe_send(self, seconds):
+        with self._lock:
+            self.sent += 1
+            self._latencies.append(seconds)
+
+    def observe_retry(self):
+        with self._lock:
+            self.retried += 1
+
+    def observe_failure(self):
+        with self._lock:
+            self.failed += 1
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counters = {"sent": self.sent, "retried": self.retried, "failed": self.failed}
+
+        def percentile(p):
+            if not latencies:
+                return None
+            index = min(len(latencies) - 1, int(round(p * (len(latencies) - 1))))
+            return round(latencies[index] * 1000, 2)
+
+        counters["send_latency_ms"] = {
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "max": percentile(1.0),
+        }
+        return counters
+
+
+class MailDispatcher:
+    """Background workers that drain the email outbox"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.metrics = OutboxMetrics()
+        self.breaker = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('OUTBOX_ENABLED', True)
+        app.config.setdefault('OUTBOX_WORKERS', 2)
+        app.config.setdefault('OUTBOX_BATCH_SIZE', 20)
+        app.config.setdefault('OUTBOX_POLL_INTERVAL', 5)
+        app.config.setdefault('OUTBOX_MAX_ATTEMPTS', 6)
+        app.config.setdefault('OUTBOX_BACKOFF_BASE', 15)
+        app.config.setdefault('OUTBOX_BACKOFF_MAX', 3600)
+        app.config.setdefault('OUTBOX_LEASE_SECONDS', 300)
+        app.config.setdefault('OUTBOX_BREAKER_THRESHOLD', 5)
+        app.config.setdefault('OUTBOX_BREAKER_COOLDOWN', 60)
+
+        self.app = app
+        self.breaker = CircuitBreaker(
+            app.config['OUTBOX_BREAKER_THRESHOLD'],
+            app.config['OUTBOX_BREAKER_COOLDOWN'],
+        )
+        app.extensions['mail_outbox'] = self
+
+        # Start lazily on the first request so CLI commands (e.g. `flask db upgrade`)
+        # never spawn workers against a database that is not migrated yet
+        @app.before_request
+        def start_mail_dispatcher():
+            if not self._threads and app.config['OUTBOX_ENABLED']:
+                self.start()
+
+    def start(self):
+        """Spawn the worker threads"""
+        with self._start_lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for i in range(self.app.config['OUTBOX_WORKERS']):
+                thread = threading.Thread(target=self._run, name=f"mail-outbox-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=5):
+        """Ask the workers to finish their current batch and exit"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        self._wakeup.set()
+
+    def queue_depth(self):
+        """Number of emails waiting or in flight"""
+        return db.session.scalar(
+            select(func.count(OutboxEmail.id)).where(OutboxEmail.status.in_(('pending', 'sending')))
+        )
+
+    def stats(self):
+        stats = self.metrics.snapshot()
+        stats["queue_depth"] = self.queue_depth()
+        stats["dead_letters"] = OutboxEmail.query.filter_by(status='failed').count()
+        stats["circuit"] = self.breaker.state
+        stats["workers"] = len(self._threads)
+        return stats
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    processed = self.drain_once()
+            except Exception:
+                self.app.logger.exception("Mail outbox worker error")
+                processed = 0
+
+            if not processed:
+                self._wakeup.wait(self.app.config['OUTBOX_POLL_INTERVAL'])
+                self._wakeup.clear()
+
+    def drain_once(self):
+        """Claim and deliver one batch; return how many emails were handled"""
+        if not self.breaker.allow():
+            return 0
+
+        batch = self._claim_batch()
+        if not batch:
+            return 0
+
+        pending = list(batch)
+        mail = current_app.extensions['mail']
+        try:
+            # One SMTP session for the whole batch
+            with mail.connect() as conn:
+                while pending:
+                    email = pending[0]
+                    started = time.perf_counter()
+                    conn.send(self._build_message(email))
+                    self.metrics.observe_send(time.perf_counter() - started)
+                    self.breaker.record_success()
+                    db.session.delete(email)
+                    db.session.commit()
+                    pending.pop(0)
+        except Exception as e:
+            db.session.rollback()
+            if not pending:
+                # Only closing the connection failed, every email was delivered
+                return len(batch)
+            current_app.logger.warning("Outbox delivery failed: %s", e)
+            self.breaker.record_failure()
+            self._reschedule(pending[0], e)
+            # Emails that were never tried go straight back to the queue
+            for email in pending[1:]:
+                self._release(email)
+            db.session.commit()
+
+        return len(batch)
+
+    def _claim_batch(self):
+        """Atomically mark due emails as ours so other workers skip them"""
+        config = current_app.config
+        now = utcnow()
+        token = uuid.uuid4().hex
+        due = select(OutboxEmail.id).where(
+            or_(
+                and_(OutboxEmail.status == 'pending', OutboxEmail.next_attempt_at <= now),
+                # Recover emails claimed by a worker that died mid-send
+                and_(OutboxEmail.status == 'sending',
+                     OutboxEmail.claimed_at < now - timedelta(seconds=config['OUTBOX_LEASE_SECONDS'])),
+            )
+        ).order_by(OutboxEmail.next_attempt_at).limit(config['OUTBOX_BATCH_SIZE'])
+
+        db.session.execute(
+            update(OutboxEmail)
+            .where(OutboxEmail.id.in_(due.scalar_subquery()))
+            .values(status='sending', claim_token=token, claimed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return OutboxEmail.query.filter_by(claim_token=token).order_by(OutboxEmail.id).all()
+
+    def _build_message(self, email):
+        msg = Message(email.subject, sender=email.sender or None, recipients=[email.recipient])
+        msg.html = email.html
+        return msg
+
+    def _reschedule(self, email, error):
+        """Retry later with exponential backoff and jitter, or give up"""
+        config = current_app.config
+        email.attempts += 1
+        email.last_error = str(error)[:255]
+        email.claim_token = None
+        email.claimed_at = None
+        if email.attempts >= config['OUTBOX_MAX_ATTEMPTS']:
+            email.status = 'failed'
+            self.metrics.observe_failure()
+            current_app.logger.error("Giving up on email %s after %s attempts", email.id, email.attempts)
+            return
+
+        delay = min(config['OUTBOX_BACKOFF_MAX'], config['OUTBOX_BACKOFF_BASE'] * 2 ** (email.attempts - 1))
+        email.status = 'pending'
+        email.next_attempt_at = utcnow() + timedelta(seconds=random.uniform(delay / 2, delay))
+        self.metrics.observe_retry()
+
+    def _release(self, email):
+        email.status = 'pending'
+        email.claim_token = None
+        email.claimed_at = None
+
+
+dispatcher = MailDispatcher()
@@ -41,19 +41,14 @@ def upgrade():
     sa.PrimaryKeyConstraint('id')
     )
 
-    # Insert species and breeds
+    # Insert species and breeds, one executemany each (the tables were just created)
     conn = op.get_bind()
-    species_map = {}
+    conn.execute(sa.text("INSERT INTO species (name) VALUES (:name)"), [{"name": species} for species in breeds])
+    species_map = dict(conn.execute(sa.text("SELECT name, id FROM species")).all())
+    conn.execute(sa.text("INSERT INTO breeds (species_id, name) VALUES (:species_id, :name)"),
+                 [{"species_id": species_map[species], "name": breed}
+                  for species, breed_list in breeds.items() for breed in breed_list])
 
-    for species, breed_list in breeds.items():
-        result = conn.execute(sa.text("INSERT INTO species (name) VALUES (:name) RETURNING id"), {"name": species})
-        species_id = result.scalar()
-        species_map[species] = species_id
-
-        for breed in breed_list:
-            conn.execute(sa.text("INSERT INTO breeds (species_id, name) VALUES (:species_id, :name)"),
-                         {"species_id": species_id, "name": breed})
-            
     op.create_table('pets',
     sa.Column('id', sa.Integer(), nullable=False),
     sa.Column('user_id', sa.Integer(), nullable=False),
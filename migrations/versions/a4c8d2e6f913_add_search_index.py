@@ -0,0 +1,76 @@
+"""Add full-text search index over logs and tracker entries
+
+Revision ID: a4c8d2e6f913
+Revises: f1b7e2a9c604
+Create Date: 2026-10-17 21:40:53.226417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c8d2e6f913'
+down_revision = 'f1b7e2a9c604'
+branch_labels = None
+depends_on = None
+
+# Rows copied per INSERT ... SELECT while backfilling
+BATCH_SIZE = 5000
+
+# (kind code, table, title, body, date, condition) as in search.SEARCH_SOURCES
+SOURCES = (
+    (0, 'logs', '{row}.title', '{row}.content', '{row}.date_uploaded', '1'),
+    (1, 'weight_tracker', 'NULL', '{row}.notes', '{row}.date', '{row}.notes IS NOT NULL'),
+    (2, 'vaccine_tracker', '{row}.vaccine_name', "coalesce({row}.administered_by || ' ', '') || coalesce({row}.notes, '')",
+     '{row}.date', '1'),
+    (3, 'internal_deworming_tracker', '{row}.product_name', '{row}.notes', '{row}.date', '1'),
+    (4, 'external_deworming_tracker', '{row}.product_name', '{row}.notes', '{row}.date', '1'),
+    (5, 'medication_tracker', '{row}.product_name', '{row}.notes', '{row}.date', '1'),
+)
+
+INSERT = "INSERT INTO search_index (rowid, title, body, day) "
+
+
+def entry_rowid(code, row):
+    # All entries of a pet share one rowid range: pet id << 32 | row id << 3 | kind code
+    return f"(({row}.pet_id << 32) | ({row}.id << 3) | {code})"
+
+
+def entry_select(code, title, body, day, row):
+    return (f"SELECT {entry_rowid(code, row)}, {title.format(row=row)}, {body.format(row=row)}, "
+            f"{day.format(row=row)}")
+
+
+def upgrade():
+    op.execute(
+        "CREATE VIRTUAL TABLE search_index USING fts5("
+        "title, body, day UNINDEXED, "
+        "tokenize = 'porter unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+
+    conn = op.get_bind()
+    for code, table, title, body, day, condition in SOURCES:
+        # Backfill in id ranges so no single statement holds a whole table
+        last_id = conn.execute(sa.text(f"SELECT max(id) FROM {table}")).scalar() or 0
+        for start in range(0, last_id, BATCH_SIZE):
+            conn.execute(sa.text(
+                f"{INSERT}{entry_select(code, title, body, day, table)} FROM {table} "
+                f"WHERE {table}.id > :start AND {table}.id <= :end AND {condition.format(row=table)}"
+            ), {"start": start, "end": start + BATCH_SIZE})
+
+        delete = f"DELETE FROM search_index WHERE rowid = {entry_rowid(code, 'old')};"
+        new_entry = f"{INSERT}{entry_select(code, title, body, day, 'new')} WHERE {condition.format(row='new')};"
+        op.execute(f"CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} BEGIN {new_entry} END")
+        op.execute(f"CREATE TRIGGER {table}_search_update AFTER UPDATE ON {table} BEGIN {delete} {new_entry} END")
+        op.execute(f"CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} BEGIN {delete} END")
+
+    # Merge the b-trees written by the backfill
+    op.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+
+
+def downgrade():
+    for code, table, *_ in SOURCES:
+        for action in ('insert', 'update', 'delete'):
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_search_{action}")
+    op.execute("DROP TABLE IF EXISTS search_index")
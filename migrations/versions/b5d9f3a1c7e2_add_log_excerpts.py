@@ -0,0 +1,48 @@
+"""Add precomputed excerpts to logs
+
+Revision ID: b5d9f3a1c7e2
+Revises: a4c8d2e6f913
+Create Date: 2026-10-17 23:05:37.604118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d9f3a1c7e2'
+down_revision = 'a4c8d2e6f913'
+branch_labels = None
+depends_on = None
+
+# Logs read and updated per batch while backfilling
+BATCH_SIZE = 2000
+EXCERPT_LENGTH = 150
+
+
+# Same rule as models.log_excerpt(), copied so the migration never changes
+def log_excerpt(content):
+    text = ' '.join((content or '').split())
+    if len(text) <= EXCERPT_LENGTH:
+        return text
+    cut = text[:EXCERPT_LENGTH]
+    return (cut.rsplit(' ', 1)[0] if ' ' in cut else cut) + '…'
+
+
+def upgrade():
+    with op.batch_alter_table('logs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('excerpt', sa.String(length=EXCERPT_LENGTH + 1), server_default='', nullable=False))
+
+    conn = op.get_bind()
+    last_id = conn.execute(sa.text("SELECT max(id) FROM logs")).scalar() or 0
+    for start in range(0, last_id, BATCH_SIZE):
+        rows = conn.execute(sa.text("SELECT id, content FROM logs WHERE id > :start AND id <= :end"),
+                            {"start": start, "end": start + BATCH_SIZE}).all()
+        if rows:
+            conn.execute(sa.text("UPDATE logs SET excerpt = :excerpt WHERE id = :id"),
+                         [{"id": log_id, "excerpt": log_excerpt(content)} for log_id, content in rows])
+
+
+def downgrade():
+    # A batch operation would copy the table and lose its search triggers
+    op.drop_column('logs', 'excerpt')
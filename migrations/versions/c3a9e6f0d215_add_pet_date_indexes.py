@@ -0,0 +1,45 @@
+"""Add composite (pet_id, date) indexes
+
+Revision ID: c3a9e6f0d215
+Revises: b7d2c41e9a3f
+Create Date: 2026-10-17 11:40:03.551870
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a9e6f0d215'
+down_revision = 'b7d2c41e9a3f'
+branch_labels = None
+depends_on = None
+
+# Every page filters a child table by pet and sorts it by date
+PET_DATE_INDEXES = {
+    'photos': 'date_uploaded',
+    'logs': 'date_uploaded',
+    'weight_tracker': 'date',
+    'vaccine_tracker': 'date',
+    'internal_deworming_tracker': 'date',
+    'external_deworming_tracker': 'date',
+    'medication_tracker': 'date',
+}
+
+
+def upgrade():
+    with op.batch_alter_table('pets', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_pets_user_id'), ['user_id'], unique=False)
+
+    for table, date_column in PET_DATE_INDEXES.items():
+        op.create_index(f'ix_{table}_pet_id_{date_column}', table, ['pet_id', date_column], unique=False)
+
+    # Refresh the query planner statistics so SQLite picks the new indexes
+    op.execute('ANALYZE')
+
+
+def downgrade():
+    for table, date_column in PET_DATE_INDEXES.items():
+        op.drop_index(f'ix_{table}_pet_id_{date_column}', table_name=table)
+
+    with op.batch_alter_table('pets', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_pets_user_id'))
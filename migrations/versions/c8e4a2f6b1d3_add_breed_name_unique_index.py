@@ -0,0 +1,33 @@
+"""Add a unique (species_id, name) index to breeds
+
+Revision ID: c8e4a2f6b1d3
+Revises: b5d9f3a1c7e2
+Create Date: 2026-10-17 23:58:12.407316
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8e4a2f6b1d3'
+down_revision = 'b5d9f3a1c7e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Breeds seeded twice are merged into the first copy, pets included
+    op.execute(
+        "UPDATE pets SET breed_id = (SELECT min(first.id) FROM breeds AS first JOIN breeds AS copy "
+        "ON first.species_id = copy.species_id AND first.name = copy.name WHERE copy.id = pets.breed_id) "
+        "WHERE breed_id IS NOT NULL"
+    )
+    op.execute(
+        "DELETE FROM breeds WHERE id NOT IN (SELECT min(id) FROM breeds GROUP BY species_id, name)"
+    )
+    # Lets the catalog seeding upsert on (species_id, name)
+    op.create_index('ix_breeds_species_id_name', 'breeds', ['species_id', 'name'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_breeds_species_id_name', table_name='breeds')
@@ -0,0 +1,56 @@
+"""Add account tombstones and deletion jobs
+
+Revision ID: d5e8b1f47c20
+Revises: c3a9e6f0d215
+Create Date: 2026-10-17 15:02:27.604417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5e8b1f47c20'
+down_revision = 'c3a9e6f0d215'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+    op.create_table('account_deletion_jobs',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('phase', sa.String(length=40), nullable=True),
+    sa.Column('pets_total', sa.Integer(), nullable=True),
+    sa.Column('pets_deleted', sa.Integer(), nullable=False),
+    sa.Column('rows_total', sa.Integer(), nullable=True),
+    sa.Column('rows_deleted', sa.Integer(), nullable=False),
+    sa.Column('files_queued', sa.Integer(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('claim_token', sa.String(length=32), nullable=True),
+    sa.Column('claimed_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.String(length=255), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('account_deletion_jobs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_account_deletion_jobs_claim_token'), ['claim_token'], unique=False)
+        batch_op.create_index(batch_op.f('ix_account_deletion_jobs_user_id'), ['user_id'], unique=False)
+        batch_op.create_index('ix_account_deletion_jobs_status_claimed_at', ['status', 'claimed_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('account_deletion_jobs', schema=None) as batch_op:
+        batch_op.drop_index('ix_account_deletion_jobs_status_claimed_at')
+        batch_op.drop_index(batch_op.f('ix_account_deletion_jobs_user_id'))
+        batch_op.drop_index(batch_op.f('ix_account_deletion_jobs_claim_token'))
+
+    op.drop_table('account_deletion_jobs')
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('deleted_at')
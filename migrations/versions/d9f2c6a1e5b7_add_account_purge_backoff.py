@@ -0,0 +1,26 @@
+"""Add a retry time to account deletion jobs
+
+Revision ID: d9f2c6a1e5b7
+Revises: c8e4a2f6b1d3
+Create Date: 2026-10-18 10:41:27.604318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9f2c6a1e5b7'
+down_revision = 'c8e4a2f6b1d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('account_deletion_jobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('next_attempt_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('account_deletion_jobs', schema=None) as batch_op:
+        batch_op.drop_column('next_attempt_at')
@@ -0,0 +1,77 @@
+"""Store uploads by content hash
+
+Revision ID: e6a0c4d93b18
+Revises: d5e8b1f47c20
+Create Date: 2026-10-17 18:21:45.118203
+
+"""
+import glob
+import hashlib
+import os
+import shutil
+
+from alembic import op
+from flask import current_app
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a0c4d93b18'
+down_revision = 'd5e8b1f47c20'
+branch_labels = None
+depends_on = None
+
+# Same layout as upload_store.content_name(), copied so the migration never changes
+def content_name(digest, extension):
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+def upgrade():
+    # References are counted by looking the names up, so both columns need an index
+    with op.batch_alter_table('pets', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_pets_pet_profile_photo'), ['pet_profile_photo'], unique=False)
+    with op.batch_alter_table('photos', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_photos_image_url'), ['image_url'], unique=False)
+
+    # Move every referenced flat file to its content-addressed name
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    bind = op.get_bind()
+    names = bind.execute(sa.text(
+        "SELECT image_url FROM photos WHERE image_url IS NOT NULL "
+        "UNION SELECT pet_profile_photo FROM pets WHERE pet_profile_photo IS NOT NULL"
+    )).scalars().all()
+
+    moved = []
+    for name in names:
+        path = os.path.join(upload_folder, name.replace('\\', '/'))
+        if '/' in name.replace('\\', '/') or not os.path.isfile(path):
+            # Already sharded, or the file is missing: keep the name as it is
+            continue
+        with open(path, 'rb') as source:
+            digest = hashlib.file_digest(source, 'sha256').hexdigest()
+        new_name = content_name(digest, os.path.splitext(name)[1].lower())
+        new_path = os.path.join(upload_folder, new_name)
+        if not os.path.exists(new_path):
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            shutil.copy2(path, new_path)
+
+        bind.execute(sa.text("UPDATE photos SET image_url = :new WHERE image_url = :old"), {"new": new_name, "old": name})
+        bind.execute(sa.text("UPDATE pets SET pet_profile_photo = :new WHERE pet_profile_photo = :old"),
+                     {"new": new_name, "old": name})
+        moved.append(path)
+
+    # The flat copies (and their resized derivatives) go only once every row points at the new names
+    derived_folder = os.path.join(upload_folder, 'derived')
+    for path in moved:
+        os.remove(path)
+        for derivative in glob.glob(os.path.join(glob.escape(derived_folder), glob.escape(os.path.basename(path)) + '.*')):
+            os.remove(derivative)
+
+
+def downgrade():
+    # Files stay in the sharded layout: the stored names are plain relative paths
+    # that the previous code serves and deletes as they are
+    with op.batch_alter_table('photos', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_photos_image_url'))
+    with op.batch_alter_table('pets', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_pets_pet_profile_photo'))
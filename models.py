@@ -4,9 +4,28 @@ Model class structure and relationships follow the guidelines from the SQLAlchem
 https://docs.sqlalchemy.org/en/20/orm/mapping_styles.html  
 """
 
-from datetime import datetime
+from datetime import datetime, timezone
 from extensions import db
 from flask_login import UserMixin
+from sqlalchemy.orm import validates
+
+# Characters of a log's content kept in Log.excerpt for the list of logs
+LOG_EXCERPT_LENGTH = 150
+
+
+def utcnow():
+    """Current UTC time without tzinfo, as the DateTime columns store it"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def log_excerpt(content):
+    """Start of a log's content on one line, cut at a word boundary"""
+    text = ' '.join((content or '').split())
+    if len(text) <= LOG_EXCERPT_LENGTH:
+        return text
+    cut = text[:LOG_EXCERPT_LENGTH]
+    return (cut.rsplit(' ', 1)[0] if ' ' in cut else cut) + '…'
+
 
 class User(db.Model, UserMixin):
     """User for database"""
@@ -15,6 +34,10 @@ class User(db.Model, UserMixin):
     username = db.Column(db.String(120), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     pw_hash = db.Column(db.String(120), nullable=False)
+    # Set when the user asks to delete the account; the data is purged in the background
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    # Bumped whenever the user or one of their pets changes (see page_versions.py)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     pets = db.relationship('Pet', backref='owner', lazy=True)
 
@@ -50,6 +73,10 @@ class Breed(db.Model):
 
     species = db.relationship('Species', back_populates='breeds', lazy='select')
 
+    __table_args__ = (
+        db.Index('ix_breeds_species_id_name', 'species_id', 'name', unique=True),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -62,8 +89,8 @@ class Pet(db.Model):
     """Pet general data"""
     __tablename__ = 'pets'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
-    pet_profile_photo = db.Column(db.String(200), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    pet_profile_photo = db.Column(db.String(200), nullable=True, index=True)
     name = db.Column(db.String(80), nullable=False)
     birth_date = db.Column(db.Date, nullable=True)
     adoption_date = db.Column(db.Date, nullable=True)
@@ -74,6 +101,8 @@ class Pet(db.Model):
     microchip_number = db.Column(db.String(50), nullable=True)
     insurance_company = db.Column(db.String(100), nullable=True)
     insurance_number = db.Column(db.String(50), nullable=True)
+    # Bumped whenever the pet or one of its photos, logs or tracker entries changes
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     species = db.relationship('Species', lazy='joined')
     breed = db.relationship('Breed', lazy='joined')
@@ -135,10 +164,14 @@ class Photo(db.Model):
     __tablename__ = 'photos'
     id = db.Column(db.Integer, primary_key=True)
     pet_id = db.Column(db.Integer, db.ForeignKey('pets.id'), nullable=False)
-    image_url = db.Column(db.String(200), nullable=False)
+    image_url = db.Column(db.String(200), nullable=False, index=True)
     title = db.Column(db.String(100))
     date_uploaded = db.Column(db.Date, nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_photos_pet_id_date_uploaded', 'pet_id', 'date_uploaded'),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -156,6 +189,17 @@ class Log(db.Model):
     title = db.Column(db.String(150))
     date_uploaded = db.Column(db.Date, nullable=False)
     content = db.Column(db.Text, nullable=False)
+    # Set with the content, so the list of logs never loads the content itself
+    excerpt = db.Column(db.String(LOG_EXCERPT_LENGTH + 1), nullable=False, default='', server_default='')
+
+    __table_args__ = (
+        db.Index('ix_logs_pet_id_date_uploaded', 'pet_id', 'date_uploaded'),
+    )
+
+    @validates('content')
+    def _set_excerpt(self, key, content):
+        self.excerpt = log_excerpt(content)
+        return content
 
     def to_dict(self):
         return {
@@ -175,6 +219,10 @@ class WeightTracker(db.Model):
     date = db.Column(db.Date, nullable=False)
     notes = db.Column(db.String(100), nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_weight_tracker_pet_id_date', 'pet_id', 'date'),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -195,6 +243,10 @@ class VaccineTracker(db.Model):
     administered_by = db.Column(db.String(150), nullable=True)
     notes = db.Column(db.String(100), nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_vaccine_tracker_pet_id_date', 'pet_id', 'date'),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -216,6 +268,10 @@ class InternalDewormingTracker(db.Model):
     next_dosis = db.Column(db.Date, nullable=True)
     notes = db.Column(db.String(100), nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_internal_deworming_tracker_pet_id_date', 'pet_id', 'date'),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -236,6 +292,10 @@ class ExternalDewormingTracker(db.Model):
     next_dosis = db.Column(db.Date, nullable=True)
     notes = db.Column(db.String(100), nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_external_deworming_tracker_pet_id_date', 'pet_id', 'date'),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -256,6 +316,10 @@ class MedicationTracker(db.Model):
     next_dosis = db.Column(db.Date, nullable=True)
     notes = db.Column(db.String(100), nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_medication_tracker_pet_id_date', 'pet_id', 'date'),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -264,4 +328,64 @@ class MedicationTracker(db.Model):
             "date": self.date.strftime('%Y-%m-%d'),
             "next_dosis": self.next_dosis.strftime('%Y-%m-%d') if self.next_dosis else None,
             "notes": self.notes,
-        }
\ No newline at end of file
+        }
+
+class OutboxEmail(db.Model):
+    """Email queued for delivery by the background dispatcher"""
+    __tablename__ = 'email_outbox'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    sender = db.Column(db.String(120), nullable=True)
+    subject = db.Column(db.String(200), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+    claim_token = db.Column(db.String(32), nullable=True, index=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+
+class AccountDeletionJob(db.Model):
+    """Background purge of a deleted account, resumable from its progress"""
+    __tablename__ = 'account_deletion_jobs'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # No foreign key: the user row is the last thing the job deletes
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    phase = db.Column(db.String(40), nullable=True)
+    pets_total = db.Column(db.Integer, nullable=True)
+    pets_deleted = db.Column(db.Integer, nullable=False, default=0)
+    rows_total = db.Column(db.Integer, nullable=True)
+    rows_deleted = db.Column(db.Integer, nullable=False, default=0)
+    files_queued = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    claim_token = db.Column(db.String(32), nullable=True, index=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    # Earliest retry after a failed attempt, None for a job never tried
+    next_attempt_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_account_deletion_jobs_status_claimed_at', 'status', 'claimed_at'),
+    )
+
+    def to_dict(self):
+        return {
+            "status": self.status,
+            "phase": self.phase,
+            "pets_total": self.pets_total,
+            "pets_deleted": self.pets_deleted,
+            "rows_total": self.rows_total,
+            "rows_deleted": self.rows_deleted,
+            "files_queued": self.files_queued,
+            "created_at": self.created_at.isoformat(timespec='seconds'),
+            "finished_at": self.finished_at.isoformat(timespec='seconds') if self.finished_at else None,
+        }
@@ -0,0 +1,187 @@
+"""
+Version counters and conditional GETs for the per-pet pages.
+
+`Pet.version` is bumped whenever the pet or one of its photos, logs or tracker
+entries is added, edited or deleted, and `User.version` whenever the user or one
+of their pets changes (the navbar lists them). Mapper events collect the changed
+ids during a flush and one `UPDATE ... SET version = version + 1` per table runs
+at the end of it, in the same transaction, so the counters never move without
+the data and every server process sees them.
+
+`versioned_page` builds a weak ETag from (user, user version, pet version,
+template version, day) with a single primary key lookup, before the view runs
+its queries, and answers a matching `If-None-Match` with 304 Not Modified.
+
+Conditional requests as in:
+https://developer.mozilla.org/en-US/docs/Web/HTTP/Conditional_requests
+"""
+
+import hashlib
+import os
+import threading
+from datetime import date
+from functools import wraps
+
+from flask import Response, current_app, make_response, request, session
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.orm import Session, object_session
+
+from extensions import db
+from models import (User, Pet, Photo, Log, WeightTracker, VaccineTracker, InternalDewormingTracker,
+                    ExternalDewormingTracker, MedicationTracker)
+
+# Rows shown on the pages of their pet
+VERSIONED_CHILD_MODELS = (Photo, Log, WeightTracker, VaccineTracker, InternalDewormingTracker,
+                          ExternalDewormingTracker, MedicationTracker)
+
+
+def bump_versions(session, pet_ids=(), user_ids=()):
+    """Bump the versions of these pets and users now (for bulk statements that skip mapper events)"""
+    connection = session.connection()
+    if pet_ids:
+        connection.execute(update(Pet.__table__).where(Pet.id.in_(sorted(pet_ids)))
+                           .values(version=Pet.version + 1))
+    if user_ids:
+        connection.execute(update(User.__table__).where(User.id.in_(sorted(user_ids)))
+                           .values(version=User.version + 1))
+
+
+def _ids(target, attribute):
+    """Current and previous value of a foreign key, a row moved to another parent changes both"""
+    history = inspect(target).attrs[attribute].history
+    return {getattr(target, attribute), *(history.deleted or ())} - {None}
+
+
+@event.listens_for(Pet, 'after_insert')
+@event.listens_for(Pet, 'after_update')
+@event.listens_for(Pet, 'after_delete')
+def _remember_changed_pet(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('versioned_pets', set()).add(target.id)
+        session.info.setdefault('versioned_users', set()).update(_ids(target, 'user_id'))
+
+
+@event.listens_for(User, 'after_update')
+def _remember_changed_user(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('versioned_users', set()).add(target.id)
+
+
+def _remember_changed_child(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('versioned_pets', set()).update(_ids(target, 'pet_id'))
+
+
+for _model in VERSIONED_CHILD_MODELS:
+    for _name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _name, _remember_changed_child)
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_flushed_versions(session, flush_context):
+    pet_ids = session.info.pop('versioned_pets', None)
+    user_ids = session.info.pop('versioned_users', None)
+    if pet_ids or user_ids:
+        bump_versions(session, pet_ids, user_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_versioned_rows(session):
+    session.info.pop('versioned_pets', None)
+    session.info.pop('versioned_users', None)
+
+
+class PageVersions:
+    """Computes page ETags and counts the requests answered with 304"""
+
+    def __init__(self):
+        self.app = None
+        self._template_version = None
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.not_modified = 0
+
+    def init_app(self, app):
+        app.config.setdefault('PAGE_ETAGS_ENABLED', True)
+        # Set it at deploy time to skip hashing the template and static file listings
+        app.config.setdefault('PAGE_TEMPLATE_VERSION', None)
+        self.app = app
+        app.extensions['page_versions'] = self
+
+    def _scan_templates(self):
+        digest = hashlib.blake2b(digest_size=6)
+        exclude = tuple(os.path.join(self.app.static_folder, prefix)
+                        for prefix in self.app.config.get('STATIC_FINGERPRINT_EXCLUDE', ()))
+        for folder in (os.path.join(self.app.root_path, self.app.template_folder), self.app.static_folder):
+            for root, dirs, files in os.walk(folder):
+                dirs.sort()
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    if path.startswith(exclude):
+                        continue
+                    stat = os.stat(path)
+                    digest.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+        return digest.hexdigest()
+
+    def template_version(self):
+        """Changes when a template or a static asset linked from the pages changes"""
+        configured = self.app.config['PAGE_TEMPLATE_VERSION']
+        if configured:
+            return configured
+        # Templates reload on change while debugging, so their listing is scanned on every request
+        if self._template_version is None or self.app.jinja_env.auto_reload:
+            self._template_version = self._scan_templates()
+        return self._template_version
+
+    def etag(self, user_id, pet_id):
+        """Weak ETag of a page of this pet, None if the user does not own it"""
+        versions = db.session.execute(
+            select(User.version, Pet.version)
+            .join(Pet, Pet.user_id == User.id)
+            .where(Pet.id == pet_id, User.id == user_id)
+        ).first()
+        if versions is None:
+            return None
+        user_version, pet_version = versions
+        # Ages and birthday countdowns change every day
+        return f"{user_id}.{user_version}-{pet_id}.{pet_version}-{self.template_version()}-{date.today():%Y%m%d}"
+
+    def stats(self):
+        with self._lock:
+            return {"checks": self.checks, "not_modified": self.not_modified}
+
+
+page_versions = PageVersions()
+
+
+def versioned_page(f):
+    """Decorate pet pages to answer If-None-Match with 304 while the pet and its user are unchanged"""
+    @wraps(f)
+    def decorated_function(pet_id, *args, **kwargs):
+        # Flash messages are shown once, a page carrying them must not be reused
+        if not current_app.config['PAGE_ETAGS_ENABLED'] or session.get('_flashes'):
+            return f(pet_id, *args, **kwargs)
+        etag = page_versions.etag(session.get("user_id"), pet_id)
+        if etag is None:
+            return f(pet_id, *args, **kwargs)
+
+        not_modified = request.if_none_match.contains_weak(etag)
+        with page_versions._lock:
+            page_versions.checks += 1
+            page_versions.not_modified += not_modified
+        if not_modified:
+            response = Response(status=304)
+        else:
+            response = make_response(f(pet_id, *args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+        # Kept by the browser and revalidated on every visit
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    return decorated_function
@@ -0,0 +1,184 @@
+"""
+Password hashing in a bounded pool of processes.
+
+scrypt, werkzeug's default, is slow and memory-hard on purpose. Each hash
+kept a web worker busy for tens of milliseconds, so a burst of logins took
+every CPU away from the pages of logged-in users. Hashes and password checks
+now run in `PASSWORD_POOL_SIZE` worker processes. At most
+`PASSWORD_POOL_MAX_PENDING` requests wait for them, and the next ones are
+turned away after `PASSWORD_HASH_TIMEOUT` seconds.
+
+New hashes use `PASSWORD_HASH_METHOD`, in werkzeug's format (`scrypt:n:r:p` or
+`pbkdf2:hash:iterations`). A stored hash made with other parameters is replaced
+on the user's next successful login, by the same worker call that checked it.
+
+Password hashes as in:
+https://werkzeug.palletsprojects.com/en/stable/utils/#module-werkzeug.security
+Process pools as in:
+https://docs.python.org/3/library/concurrent.futures.html#processpoolexecutor
+"""
+
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+from store_helpers import Counters
+
+
+class PasswordHashError(Exception):
+    """A password could not be hashed or checked in time"""
+
+
+def normalize_method(method):
+    """Hash method with all its parameters, as stored at the start of the hashes it makes"""
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        # Same defaults as werkzeug
+        n, r, p = args or (2 ** 15, 8, 1)
+        return f"scrypt:{int(n)}:{int(r)}:{int(p)}"
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = args[1] if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{int(iterations)}"
+    raise ValueError(f"Unsupported password hash method {method!r}")
+
+
+def hash_method(pw_hash):
+    return pw_hash.split('$', 1)[0]
+
+
+# Run in the worker processes
+def _generate(password, method, salt_length):
+    return generate_password_hash(password, method, salt_length)
+
+
+def _check(pw_hash, password, method, salt_length):
+    """Whether the password is right, and its new hash if it was hashed with other parameters"""
+    if not check_password_hash(pw_hash, password):
+        return False, None
+    if hash_method(pw_hash) == method:
+        return True, None
+    return True, generate_password_hash(password, method, salt_length)
+
+
+class PasswordPool(Counters):
+    """Bounded process pool hashing and checking passwords"""
+
+    def __init__(self, app=None):
+        self.method = normalize_method('scrypt')
+        self.salt_length = 16
+        self.size = 2
+        self.max_pending = 16
+        self.timeout = 10
+        self.start_method = None
+        self._lock = threading.Lock()
+        self._slots = None
+        self._executor = None
+        self.pending = 0
+        self.hashes = 0
+        self.checks = 0
+        self.rehashes = 0
+        self.rejected = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', self.method)
+        app.config.setdefault('PASSWORD_SALT_LENGTH', self.salt_length)
+        # 0 hashes on the request thread
+        app.config.setdefault('PASSWORD_POOL_SIZE', self.size)
+        # Requests hashing or waiting for a worker at once
+        app.config.setdefault('PASSWORD_POOL_MAX_PENDING', self.max_pending)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', self.timeout)
+        app.config.setdefault('PASSWORD_POOL_START_METHOD',
+                              'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+        self.method = normalize_method(app.config['PASSWORD_HASH_METHOD'])
+        self.salt_length = app.config['PASSWORD_SALT_LENGTH']
+        self.size = app.config['PASSWORD_POOL_SIZE']
+        self.max_pending = app.config['PASSWORD_POOL_MAX_PENDING']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        self.start_method = app.config['PASSWORD_POOL_START_METHOD']
+        app.extensions['password_pool'] = self
+
+    def _start(self):
+        with self._lock:
+            if self._slots is None:
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+                self._executor = self._new_executor()
+                atexit.register(self.shutdown)
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.size, mp_context=multiprocessing.get_context(self.start_method))
+
+    def _run(self, function, *args):
+        if not self.size:
+            return function(*args)
+        self._start()
+        if not self._slots.acquire(timeout=self.timeout):
+            self._count('rejected')
+            raise PasswordHashError("All password workers are busy")
+
+        self._count('pending')
+        executor = self._executor
+        try:
+            future = executor.submit(function, *args)
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # Not started yet: its place in the queue goes to the next request
+            future.cancel()
+            raise PasswordHashError(f"Password hashing timed out after {self.timeout}s") from None
+        except BrokenProcessPool as e:
+            # A worker died; the executor cannot be used again
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = self._new_executor()
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise PasswordHashError(f"Password worker died: {e}") from e
+        finally:
+            self._count('pending', -1)
+            self._slots.release()
+
+    def generate(self, password):
+        """Hash a new password"""
+        pw_hash = self._run(_generate, password, self.method, self.salt_length)
+        self._count('hashes')
+        return pw_hash
+
+    def check(self, pw_hash, password):
+        """
+        Whether `password` matches `pw_hash`, and the hash to store instead when
+        `pw_hash` was made with other parameters than PASSWORD_HASH_METHOD (else None).
+        """
+        valid, new_hash = self._run(_check, pw_hash, password, self.method, self.salt_length)
+        self._count('checks')
+        if new_hash is not None:
+            self._count('rehashes')
+        return valid, new_hash
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._slots = None
+        if executor is not None:
+            # Waits for the hashes already running, the queued ones are cancelled
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "method": self.method,
+                "size": self.size,
+                "pending": self.pending,
+                "hashes": self.hashes,
+                "checks": self.checks,
+                "rehashes": self.rehashes,
+                "rejected": self.rejected,
+            }
+
+
+password_pool = PasswordPool()
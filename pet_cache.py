@@ -0,0 +1,179 @@
+"""
+Cache of the pet list of every user.
+
+Almost every page draws the navbar dropdown from the current user's pets, and
+`Pet` eagerly joins its species and breed. The list is loaded once as small
+read-only summaries, kept per user (LRU with a short TTL so other server
+processes catch up), and dropped as soon as one of the user's pets, or the user
+itself, is added, edited or deleted. The same entry answers ownership checks and
+whether the account is still active (not tombstoned for deletion).
+
+Invalidation on commit follows the session events documented in:
+https://docs.sqlalchemy.org/en/20/orm/session_events.html
+"""
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, object_session
+
+from extensions import db
+from models import Pet, Species, Breed, User
+
+NamedRef = namedtuple('NamedRef', 'id name')
+
+
+class PetSummary:
+    """Read-only subset of a pet used by the navbar and the home page"""
+
+    __slots__ = ('id', 'name', 'pet_profile_photo', 'birth_date', 'sex', 'sterilized', 'species', 'breed')
+
+    def __init__(self, id, name, pet_profile_photo, birth_date, sex, sterilized, species, breed):
+        self.id = id
+        self.name = name
+        self.pet_profile_photo = pet_profile_photo
+        self.birth_date = birth_date
+        self.sex = sex
+        self.sterilized = sterilized
+        self.species = species
+        self.breed = breed
+
+    # Same calculations as the model, they only need birth_date
+    age = Pet.age
+    days_to_birthday = Pet.days_to_birthday
+
+
+def load_pet_summaries(user_id):
+    """The pets of a user, with species and breed names, in one query"""
+    rows = db.session.execute(
+        select(Pet.id, Pet.name, Pet.pet_profile_photo, Pet.birth_date, Pet.sex, Pet.sterilized,
+               Species.id, Species.name, Breed.id, Breed.name)
+        .join(Species, Pet.species_id == Species.id)
+        .outerjoin(Breed, Pet.breed_id == Breed.id)
+        .where(Pet.user_id == user_id)
+        .order_by(Pet.id)
+    )
+    return tuple(
+        PetSummary(pet_id, name, photo, birth_date, sex, sterilized,
+                   NamedRef(species_id, species_name),
+                   NamedRef(breed_id, breed_name) if breed_id is not None else None)
+        for pet_id, name, photo, birth_date, sex, sterilized, species_id, species_name, breed_id, breed_name in rows
+    )
+
+
+class PetListCache:
+    """Thread-safe LRU of (pet summaries, owned pet ids, account active) per user"""
+
+    def __init__(self, max_users=1024, ttl=60):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        app.config.setdefault('PET_LIST_CACHE_MAX_USERS', self.max_users)
+        app.config.setdefault('PET_LIST_CACHE_TTL', self.ttl)
+        self.max_users = app.config['PET_LIST_CACHE_MAX_USERS']
+        self.ttl = app.config['PET_LIST_CACHE_TTL']
+        app.extensions['pet_list_cache'] = self
+
+    def _lookup(self, user_id, refresh=False):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and not refresh and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            generation = self._generation
+
+        # Deleted (tombstoned) or unknown users have no pets to show
+        active = bool(db.session.scalar(select(User.deleted_at.is_(None)).where(User.id == user_id)))
+        pets = load_pet_summaries(user_id) if active else ()
+        entry = (time.monotonic(), pets, frozenset(pet.id for pet in pets), active)
+        with self._lock:
+            # Skip storing if an invalidation happened while we were reading
+            if generation == self._generation:
+                self._entries[user_id] = entry
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_users:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def pets(self, user_id):
+        """Pet summaries of a user"""
+        if user_id is None:
+            return ()
+        return self._lookup(user_id)[1]
+
+    def is_active(self, user_id):
+        """False once the account is deleted or tombstoned"""
+        if user_id is None:
+            return False
+        return self._lookup(user_id)[3]
+
+    def owns(self, user_id, pet_id):
+        """True if the pet belongs to the user"""
+        if user_id is None:
+            return False
+        if pet_id in self._lookup(user_id)[2]:
+            return True
+        # The pet may have been created by another server process: check once more
+        return pet_id in self._lookup(user_id, refresh=True)[2]
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"users": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+pet_list_cache = PetListCache()
+
+
+def mark_pets_changed(session, user_ids):
+    """Drop the pet lists of these users when session commits (for bulk statements that skip mapper events)"""
+    session.info.setdefault('pet_list_users', set()).update(user_ids)
+
+
+@event.listens_for(Pet, 'after_insert')
+@event.listens_for(Pet, 'after_update')
+@event.listens_for(Pet, 'after_delete')
+def _remember_changed_pet(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        # A pet moved to another user changes both lists
+        history = inspect(target).attrs.user_id.history
+        mark_pets_changed(session, {target.user_id, *(history.deleted or ())})
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _remember_changed_user(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        mark_pets_changed(session, (target.id,))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_pet_lists(session):
+    for user_id in session.info.pop('pet_list_users', ()):
+        pet_list_cache.invalidate_user(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('pet_list_users', None)
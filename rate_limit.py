@@ -0,0 +1,213 @@
+"""
+Token-bucket rate limits for the authentication endpoints.
+
+Every login, registration and password reset request costs a slow password
+hash or an email. A credential-stuffing run or a client retrying in a loop
+could take the whole app down. Each of these endpoints now has two buckets per
+request, one for the client IP and one for the email address given. A request
+takes one token from each, and tokens come back at a steady rate up to the
+bucket's capacity (`RATE_LIMITS`). A request finding a bucket empty is answered
+429 before any hash or email work starts, and takes no token from the others:
+a flood aimed at one email must not drain the bucket of the IP it comes from.
+
+The buckets live in a small SQLite table of their own (`RATE_LIMIT_DB_PATH`),
+shared by every worker process. A check reads all the buckets of the request
+and, only when each has a token, refills and decrements them with UPSERTs, all
+in one IMMEDIATE transaction. When a bucket is empty, the worker remembers the
+key until it has refilled, so the requests of a flood are rejected by a
+dictionary lookup without touching the database. Only the keyed BLAKE2 digest
+of the IP or email is stored.
+
+The IP is `request.remote_addr`. Behind a reverse proxy that is the proxy's
+address, so the app must be wrapped with werkzeug's ProxyFix there.
+
+Token bucket as in:
+https://en.wikipedia.org/wiki/Token_bucket
+Upserts and immediate transactions as in:
+https://www.sqlite.org/lang_upsert.html
+https://www.sqlite.org/lang_transaction.html
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+from store_helpers import Counters, SqliteConnections
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS rate_limits ("
+    "key BLOB PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS ix_rate_limits_updated_at ON rate_limits (updated_at)",
+)
+
+# Refill the bucket for the time since its last use, then take a token
+TAKE_TOKEN_SQL = (
+    "INSERT INTO rate_limits (key, tokens, updated_at) VALUES (:key, :capacity - 1, :now) "
+    "ON CONFLICT (key) DO UPDATE SET "
+    "tokens = min(:capacity, tokens + (:now - updated_at) * :rate) - 1, updated_at = :now"
+)
+
+# Tokens per bucket and seconds for an empty bucket to refill, per endpoint and key
+DEFAULT_RATE_LIMITS = {
+    'login': {'ip': (20, 60), 'email': (10, 300)},
+    'register': {'ip': (5, 3600), 'email': (3, 3600)},
+    'restore_password': {'ip': (5, 3600), 'email': (3, 3600)},
+}
+# Empty buckets remembered per process at most
+MAX_BLOCKED = 100_000
+
+
+class RateLimiter(Counters):
+    """Token buckets per endpoint, IP and email, shared by the worker processes through SQLite"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = True
+        self.limits = {}
+        self._secret = b''
+        # Buckets lost on power failure only refill early
+        self._connections = SqliteConnections(SCHEMA, timeout=5, synchronous='OFF')
+        self._blocked = {}
+        self._lock = threading.Lock()
+        self._next_sweep = 0
+        self.allowed = 0
+        self.limited = 0
+        self.limited_locally = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATE_LIMIT_ENABLED', True)
+        app.config.setdefault('RATE_LIMIT_DB_PATH', os.path.join(app.instance_path, 'rate_limits.db'))
+        app.config.setdefault('RATE_LIMITS', DEFAULT_RATE_LIMITS)
+        # Seconds between removals of the buckets that have refilled
+        app.config.setdefault('RATE_LIMIT_SWEEP_INTERVAL', 300)
+
+        self.app = app
+        self.enabled = app.config['RATE_LIMIT_ENABLED']
+        # (capacity, tokens per second) of each bucket
+        self.limits = {
+            (endpoint, kind): (capacity, capacity / seconds)
+            for endpoint, buckets in app.config['RATE_LIMITS'].items()
+            for kind, (capacity, seconds) in buckets.items()
+        }
+        self._secret = hashlib.sha256(f"rate-limit:{app.secret_key}".encode()).digest()
+        # Empty buckets seen with another database or limits mean nothing now
+        with self._lock:
+            self._blocked = {}
+        app.extensions['rate_limiter'] = self
+
+    def _connection(self):
+        """This thread's connection to the rate limit database"""
+        return self._connections.get(self.app.config['RATE_LIMIT_DB_PATH'])
+
+    def _key(self, endpoint, kind, value):
+        return hashlib.blake2b(f"{endpoint}\0{kind}\0{value}".encode(), digest_size=16, key=self._secret).digest()
+
+    def check(self, endpoint, **values):
+        """
+        Take a token from the bucket of every `kind=value` given for `endpoint`
+        (e.g. ip=..., email=...), or from none of them when one is empty.
+        Returns None when the request may go ahead, else the seconds until it
+        may be retried.
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+        buckets = {}
+        for kind, value in values.items():
+            if value is None or (endpoint, kind) not in self.limits:
+                continue
+            key = self._key(endpoint, kind, value.lower() if kind == 'email' else value)
+            buckets[key] = self.limits[endpoint, kind]
+
+        # Known to be empty in this process: no database round trip
+        retry_after = self._remembered(buckets, now)
+        if retry_after:
+            self._count('limited_locally')
+            return retry_after
+
+        retry_after = self._take(buckets, now) if buckets else None
+        if retry_after:
+            self._count('limited')
+            return retry_after
+
+        self._count('allowed')
+        if now >= self._next_sweep:
+            self._sweep(now)
+        return None
+
+    def _remembered(self, buckets, now):
+        """Seconds until the buckets this process knows to be empty have a token again"""
+        retry_after = None
+        for key in buckets:
+            until = self._blocked.get(key)
+            if until is None:
+                continue
+            if until > now:
+                retry_after = max(retry_after or 0, until - now)
+            else:
+                self._blocked.pop(key, None)
+        return retry_after
+
+    def _take(self, buckets, now):
+        """
+        Take a token from each of `buckets` ({key: (capacity, rate)}) if all
+        have one, else remember the empty ones and return the longest wait
+        """
+        connection = self._connection()
+        keys = list(buckets)
+        # Hold the write lock from the read to the takes, so no other process
+        # spends the tokens in between
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            stored = connection.execute(
+                f"SELECT key, tokens, updated_at FROM rate_limits WHERE key IN ({', '.join('?' * len(keys))})",
+                keys,
+            ).fetchall()
+            empty = {}
+            for key, tokens, updated_at in stored:
+                capacity, rate = buckets[key]
+                tokens = min(capacity, tokens + (now - updated_at) * rate)
+                if tokens < 1:
+                    empty[key] = (1 - tokens) / rate
+            if not empty:
+                connection.executemany(TAKE_TOKEN_SQL, [
+                    {"key": key, "capacity": capacity, "rate": rate, "now": now}
+                    for key, (capacity, rate) in buckets.items()
+                ])
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        if not empty:
+            return None
+        with self._lock:
+            if len(self._blocked) + len(empty) > MAX_BLOCKED:
+                self._blocked.clear()
+            for key, retry_after in empty.items():
+                self._blocked[key] = now + retry_after
+        return max(empty.values())
+
+    def _sweep(self, now):
+        """Forget the buckets full again, which behave like missing ones"""
+        self._next_sweep = now + self.app.config['RATE_LIMIT_SWEEP_INTERVAL']
+        longest_refill = max((capacity / rate for capacity, rate in self.limits.values()), default=0)
+        self._connection().execute("DELETE FROM rate_limits WHERE updated_at < ?", (now - longest_refill,))
+        with self._lock:
+            self._blocked = {key: until for key, until in self._blocked.items() if until > now}
+
+    def stats(self):
+        buckets = self._connection().execute("SELECT count(*) FROM rate_limits").fetchone()[0]
+        with self._lock:
+            return {
+                "buckets": buckets,
+                "blocked_locally": len(self._blocked),
+                "allowed": self.allowed,
+                "limited": self.limited,
+                "limited_locally": self.limited_locally,
+            }
+
+
+rate_limiter = RateLimiter()
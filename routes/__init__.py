@@ -11,6 +11,8 @@ from .pet_routes import pet_bp
 from .gallery_routes import gallery_bp
 from .logs_routes import logs_bp
 from .trackers_routes import trackers_bp
+from .search_routes import search_bp
+from .ops_routes import ops_bp
 
 def register_routes(app: Flask):
     """Register all Blueprints with the Flask app."""
@@ -20,3 +22,5 @@ def register_routes(app: Flask):
     app.register_blueprint(gallery_bp)
     app.register_blueprint(logs_bp)
     app.register_blueprint(trackers_bp)
+    app.register_blueprint(search_bp)
+    app.register_blueprint(ops_bp)
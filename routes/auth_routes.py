@@ -1,36 +1,71 @@
+import math
 import os
-import logging
-from smtplib import SMTPException
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, session
-from werkzeug.security import check_password_hash, generate_password_hash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, session, jsonify, make_response
 from itsdangerous import URLSafeTimedSerializer as Serializer, BadSignature, SignatureExpired
-from flask_mail import Message
 
-from models import User, Pet
+from models import User, AccountDeletionJob
 from forms import LoginForm, RegisterForm, ResetPasswordForm, RestorePasswordForm
-from helpers import error_message, delete_pet_from_db, login_required
+from helpers import error_message, login_required
+from mail_outbox import enqueue_email
+from account_deletion import request_account_deletion
+from password_pool import password_pool, PasswordHashError
+from rate_limit import rate_limiter
+from serializers import USER_EXPORT, json_response
 
 
 auth_bp = Blueprint('auth', __name__)
 
+BUSY_MESSAGE = "Too many people are signing in right now. Please try again in a moment."
+
+
+def too_many_requests(retry_after):
+    """429 apology telling the client when it may try again"""
+    response = make_response(*error_message("Too many attempts. Please wait a moment and try again.", 429))
+    response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     """Log user in"""
-    # Forget any user_id
-    session.clear()
+    # Forget any user_id; anonymous visitors keep their session unwritten
+    if "user_id" in session:
+        session.clear()
     form = LoginForm()
 
     # User reached route via POST
     if request.method == "POST" and form.validate_on_submit():
         email = form.email.data
         password = form.password.data
+
+        # Limit attempts per IP and per email before any password is checked
+        retry_after = rate_limiter.check('login', ip=request.remote_addr, email=email)
+        if retry_after:
+            return too_many_requests(retry_after)
+
         user = User.query.filter_by(email=email).first()
 
-        # Ensure username exists and password is correct
-        if not user or not check_password_hash(user.pw_hash, password):
+        # Ensure username exists and is not being deleted
+        if not user or user.deleted_at is not None:
             return error_message("Invalid email &/or password", 403)
 
-        # Remember which user has logged in
+        # Ensure password is correct, checked in the password pool
+        try:
+            valid, new_hash = password_pool.check(user.pw_hash, password)
+        except PasswordHashError as e:
+            current_app.logger.error("Password check failed: %s", e)
+            return error_message(BUSY_MESSAGE, 503)
+        if not valid:
+            return error_message("Invalid email &/or password", 403)
+
+        # Hashed with older parameters: store the hash made with the current ones
+        if new_hash is not None:
+            db = current_app.extensions['sqlalchemy']
+            user.pw_hash = new_hash
+            db.session.commit()
+
+        # Remember which user has logged in, under a new session id
+        session.clear()
         session["user_id"] = user.id
 
         # Redirect user to home page
@@ -52,8 +87,9 @@ def logout():
 @auth_bp.route("/register", methods=["GET", "POST"])
 def register():
     """Register user"""
-    # Forget any user_id
-    session.clear()
+    # Forget any user_id; anonymous visitors keep their session unwritten
+    if "user_id" in session:
+        session.clear()
     form = RegisterForm()
 
     # User reached route via POST
@@ -63,6 +99,11 @@ def register():
         password = form.password.data
         confirmation = form.confirmation.data
 
+        # Limit registrations per IP and per email before any hashing or email
+        retry_after = rate_limiter.check('register', ip=request.remote_addr, email=email)
+        if retry_after:
+            return too_many_requests(retry_after)
+
         # Check if email already exists
         existing_user = User.query.filter_by(email=email).first()
         if existing_user:
@@ -73,12 +114,17 @@ def register():
             return error_message("Passwords must match.", 400)
 
         # Hash the user's password
-        pw_hash = generate_password_hash(password)
+        try:
+            pw_hash = password_pool.generate(password)
+        except PasswordHashError as e:
+            current_app.logger.error("Password hashing failed: %s", e)
+            return error_message(BUSY_MESSAGE, 503)
 
         # Store username and hashed pw temporarily in session for confirmation
         session['username'] = username
         session['password'] = pw_hash
 
+        db = current_app.extensions['sqlalchemy']
         try:
             # Generate token and send email
             s = Serializer(current_app.secret_key)
@@ -89,22 +135,15 @@ def register():
             html = render_template('email_confirmation.html', confirm_url=confirm_url)
             subject = "Confirm your email"
 
-            logging.basicConfig(level=logging.DEBUG)
-            mail = current_app.extensions['mail']
-
-            # Send the confirmation email
-            msg = Message(subject, sender=os.getenv("PETPAL_EMAIL"), recipients=[email])
-            msg.html = html
-            mail.send(msg)
+            # Queue the confirmation email, the outbox dispatcher delivers it in the background
+            enqueue_email(email, subject, html, sender=os.getenv("PETPAL_EMAIL"))
+            db.session.commit()
 
             flash("A confirmation email has been sent. Please check your inbox and your spam folder.", "info")
             return redirect("/")
-        
-        except SMTPException as e:
-            current_app.logger.error("SMTP error: %s", e)
-            return error_message("An error occurred while sending the email. Please try again later.", 500)
-        
+
         except Exception as e:
+            db.session.rollback()
             current_app.logger.error("Unexpected error: %s", e)
             session.clear()  # Clean up session on failure
             return error_message("An unexpected error occurred. Please try again later.", 500)
@@ -155,6 +194,12 @@ def restore_password():
 
     if request.method == "POST" and form.validate_on_submit():
         email = form.email.data
+
+        # Limit reset emails per IP and per email
+        retry_after = rate_limiter.check('restore_password', ip=request.remote_addr, email=email)
+        if retry_after:
+            return too_many_requests(retry_after)
+
         user = User.query.filter_by(email=email).first()
 
         if not user:
@@ -175,18 +220,18 @@ def restore_password():
         html = render_template('password_reset_email.html', reset_url=reset_url)
         subject = "Password Reset Request"
 
+        db = current_app.extensions['sqlalchemy']
         try:
-            # Send the password reset email
-            mail = current_app.extensions['mail']
-            msg = Message(subject, sender=os.getenv("PETPAL_EMAIL"), recipients=[email])
-            msg.html = html
-            mail.send(msg)
+            # Queue the password reset email
+            enqueue_email(email, subject, html, sender=os.getenv("PETPAL_EMAIL"))
+            db.session.commit()
 
             flash("A password reset link has been sent to your email address. Please check your inbox.", "info")
             return redirect("/")
 
         except Exception as e:
-            current_app.logger.error("Error sending password reset email: %s", e)
+            db.session.rollback()
+            current_app.logger.error("Error queuing password reset email: %s", e)
             return error_message("An error occurred while sending the email. Please try again.", 500)
 
     return render_template("restore_password.html", form=form)
@@ -216,7 +261,11 @@ def reset_password(token):
             return redirect("/restore_password")
 
         # Update password hash
-        user.pw_hash = generate_password_hash(new_password)
+        try:
+            user.pw_hash = password_pool.generate(new_password)
+        except PasswordHashError as e:
+            current_app.logger.error("Password hashing failed: %s", e)
+            return error_message(BUSY_MESSAGE, 503)
         db.session.commit()
 
         flash("Your password has been reset successfully!", "success")
@@ -224,33 +273,37 @@ def reset_password(token):
 
     return render_template("reset_password.html", form=form)
 
+@auth_bp.route("/export_data", methods=["GET"])
+@login_required
+def export_data():
+    """Download the user's account, pets, photos and logs as JSON."""
+    # One query per relationship level instead of one per pet
+    user = USER_EXPORT.query().filter_by(id=session["user_id"]).first_or_404()
+    export, = USER_EXPORT.encode_many([user])
+    response = json_response(export)
+    response.headers['Content-Disposition'] = 'attachment; filename=petpal-export.json'
+    return response
+
 @auth_bp.route("/delete_user/<int:user_id>", methods=["GET"])
 @login_required
 def delete_user(user_id):
-    """Delete a user and all their pets from the database."""
+    """Tombstone the user now and purge all their data in the background."""
     db = current_app.extensions['sqlalchemy']
     
-    # Fetch user by ID
+    # Only the logged-in user can delete their own account
+    if user_id != session.get("user_id"):
+        return error_message("Invalid route", 404)
     user = User.query.get_or_404(user_id)
     
     try:
-        # Delete all pets associated with this user
-        pets = Pet.query.filter_by(user_id=user_id).all()
-
-        # Iterate over each pet and delete it
-        for pet in pets:
-            delete_pet_from_db(pet, db)
-        
-        # Commit deletion of all pets
-        db.session.commit()
-
-        # Now delete the user
-        db.session.delete(user)
+        # Hides the account and its pets at once; the purge job runs in chunks
+        job = request_account_deletion(user)
         db.session.commit()
 
-        flash('User and all their pets have been deleted successfully.', 'success')
+        flash('Your account has been deleted. Your pets and photos are being removed.', 'success')
         session.clear()
-        return redirect(url_for('home.welcome'))
+        token = Serializer(current_app.secret_key).dumps(job.id, salt='account-deletion')
+        return redirect(url_for('auth.account_deletion', token=token))
     
     except Exception as e:
         db.session.rollback()
@@ -258,3 +311,28 @@ def delete_user(user_id):
         flash(f'Error deleting user: {str(e)}', 'danger')
 
     return redirect('/')
+
+
+def deletion_job(token):
+    """Deletion job of a signed status token, None if the token is invalid"""
+    try:
+        job_id = Serializer(current_app.secret_key).loads(token, salt='account-deletion', max_age=7 * 24 * 3600)
+    except (BadSignature, SignatureExpired):
+        return None
+    return AccountDeletionJob.query.get(job_id)
+
+@auth_bp.route("/account_deletion/<token>", methods=["GET"])
+def account_deletion(token):
+    """Progress page of an account deletion."""
+    job = deletion_job(token)
+    if job is None:
+        return error_message("Invalid route", 404)
+    return render_template("account_deletion.html", job=job, status_url=url_for('auth.account_deletion_status', token=token))
+
+@auth_bp.route("/account_deletion/<token>.json", methods=["GET"])
+def account_deletion_status(token):
+    """Progress of an account deletion as JSON."""
+    job = deletion_job(token)
+    if job is None:
+        return jsonify({"error": "not found"}), 404
+    return jsonify(job.to_dict())
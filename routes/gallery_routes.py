@@ -1,23 +1,51 @@
-import os
 from flask import Blueprint, render_template, request, flash, redirect, current_app, url_for
-from werkzeug.utils import secure_filename
+from sqlalchemy import select
 
 from models import Pet, Photo
 from forms import PhotoForm
-from helpers import allowed_photo_file, inject_pets, login_required, owned_pet
+from helpers import allowed_photo_file, inject_pets, login_required, owned_pet, keyset_page
+from serializers import PHOTO, json_response
+from upload_store import UnsupportedUpload, release_uploads, store_upload
+from thumbnails import queue_derivatives
+from page_versions import versioned_page
 
 gallery_bp = Blueprint('gallery', __name__)
 
+# Photos rendered with the page and per request of the infinite scroll
+GALLERY_PAGE_SIZE = 24
+
+def gallery_page(pet_id, cursor=None):
+    """One page of a pet's photos, newest first"""
+    return keyset_page(Photo.query.filter_by(pet_id=pet_id), Photo.date_uploaded, Photo.id, cursor, GALLERY_PAGE_SIZE)
+
 @gallery_bp.route("/gallery/<int:pet_id>", methods=['GET'])
 @login_required
+@versioned_page
 @inject_pets
 def gallery(pet_id):
     """Display pet gallery"""
     pet = Pet.query.get_or_404(pet_id)
     owned_pet(pet)
-    photos = Photo.query.filter_by(pet_id=pet_id).order_by(Photo.date_uploaded.desc()).all()
-    photo_data = [photo.to_dict() for photo in photos]
-    return render_template('gallery.html', pet=pet,  photos=photo_data)
+    # Only the first page, the rest is fetched while scrolling
+    photos, next_cursor = gallery_page(pet_id)
+    photo_data = PHOTO.encode_many(photos)
+    return render_template('gallery.html', pet=pet,  photos=photo_data, next_cursor=next_cursor)
+
+@gallery_bp.route("/gallery/<int:pet_id>/photos", methods=['GET'])
+@login_required
+@versioned_page
+def gallery_photos(pet_id):
+    """Next page of the gallery as an HTML fragment in JSON, for the infinite scroll"""
+    # Answered from the cached pet list, only the pet's name is loaded for the alt texts
+    not_owner = owned_pet(pet_id)
+    if not_owner:
+        return not_owner
+
+    db = current_app.extensions['sqlalchemy']
+    photos, next_cursor = gallery_page(pet_id, request.args.get('cursor'))
+    html = render_template('gallery_photos.html', photos=PHOTO.encode_many(photos),
+                           pet_name=db.session.scalar(select(Pet.name).where(Pet.id == pet_id)))
+    return json_response({"html": html, "next_cursor": next_cursor})
 
 @gallery_bp.route("/upload_photo/<int:pet_id>", methods=['GET', 'POST'])
 @login_required
@@ -36,12 +64,13 @@ def upload_photo(pet_id):
 
             # Handling the uploaded pet photo
             if form.image.data and allowed_photo_file(form.image.data.filename):
-                image = form.image.data
-                filename = secure_filename(image.filename)
-                image_url = filename
-                photo_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                image.save(photo_path)
-                
+                try:
+                    image_url = store_upload(form.image.data, current_app.config['UPLOAD_FOLDER'], db.session)
+                except UnsupportedUpload as e:
+                    flash(str(e), 'danger')
+                    return render_template('upload_photo.html', pet=pet, form=form)
+                queue_derivatives(db.session, [image_url])
+
             else:
                 image_url = None
 
@@ -68,13 +97,8 @@ def delete_photo(photo_id):
     photo = Photo.query.get_or_404(photo_id)
     db = current_app.extensions['sqlalchemy']
 
-    if photo.image_url:
-        try:
-            photo_path = os.path.join(current_app.config['UPLOAD_FOLDER'], photo.image_url)
-            os.remove(photo_path)
-        except FileNotFoundError:
-            flash('Photo file not found.', 'danger')
-            return redirect(url_for('gallery.gallery', pet_id=photo.pet_id))
+    # The file is removed in the background once no other photo or pet uses it
+    release_uploads(db.session, [photo.image_url])
     
     # Delete from database
     db.session.delete(photo)
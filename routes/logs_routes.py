@@ -1,21 +1,48 @@
 from flask import Blueprint, render_template, request, current_app, flash, redirect, url_for
+from sqlalchemy.orm import defer
 
-from helpers import login_required, inject_pets, owned_pet
+from helpers import login_required, inject_pets, owned_pet, keyset_page
 from models import Pet, Log
 from forms import EntryForm
+from serializers import json_response
+from page_versions import versioned_page
 
 logs_bp = Blueprint('logs', __name__)
 
+# Logs rendered with the page and per request of the infinite scroll
+LOGS_PAGE_SIZE = 20
+
+def logs_page(pet_id, cursor=None):
+    """One page of a pet's logs, newest first, with their excerpts instead of the content"""
+    # Raises instead of loading the content one log at a time if a template asks for it
+    query = Log.query.filter_by(pet_id=pet_id).options(defer(Log.content, raiseload=True))
+    return keyset_page(query, Log.date_uploaded, Log.id, cursor, LOGS_PAGE_SIZE)
+
 @logs_bp.route('/logs/<int:pet_id>', methods=['GET'])
 @login_required
+@versioned_page
 @inject_pets
 def pet_logs(pet_id):
     """Display logs"""
     pet = Pet.query.get_or_404(pet_id)
     owned_pet(pet)
-    logs = Log.query.filter_by(pet_id=pet_id).order_by(Log.date_uploaded.desc()).all()
+    # Only the first page, the rest is fetched while scrolling
+    logs, next_cursor = logs_page(pet_id)
+
+    return render_template('logs.html', pet=pet, logs=logs, next_cursor=next_cursor)
+
+@logs_bp.route('/logs/<int:pet_id>/entries', methods=['GET'])
+@login_required
+@versioned_page
+def log_entries(pet_id):
+    """Next page of the logs as an HTML fragment in JSON, for the infinite scroll"""
+    not_owner = owned_pet(pet_id)
+    if not_owner:
+        return not_owner
 
-    return render_template('logs.html', pet=pet, logs=logs)
+    logs, next_cursor = logs_page(pet_id, request.args.get('cursor'))
+    html = render_template('log_entries.html', logs=logs)
+    return json_response({"html": html, "next_cursor": next_cursor})
 
 @logs_bp.route('/new_entry/<int:pet_id>', methods=['GET', 'POST'])
 @login_required
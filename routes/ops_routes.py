@@ -0,0 +1,39 @@
+import hmac
+from functools import wraps
+from flask import Blueprint, current_app, jsonify, request
+
+from helpers import error_message
+
+ops_bp = Blueprint('ops', __name__, url_prefix='/ops')
+
+
+def ops_token_required(f):
+    """
+    Only answer operational endpoints to requests sending `OPS_STATS_TOKEN` as a bearer token.
+    The client address proves nothing behind a reverse proxy; without a token the endpoints are off.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = current_app.config.get('OPS_STATS_TOKEN')
+        sent = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not token or not hmac.compare_digest(sent.encode(), token.encode()):
+            return error_message("Invalid route", 404)
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+@ops_bp.route('/stats', methods=['GET'])
+@ops_token_required
+def stats():
+    """Counters of every registered component with a `stats()` method, by extension name"""
+    components = {}
+    for name, extension in sorted(current_app.extensions.items()):
+        if not callable(getattr(extension, 'stats', None)):
+            continue
+        try:
+            components[name] = extension.stats()
+        except Exception as e:
+            # One broken component (e.g. its database is locked) must not hide the others
+            current_app.logger.warning("Could not read the stats of %s: %s", name, e)
+            components[name] = {"error": str(e)}
+    return jsonify(components)
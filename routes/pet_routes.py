@@ -1,8 +1,11 @@
-import os
-from flask import Blueprint, render_template, request, redirect, flash, current_app, session, jsonify
-from werkzeug.utils import secure_filename
+import hashlib
+from flask import Blueprint, render_template, request, redirect, flash, current_app, session, jsonify, Response
 
-from models import Pet, Breed, Species
+from models import Pet
+from breed_catalog import breed_catalog
+from upload_store import UnsupportedUpload, release_uploads, store_upload
+from thumbnails import queue_derivatives
+from page_versions import versioned_page
 from forms import PetForm
 from helpers import error_message, allowed_photo_file, inject_pets, login_required, delete_pet_from_db, owned_pet
 
@@ -16,10 +19,11 @@ def add_new_pet():
     form = PetForm()
     db = current_app.extensions['sqlalchemy']
 
-    # Populate species and breed choices dynamically
-    form.species.choices = [(species.id, species.name) for species in Species.query.all()]
+    # Populate species and breed choices from the in-memory catalog
+    catalog = breed_catalog.get()
+    form.species.choices = catalog.species_choices()
     if form.species.data:
-        form.breed.choices = [(breed.id, breed.name) for breed in Breed.query.filter_by(species_id=form.species.data).all()]
+        form.breed.choices = catalog.breed_choices(form.species.data)
     
     # User reached route via POST
     if request.method == 'POST':
@@ -38,11 +42,11 @@ def add_new_pet():
 
             # Handling the uploaded pet profile photo
             if form.pet_profile_photo.data and allowed_photo_file(form.pet_profile_photo.data.filename):
-                photo = form.pet_profile_photo.data
-                filename = secure_filename(photo.filename)
-                pet_profile_photo = filename
-                photo_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                photo.save(photo_path)
+                try:
+                    pet_profile_photo = store_upload(form.pet_profile_photo.data, current_app.config['UPLOAD_FOLDER'], db.session)
+                except UnsupportedUpload as e:
+                    return error_message(str(e), 400)
+                queue_derivatives(db.session, [pet_profile_photo])
                 
             else:
                 pet_profile_photo = None
@@ -71,14 +75,16 @@ def add_new_pet():
             return error_message("An error occurred. Please try again.", form.errors)
         
     # User reached route via GET
-    return render_template('new_pet.html', form=form)
+    return render_template('new_pet.html', form=form, catalog_version=catalog.version)
 
 @pet_bp.route('/delete_pet/<int:pet_id>', methods=['GET'])
 @login_required
 def delete_pet(pet_id):
     """Delete a pet from db"""
     pet = Pet.query.get_or_404(pet_id)
-    owned_pet(pet)
+    not_owner = owned_pet(pet)
+    if not_owner:
+        return not_owner
     db = current_app.extensions['sqlalchemy']
     
     try:
@@ -103,10 +109,11 @@ def edit_pet(pet_id):
     form = PetForm(obj=pet)
     db = current_app.extensions['sqlalchemy']
 
-    # Populate species and breed choices dynamically
-    form.species.choices = [(species.id, species.name) for species in Species.query.all()]
+    # Populate species and breed choices from the in-memory catalog
+    catalog = breed_catalog.get()
+    form.species.choices = catalog.species_choices()
     if form.species.data:
-        form.breed.choices = [(breed.id, breed.name) for breed in Breed.query.filter_by(species_id=form.species.data).all()]
+        form.breed.choices = catalog.breed_choices(form.species.data)
     
     if form.validate_on_submit():
         try:
@@ -121,18 +128,13 @@ def edit_pet(pet_id):
             pet.insurance_company = form.insurance_company.data
             pet.insurance_number = form.insurance_number.data
             if form.pet_profile_photo.data:
-                # Delete old photo if it exists
+                # Delete old photo if it exists and nothing else uses it, once the change is committed
                 if pet.pet_profile_photo and allowed_photo_file(form.pet_profile_photo.data.filename):
-                    old_photo_path = os.path.join(current_app.config['UPLOAD_FOLDER'], pet.pet_profile_photo)
-                    if os.path.exists(old_photo_path):
-                        os.remove(old_photo_path)
+                    release_uploads(db.session, [pet.pet_profile_photo])
                 
                 # Save new photo
-                photo = form.pet_profile_photo.data
-                filename = secure_filename(photo.filename)
-                pet.pet_profile_photo = filename
-                photo_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                photo.save(photo_path)
+                pet.pet_profile_photo = store_upload(form.pet_profile_photo.data, current_app.config['UPLOAD_FOLDER'], db.session)
+                queue_derivatives(db.session, [pet.pet_profile_photo])
 
             db.session.commit()
             flash('Pet information updated successfully!', 'success')
@@ -155,18 +157,36 @@ def edit_pet(pet_id):
         form.microchip_number.data = pet.microchip_number
         form.insurance_company.data = pet.insurance_company
         form.insurance_number.data = pet.insurance_number
-    return render_template('edit_pet.html', form=form, pet=pet)
+    return render_template('edit_pet.html', form=form, pet=pet, catalog_version=catalog.version)
 
 @pet_bp.route('/get_breeds/<int:species_id>', methods=['GET'])
 @login_required
 def get_breeds(species_id):
-    """Show breed list"""
-    breeds = Breed.query.filter_by(species_id=species_id).all()
-    breed_data = [{"id": breed.id, "name": breed.name} for breed in breeds]
-    return jsonify(breed_data)
+    """Show breed list, or the breeds matching ?q= for typeahead"""
+    catalog = breed_catalog.get()
+    query = request.args.get('q', '')
+    if query:
+        breeds = catalog.search(query, species_id)
+        etag = f"{catalog.etag(species_id)}-{hashlib.blake2b(query.lower().encode(), digest_size=8).hexdigest()}"
+    else:
+        breeds = catalog.breeds(species_id)
+        etag = catalog.etag(species_id)
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify([{"id": breed.id, "name": breed.name} for breed in breeds])
+    response.set_etag(etag)
+    # Versioned URLs (?v=) never change, unversioned ones are revalidated daily
+    if request.args.get('v') == catalog.version:
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
 
 @pet_bp.route("/general_data/<int:pet_id>", methods=["GET"])
 @login_required
+@versioned_page
 @inject_pets
 def general_data(pet_id):
     """Shows general data related to a pet"""
@@ -0,0 +1,44 @@
+from flask import Blueprint, render_template, request, session, url_for
+
+from helpers import login_required, inject_pets
+from pet_cache import pet_list_cache
+from search import search_entries
+
+search_bp = Blueprint('search', __name__)
+
+# Results per page, and the last page offered (ranked results are paged by offset)
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGES = 25
+
+KIND_LABELS = {
+    'log': 'Log',
+    'weight': 'Weight',
+    'vaccine': 'Vaccine',
+    'internal_deworming': 'Internal Deworming',
+    'external_deworming': 'External Deworming',
+    'medication': 'Medication',
+}
+
+def result_url(result):
+    """Page showing a search result: the log entry, or the tracker tab of the pet"""
+    if result.kind == 'log':
+        return url_for('logs.read_entry', entry_id=result.source_id)
+    return url_for('trackers.trackers_home', pet_id=result.pet_id, tab=result.kind)
+
+@search_bp.route('/search', methods=['GET'])
+@login_required
+@inject_pets
+def search():
+    """Search the logs and tracker entries of the user's pets"""
+    query = request.args.get('q', '').strip()
+    page = min(max(request.args.get('page', 1, type=int), 1), SEARCH_MAX_PAGES)
+
+    # Scoped to the user's pets from the cached pet list
+    pets = {pet.id: pet for pet in pet_list_cache.pets(session.get("user_id"))}
+    results = search_entries(query, pets.keys(), limit=SEARCH_PAGE_SIZE + 1, offset=(page - 1) * SEARCH_PAGE_SIZE)
+    has_next = len(results) > SEARCH_PAGE_SIZE and page < SEARCH_MAX_PAGES
+    results = [
+        {"result": result, "pet": pets[result.pet_id], "label": KIND_LABELS[result.kind], "url": result_url(result)}
+        for result in results[:SEARCH_PAGE_SIZE]
+    ]
+    return render_template('search.html', query=query, results=results, page=page, has_next=has_next)
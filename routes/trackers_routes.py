@@ -1,17 +1,24 @@
-from datetime import datetime, timedelta
-from flask import Blueprint, render_template, redirect, url_for, current_app, flash, request
-import matplotlib
+from datetime import datetime, timedelta, MINYEAR, MAXYEAR
+from flask import Blueprint, render_template, redirect, url_for, current_app, flash, request, Response, jsonify
 import calendar
 
-from helpers import login_required, inject_pets, error_message, create_weight_graph, owned_pet
+from sqlalchemy import func, literal, select, union_all
+
+from helpers import login_required, inject_pets, error_message, owned_pet, keyset_page
+from graph_cache import weight_graph_cache, data_version
+from chart_pool import chart_pool, ChartRenderError
+from downsampling import lttb
+from serializers import TRACKER_ENTRY, json_response
+from svg_chart import PLOT_WIDTH
+from page_versions import versioned_page
 from models import Pet, WeightTracker, VaccineTracker, InternalDewormingTracker, ExternalDewormingTracker, MedicationTracker
 from forms import WeightForm, VaccineForm, InternalDewormingForm, ExternalDewormingForm, MedicationForm
 
-# Use backend without graphic interface to avoid sockets conflict
-matplotlib.use('Agg')
-
 trackers_bp = Blueprint('trackers', __name__)
 
+# Entries shown per page in every tracker tab
+TRACKER_PAGE_SIZE = 20
+
 # Map tracker types to respective forms and models
 tracker_map = {
     'weight': (WeightForm, WeightTracker),
@@ -21,29 +28,77 @@ tracker_map = {
     'medication': (MedicationForm, MedicationTracker)
 }
 
+def tracker_counts(pet_id):
+    """Number of entries of every tracker, in one aggregate query"""
+    db = current_app.extensions['sqlalchemy']
+    counts = union_all(*[
+        select(literal(tracker_type).label('type'), func.count(model.id).label('total')).where(model.pet_id == pet_id)
+        for tracker_type, (form_class, model) in tracker_map.items()
+    ])
+    return {row.type: row.total for row in db.session.execute(counts)}
+
+
+def tracker_page(model, pet_id, cursor=None):
+    """One page of a tracker, newest first"""
+    return keyset_page(model.query.filter_by(pet_id=pet_id), model.date, model.id, cursor, TRACKER_PAGE_SIZE)
+
+
 @trackers_bp.route('/<int:pet_id>')
 @login_required
+@versioned_page
 @inject_pets
 def trackers_home(pet_id):
     """Display trackers"""
     pet = Pet.query.get_or_404(pet_id)
     owned_pet(pet)
+
+    # Only the active tab is rendered, the other ones load their entries when opened
+    active_tab = request.args.get('tab')
+    if active_tab not in tracker_map:
+        active_tab = next(iter(tracker_map))
+    counts = tracker_counts(pet.id)
     trackers_with_entries = []
     
     for tracker_type, (form_class, model) in tracker_map.items():
-        entries = model.query.filter_by(pet_id=pet.id).order_by(model.date.desc()).all()
-        
         tracker = {
             "name": tracker_type.replace('_', ' ').title() + " Tracker",
             "description": f"Keep track of your pet's {tracker_type.replace('_', ' ')}",
-            "entries": entries,
+            "entries": [],
+            "next_cursor": None,
+            "loaded": tracker_type == active_tab,
+            "count": counts.get(tracker_type, 0),
+            "data_url": url_for('trackers.tracker_entries', tracker_type=tracker_type, pet_id=pet.id),
             "endpoint": f"trackers.{tracker_type}",
             "type": tracker_type
         }
+        if tracker["loaded"]:
+            tracker["entries"], tracker["next_cursor"] = tracker_page(model, pet.id)
         
         trackers_with_entries.append(tracker)
     
-    return render_template('trackers.html', pet=pet, trackers=trackers_with_entries)
+    return render_template('trackers.html', pet=pet, trackers=trackers_with_entries, active_tab=active_tab)
+
+@trackers_bp.route('/<int:pet_id>/entries/<tracker_type>', methods=['GET'])
+@login_required
+def tracker_entries(pet_id, tracker_type):
+    """One page of a tracker as JSON, for the tabs loaded on demand"""
+    if tracker_type not in tracker_map:
+        return error_message("Invalid tracker type", 400)
+    # Answered from the cached pet list, the pet row itself is not needed
+    not_owner = owned_pet(pet_id)
+    if not_owner:
+        return not_owner
+
+    form_class, model = tracker_map[tracker_type]
+    entries, next_cursor = tracker_page(model, pet_id, request.args.get('cursor'))
+    encode = TRACKER_ENTRY[model].encode
+    return json_response({
+        "entries": [
+            dict(encode(entry), delete_url=url_for('trackers.delete', tracker_type=tracker_type, entry_id=entry.id))
+            for entry in entries
+        ],
+        "next_cursor": next_cursor,
+    })
 
 @trackers_bp.route('/add/<tracker_type>/<int:pet_id>', methods=['GET', 'POST'])
 @login_required
@@ -109,72 +164,212 @@ def add_tracker(tracker_type, pet_id):
         flash("Data successfully added", "info")
 
         # Redirect to the previous page
-        return redirect(url_for('trackers.trackers_home', pet_id=pet_id))
+        return redirect(url_for('trackers.trackers_home', pet_id=pet_id, tab=tracker_type))
 
     return render_template('tracker_add.html', form=form, tracker_type=tracker_type, pet_id=pet_id)
 
 
-@trackers_bp.route('/<int:pet_id>/weight_graph', methods=['GET'])
-@login_required
-def weight_graph(pet_id):
-    """Display a graph of pet weight for the current or specified month."""
-    # Fetch weight entries and pet data
-    weight_entries = WeightTracker.query.filter_by(pet_id=pet_id).order_by(WeightTracker.date).all()
-    pet = Pet.query.get_or_404(pet_id)
-    owned_pet(pet)
+# Periods the weight graph can show
+GRAPH_VIEWS = ('month', 'year', 'all')
+
+
+def period_bounds(view, year, month):
+    """First and last date of a graph period (None for the whole history)."""
+    if view == 'month':
+        return datetime(year, month, 1).date(), datetime(year, month, calendar.monthrange(year, month)[1]).date()
+    if view == 'year':
+        return datetime(year, 1, 1).date(), datetime(year, 12, 31).date()
+    return None, None
 
-    # Get current date and parse month/year from request args
-    month = request.args.get('month', default=datetime.now().month, type=int)
-    year = request.args.get('year', default=datetime.now().year, type=int)
 
+def weight_query(pet_id, start=None, end=None):
+    """Weight entries of a pet, optionally between two dates."""
+    query = WeightTracker.query.filter_by(pet_id=pet_id)
+    if start:
+        query = query.filter(WeightTracker.date >= start)
+    if end:
+        query = query.filter(WeightTracker.date <= end)
+    return query
+
+
+def weight_series(pet_id, start=None, end=None):
+    """Return the (dates, weights) recorded for a pet, optionally between two dates."""
+    rows = (weight_query(pet_id, start, end)
+            .with_entities(WeightTracker.date, WeightTracker.weight_in_kg)
+            .order_by(WeightTracker.date, WeightTracker.id)
+            .all())
+    return [row.date for row in rows], [row.weight_in_kg for row in rows]
+
+
+def monthly_weight_data(pet_id, year, month):
+    """Return every day of the month and the weight recorded on each day (or None)."""
     # Generate all days of the specified month
     first_day = datetime(year, month, 1)
     last_day = datetime(year, month, calendar.monthrange(year, month)[1])
     all_days = [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
 
-    # Map user-provided data to corresponding days
-    weight_data = {entry.date: entry.weight_in_kg for entry in weight_entries if entry.date.month == month and entry.date.year == year}
+    # Only the month is read, through the (pet_id, date) index
+    dates, weights = weight_series(pet_id, first_day.date(), last_day.date())
+    weight_data = dict(zip(dates, weights))
     monthly_weights = [weight_data.get(day.date(), None) for day in all_days]
+    return all_days, monthly_weights
 
-    # Filter out None values for plotting
-    valid_dates = [day for day, weight in zip(all_days, monthly_weights) if weight is not None]
-    valid_weights = [weight for weight in monthly_weights if weight is not None]
-
-    # Check if there is any data for the month
-    if not valid_weights:
-        return render_template(
-            'weight_graph.html',
-            pet=pet,
-            year=year,
-            month=month,
-            month_name=first_day.strftime('%B'),
-            monthly_img_data=None,
-            current_month=datetime.now().month,
-            current_year=datetime.now().year,
-        )
-
-    # Generate the monthly graph as SVG with only valid points
-    monthly_img_data = create_weight_graph(
-        dates=all_days,  # Use all days for x-axis ticks
-        weights=monthly_weights,  # Use original weights (including None)
-        title=f"Pet's Weight for {first_day.strftime('%B %Y')}",
-        xlabel='Day',
-        ylabel='Weight (kg)',
-        color='g',
-        show_days_only=True
-    )
+
+def requested_period():
+    """Parse view/year/month from request args, defaulting to the current month."""
+    view = request.args.get('view', default='month')
+    if view not in GRAPH_VIEWS:
+        view = 'month'
+    month = request.args.get('month', default=datetime.now().month, type=int)
+    year = request.args.get('year', default=datetime.now().year, type=int)
+    if not 1 <= month <= 12:
+        month = datetime.now().month
+    if not MINYEAR < year < MAXYEAR:
+        year = datetime.now().year
+    return view, year, month
+
+
+def period_params(view, year, month):
+    """The year and month a view depends on, None for those it ignores."""
+    if view == 'month':
+        return year, month
+    if view == 'year':
+        return year, None
+    return None, None
+
+
+def graph_data(pet_id, view, year, month, max_points):
+    """Dates, weights and title of a weight graph, downsampled to max_points."""
+    if view == 'month':
+        # A month has at most 31 points: keep empty days so every day gets a tick
+        all_days, monthly_weights = monthly_weight_data(pet_id, year, month)
+        title = f"Pet's Weight for {datetime(year, month, 1).strftime('%B %Y')}"
+        return all_days, monthly_weights, title
+
+    dates, weights = weight_series(pet_id, *period_bounds(view, year, month))
+    title = f"Pet's Weight for {year}" if view == 'year' else "Pet's Weight History"
+
+    # Never send or plot more points than the chart can show
+    dates, weights = lttb(dates, weights, max_points)
+    return dates, weights, title
+
+
+def point_budget():
+    """Number of points requested by the client, capped by the server."""
+    max_points = current_app.config['WEIGHT_GRAPH_MAX_POINTS']
+    points = request.args.get('points', default=max_points, type=int)
+    return max(3, min(points, max_points))
+
+
+@trackers_bp.route('/<int:pet_id>/weight_graph', methods=['GET'])
+@login_required
+def weight_graph(pet_id):
+    """Display a graph of pet weight for a month, a year or the whole history."""
+    pet = Pet.query.get_or_404(pet_id)
+    owned_pet(pet)
+
+    # Get current date and parse view/month/year from request args
+    view, year, month = requested_period()
+    first_day = datetime(year, month, 1)
+    has_data = weight_query(pet_id, *period_bounds(view, year, month)).first() is not None
+
+    # The graph itself is served (and cached) by weight_graph_image
+    # Only the parameters of the view, so the browser caches one image per graph
+    graph_year, graph_month = period_params(view, year, month)
+    graph_url = url_for('trackers.weight_graph_image', pet_id=pet.id, view=view,
+                        year=graph_year, month=graph_month) if has_data else None
 
     return render_template(
         'weight_graph.html',
         pet=pet,
+        view=view,
         year=year,
         month=month,
         month_name=first_day.strftime('%B'),
-        monthly_img_data=monthly_img_data,
+        graph_url=graph_url,
         current_month=datetime.now().month,
         current_year=datetime.now().year,
     )
 
+@trackers_bp.route('/<int:pet_id>/weight_graph.svg', methods=['GET'])
+@login_required
+def weight_graph_image(pet_id):
+    """Serve the weight graph as a cacheable SVG image."""
+    # Answered from the cached pet list, the pet row itself is not needed
+    not_owner = owned_pet(pet_id)
+    if not_owner:
+        return not_owner
+
+    # One point per horizontal pixel of the plot at most
+    view, year, month = requested_period()
+    dates, weights, title = graph_data(pet_id, view, year, month, min(PLOT_WIDTH, current_app.config['WEIGHT_GRAPH_MAX_POINTS']))
+    if all(weight is None for weight in weights):
+        return error_message("No data available for this period.", 404)
+
+    # The ETag changes whenever the data behind the graph changes, and never with unused parameters
+    year, month = period_params(view, year, month)
+    version = data_version(zip(dates, weights))
+    etag = f"{pet_id}-{view}-{year}-{month}-{version}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        # Rendered in the chart process pool; concurrent requests share one render
+        try:
+            svg = weight_graph_cache.get_or_render(
+                (pet_id, view, year, month, version),
+                lambda: chart_pool.render(
+                    dates=dates,
+                    weights=weights,  # Month view keeps None for days without data
+                    title=title,
+                    xlabel='Day' if view == 'month' else 'Date',
+                    ylabel='Weight (kg)',
+                    color='g',
+                    show_days_only=view == 'month'
+                )
+            )
+        except ChartRenderError as e:
+            current_app.logger.error("Weight graph render failed: %s", e)
+            return error_message("The graph could not be drawn right now. Please try again.", 503)
+        response = Response(svg, mimetype='image/svg+xml')
+
+    # Private to the owner; the browser keeps it and revalidates with If-None-Match
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@trackers_bp.route('/<int:pet_id>/weight_history.json', methods=['GET'])
+@login_required
+def weight_history(pet_id):
+    """Weight series for a month, a year or the whole history, downsampled with LTTB."""
+    # Answered from the cached pet list, the pet row itself is not needed
+    not_owner = owned_pet(pet_id)
+    if not_owner:
+        return not_owner
+
+    view, year, month = requested_period()
+    max_points = point_budget()
+    dates, weights, title = graph_data(pet_id, view, year, month, max_points)
+
+    # Drop the empty days of the month view, then respect the budget there too
+    valid = [(day, weight) for day, weight in zip(dates, weights) if weight is not None]
+    dates, weights = lttb([day for day, _ in valid], [weight for _, weight in valid], max_points)
+    points = [[day.strftime('%Y-%m-%d'), weight] for day, weight in zip(dates, weights)]
+
+    # The payload, and so its ETag, only holds the parameters the view uses
+    year, month = period_params(view, year, month)
+    response = jsonify({
+        "pet_id": pet_id,
+        "view": view,
+        "year": year,
+        "month": month,
+        "title": title,
+        "max_points": max_points,
+        "points": points,
+    })
+    response.add_etag()
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
 @trackers_bp.route('/delete/<tracker_type>/<int:entry_id>', methods=['GET'])
 @login_required
 def delete(tracker_type, entry_id):
@@ -198,4 +393,4 @@ def delete(tracker_type, entry_id):
     db.session.commit()
 
     flash('Entry deleted successfully.', 'success')
-    return redirect(url_for('trackers.trackers_home', pet_id=pet_id))
\ No newline at end of file
+    return redirect(url_for('trackers.trackers_home', pet_id=pet_id, tab=tracker_type))
\ No newline at end of file
@@ -0,0 +1,232 @@
+"""
+Full-text search over the journal and the tracker entries.
+
+Log titles and contents, vaccine and product names and tracker notes are copied
+into the `search_index` FTS5 table by triggers on their tables, so every write
+path keeps it in sync, the bulk deletes of `helpers.delete_pets_from_db` and the
+account purge included.
+
+An entry's rowid is `pet id << 32 | source id << 3 | kind code`: all entries of a
+pet form one rowid range. A search is one statement, the UNION ALL of a MATCH
+per pet of the user restricted to that pet's range, which FTS5 answers by
+seeking into the term doclists, so the cost follows the size of the user's
+journal rather than the whole corpus. A single MATCH filtered on the pet ids
+instead visits every match of a common word in the index. Prefix words (`vacc*`)
+cannot seek, their doclists are merged first: those queries run one MATCH for
+all the pets and drop the matches of other pets.
+
+FTS5's bm25() is not used for ranking: it counts the documents containing each
+term across the whole index on every query, which takes longer than the search
+itself for common words. Every result contains all the query words, so the IDF
+part of BM25 is the same for all of them; results are ranked with the term
+frequency part, from the matches highlight() marks in the title (weighted
+higher) and the body, normalised by their lengths.
+
+FTS5 tables, triggers and auxiliary functions as in:
+https://www.sqlite.org/fts5.html
+BM25 as in:
+https://en.wikipedia.org/wiki/Okapi_BM25
+"""
+
+import re
+from collections import namedtuple
+from datetime import date
+from functools import lru_cache
+
+from markupsafe import Markup, escape
+from sqlalchemy import bindparam, event, text
+
+from extensions import db
+
+SearchSource = namedtuple('SearchSource', 'kind code table title body day condition')
+
+# Indexed tables; title/body/condition are SQL over the row (`{row}` is new or old)
+SEARCH_SOURCES = (
+    SearchSource('log', 0, 'logs', '{row}.title', '{row}.content', '{row}.date_uploaded', '1'),
+    # Most weight entries have no notes, only those with text are indexed
+    SearchSource('weight', 1, 'weight_tracker', 'NULL', '{row}.notes', '{row}.date', '{row}.notes IS NOT NULL'),
+    SearchSource('vaccine', 2, 'vaccine_tracker', '{row}.vaccine_name',
+                 "coalesce({row}.administered_by || ' ', '') || coalesce({row}.notes, '')", '{row}.date', '1'),
+    SearchSource('internal_deworming', 3, 'internal_deworming_tracker', '{row}.product_name', '{row}.notes', '{row}.date', '1'),
+    SearchSource('external_deworming', 4, 'external_deworming_tracker', '{row}.product_name', '{row}.notes', '{row}.date', '1'),
+    SearchSource('medication', 5, 'medication_tracker', '{row}.product_name', '{row}.notes', '{row}.date', '1'),
+)
+SOURCES_BY_CODE = {source.code: source for source in SEARCH_SOURCES}
+KIND_BITS = 3
+PET_SHIFT = 32
+
+# BM25 parameters and column weights of the ranking
+TITLE_WEIGHT = 4.0
+BODY_WEIGHT = 1.0
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Typical title and body lengths in words, for the length normalisation
+AVERAGE_TITLE_WORDS = 4
+AVERAGE_BODY_WORDS = 60
+# Newest matches per pet that are ranked; older ones are left out for very common words
+MAX_CANDIDATES = 200
+# Search terms used at most, the rest of a long query is ignored
+MAX_TERMS = 8
+# Pets per search statement: SQLite allows 500 terms in a compound SELECT
+PETS_PER_QUERY = 100
+# Words of the body shown around the first match
+SNIPPET_WORDS = 16
+
+CREATE_INDEX = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "title, body, day UNINDEXED, "
+    "tokenize = 'porter unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+# Private-use characters marking matches in highlight(), escaped before <mark> is added
+MARK_START = '\ue000'
+MARK_END = '\ue001'
+
+
+def entry_rowid(source, row):
+    """SQL rowid of the index entry of a row"""
+    return f"(({row}.pet_id << {PET_SHIFT}) | ({row}.id << {KIND_BITS}) | {source.code})"
+
+
+def trigger_statements(source):
+    """CREATE TRIGGER statements keeping the index in sync with one table"""
+    delete = f"DELETE FROM search_index WHERE rowid = {entry_rowid(source, 'old')};"
+    new_entry = (
+        f"INSERT INTO search_index (rowid, title, body, day) "
+        f"SELECT {entry_rowid(source, 'new')}, {source.title.format(row='new')}, "
+        f"{source.body.format(row='new')}, {source.day.format(row='new')} "
+        f"WHERE {source.condition.format(row='new')};"
+    )
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {source.table}_search_insert AFTER INSERT ON {source.table} "
+        f"BEGIN {new_entry} END",
+        f"CREATE TRIGGER IF NOT EXISTS {source.table}_search_update AFTER UPDATE ON {source.table} "
+        f"BEGIN {delete} {new_entry} END",
+        f"CREATE TRIGGER IF NOT EXISTS {source.table}_search_delete AFTER DELETE ON {source.table} "
+        f"BEGIN {delete} END",
+    )
+
+
+def create_search_index(connection):
+    """Create the FTS5 table and the triggers (no-op where they exist)"""
+    connection.exec_driver_sql(CREATE_INDEX)
+    for source in SEARCH_SOURCES:
+        for statement in trigger_statements(source):
+            connection.exec_driver_sql(statement)
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_search_index(target, connection, **kw):
+    # Databases built with create_all() get the index the migrations add
+    if connection.dialect.name == 'sqlite' and all(source.table in target.tables for source in SEARCH_SOURCES):
+        create_search_index(connection)
+
+
+@event.listens_for(db.metadata, 'after_drop')
+def _drop_search_index(target, connection, **kw):
+    # drop_all() only knows the mapped tables, a stale index would clash with the new rowids
+    if connection.dialect.name == 'sqlite' and all(source.table in target.tables for source in SEARCH_SOURCES):
+        connection.exec_driver_sql("DROP TABLE IF EXISTS search_index")
+
+
+def match_expression(query):
+    """
+    FTS5 query matching entries with all the words of `query`, None if there is nothing to search.
+    Words are quoted so user input never reaches the FTS5 query syntax. Stemming already matches
+    other forms of a word; a word typed with a trailing `*` matches as a prefix.
+    """
+    terms = re.findall(r'(\w+)(\*?)', query.lower())[:MAX_TERMS]
+    if not terms:
+        return None
+    return ' '.join(f'"{word}"{star}' for word, star in terms)
+
+
+def _column_score(marked, weight, average_words):
+    """BM25 term frequency part for one column, from its highlighted text"""
+    if not marked:
+        return 0.0
+    frequency = marked.count(MARK_START)
+    words = marked.count(' ') + 1
+    return weight * frequency * (BM25_K1 + 1) / (
+        frequency + BM25_K1 * (1 - BM25_B + BM25_B * words / average_words))
+
+
+def _snippet(marked):
+    """A few words of a highlighted body around its first match"""
+    if not marked:
+        return marked
+    words = marked.split()
+    first = next((i for i, word in enumerate(words) if MARK_START in word), 0)
+    start = max(0, min(first - SNIPPET_WORDS // 4, len(words) - SNIPPET_WORDS))
+    end = start + SNIPPET_WORDS
+    return ('…' if start else '') + ' '.join(words[start:end]) + ('…' if end < len(words) else '')
+
+
+def _marked(fragment):
+    """Escape an FTS5 fragment and turn the match markers into <mark> tags"""
+    if fragment is None:
+        return None
+    return Markup(str(escape(fragment)).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+SearchResult = namedtuple('SearchResult', 'kind source_id pet_id day title snippet')
+
+CANDIDATES = (
+    "SELECT rowid, day, highlight(search_index, 0, :start, :end), highlight(search_index, 1, :start, :end) "
+    "FROM search_index WHERE search_index MATCH :expression AND {scope} "
+    "ORDER BY rowid DESC LIMIT :candidates"
+)
+# Prefix words merge the doclists of every word they match, which FTS5 cannot seek
+# into: such queries run once for all the pets and filter the matches instead
+PREFIX_CANDIDATES_SQL = text(CANDIDATES.format(scope=f"(rowid >> {PET_SHIFT}) IN :pet_ids")).bindparams(
+    bindparam('pet_ids', expanding=True))
+
+
+@lru_cache(maxsize=PETS_PER_QUERY)
+def _ranges_candidates_sql(count):
+    """One statement with the newest matches of `count` pets, each read from its own rowid range"""
+    return text(' UNION ALL '.join(
+        f"SELECT * FROM ({CANDIDATES.format(scope=f'rowid BETWEEN :first{i} AND :last{i}')})" for i in range(count)
+    ))
+
+
+def search_entries(query, pet_ids, limit=20, offset=0):
+    """Best matching entries of these pets, most relevant first"""
+    expression = match_expression(query)
+    pet_ids = sorted(pet_ids)
+    if expression is None or not pet_ids:
+        return []
+    marks = {"start": MARK_START, "end": MARK_END}
+
+    if '*' in expression:
+        batches = [db.session.execute(PREFIX_CANDIDATES_SQL, {
+            "expression": expression, "candidates": MAX_CANDIDATES * len(pet_ids), "pet_ids": pet_ids, **marks,
+        })]
+    else:
+        # All entries of a pet, by rowid range
+        batches = []
+        for start in range(0, len(pet_ids), PETS_PER_QUERY):
+            chunk = pet_ids[start:start + PETS_PER_QUERY]
+            params = {"expression": expression, "candidates": MAX_CANDIDATES, **marks}
+            for i, pet_id in enumerate(chunk):
+                params[f"first{i}"] = pet_id << PET_SHIFT
+                params[f"last{i}"] = ((pet_id + 1) << PET_SHIFT) - 1
+            batches.append(db.session.execute(_ranges_candidates_sql(len(chunk)), params))
+
+    scored = []
+    for rows in batches:
+        for rowid, day, title, body in rows:
+            score = (_column_score(title, TITLE_WEIGHT, AVERAGE_TITLE_WORDS)
+                     + _column_score(body, BODY_WEIGHT, AVERAGE_BODY_WORDS))
+            scored.append((score, rowid, day, title, body))
+
+    # Best score first, newest first among equal scores
+    scored.sort(key=lambda entry: (-entry[0], -entry[1]))
+    entry_mask = (1 << PET_SHIFT) - 1
+    return [
+        SearchResult(
+            SOURCES_BY_CODE[rowid & ((1 << KIND_BITS) - 1)].kind, (rowid & entry_mask) >> KIND_BITS,
+            rowid >> PET_SHIFT, date.fromisoformat(day) if day else None, _marked(title), _marked(_snippet(body)),
+        )
+        for score, rowid, day, title, body in scored[offset:offset + limit]
+    ]
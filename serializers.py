@@ -0,0 +1,217 @@
+"""
+JSON serialization of the models.
+
+A `Shape` describes one output: which columns, nested relationships and computed
+values to emit. It is compiled once into an encoder (a single `attrgetter` for
+the columns, date columns converted with `isoformat`) and into a load plan:
+nested objects are eager-loaded with `selectinload`, and leaf collections such as
+photos and logs are fetched as plain column rows with one `IN` query for all the
+parents, so no ORM object is built for them. A whole user export takes one query
+per level instead of one per pet, photo list and log list.
+
+Responses are streamed in chunks, with the inner values encoded by the C JSON
+encoder. Output matches the models' `to_dict()` methods, which stay available for
+one-off use. Loading strategies from:
+https://docs.sqlalchemy.org/en/20/orm/queryguide/relationships.html#selectin-eager-loading
+"""
+
+import json
+from collections import defaultdict
+from datetime import date
+from operator import attrgetter
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload, object_session
+
+from models import (User, Species, Breed, Pet, Photo, Log, WeightTracker, VaccineTracker,
+                    InternalDewormingTracker, ExternalDewormingTracker, MedicationTracker)
+
+# Responses are flushed to the client in chunks of this size
+STREAM_CHUNK_SIZE = 64 * 1024
+# Parent ids per IN (...) query, below SQLite's bound parameter limit
+IN_BATCH_SIZE = 500
+
+
+class Shape:
+    """Compiled encoder for one model and the load plan it needs"""
+
+    def __init__(self, model, columns, relationships=None, computed=None):
+        self.model = model
+        self.columns = tuple(columns)
+        self.relationships = tuple((relationships or {}).items())
+        self.computed = tuple((computed or {}).items())
+        self.leaf = not self.relationships and not self.computed
+
+        table_columns = model.__table__.columns
+        self._get_columns = attrgetter(*self.columns)
+        self._date_columns = tuple(
+            name for name in self.columns
+            if name in table_columns and issubclass(table_columns[name].type.python_type, date)
+        )
+        self._many = tuple(
+            (key, shape, getattr(model, key).property.uselist) for key, shape in self.relationships
+        )
+        # Leaf collections are read as rows: (key, shape, parent key attribute, child foreign key column)
+        self._row_collections = []
+        for key, shape, many in self._many:
+            if many and shape.leaf:
+                relationship = getattr(model, key).property
+                (local, remote), = relationship.local_remote_pairs
+                parent_key = model.__mapper__.get_property_by_column(local).key
+                self._row_collections.append((key, shape, attrgetter(parent_key), remote))
+
+    def _encode_columns(self, values):
+        data = dict(zip(self.columns, values if len(self.columns) > 1 else (values,)))
+        for name in self._date_columns:
+            value = data[name]
+            if value is not None:
+                data[name] = value.isoformat()
+        return data
+
+    def encode(self, obj):
+        """Encode one object as a dict, relationships through attribute access"""
+        data = self._encode_columns(self._get_columns(obj))
+        for key, shape, many in self._many:
+            value = getattr(obj, key)
+            if many:
+                data[key] = [shape.encode(item) for item in value]
+            else:
+                data[key] = shape.encode(value) if value is not None else None
+        for key, compute in self.computed:
+            data[key] = compute(obj)
+        return data
+
+    def encode_many(self, objects):
+        """Encode objects loaded with `query()`, fetching leaf collections for all of them at once"""
+        objects = list(objects)
+        if not objects:
+            return []
+        session = object_session(objects[0])
+        collections = {
+            key: self._fetch_rows(session, shape, remote, [get_key(obj) for obj in objects])
+            for key, shape, get_key, remote in self._row_collections
+        }
+        get_keys = {key: get_key for key, shape, get_key, remote in self._row_collections}
+
+        encoded = []
+        for obj in objects:
+            data = self._encode_columns(self._get_columns(obj))
+            for key, shape, many in self._many:
+                if key in collections:
+                    data[key] = collections[key].get(get_keys[key](obj), [])
+                elif many:
+                    data[key] = shape.encode_many(getattr(obj, key))
+                else:
+                    value = getattr(obj, key)
+                    data[key] = shape.encode(value) if value is not None else None
+            for key, compute in self.computed:
+                data[key] = compute(obj)
+            encoded.append(data)
+        return encoded
+
+    @staticmethod
+    def _fetch_rows(session, shape, foreign_key, parent_keys):
+        """Encoded children of every parent, grouped by parent key"""
+        columns = [getattr(shape.model, name) for name in shape.columns]
+        grouped = defaultdict(list)
+        for start in range(0, len(parent_keys), IN_BATCH_SIZE):
+            rows = session.execute(
+                select(foreign_key, *columns)
+                .where(foreign_key.in_(parent_keys[start:start + IN_BATCH_SIZE]))
+                .order_by(foreign_key, shape.model.id)
+            )
+            for parent_key, *values in rows:
+                grouped[parent_key].append(shape._encode_columns(values if len(values) > 1 else values[0]))
+        return grouped
+
+    def loader_options(self):
+        """Eager-load plan for the relationships loaded as objects"""
+        row_keys = {key for key, *_ in self._row_collections}
+        options = []
+        for key, shape, many in self._many:
+            if key in row_keys:
+                continue
+            loader = (selectinload if many else joinedload)(getattr(self.model, key))
+            nested = shape.loader_options()
+            options.append(loader.options(*nested) if nested else loader)
+        return options
+
+    def query(self):
+        """Query of the model with this shape's load plan applied"""
+        return self.model.query.options(*self.loader_options())
+
+
+SPECIES_REF = Shape(Species, ['id', 'name'])
+BREED_REF = Shape(Breed, ['id', 'name'])
+
+PHOTO = Shape(Photo, ['id', 'pet_id', 'image_url', 'title', 'date_uploaded'])
+LOG = Shape(Log, ['id', 'pet_id', 'content', 'title', 'date_uploaded'])
+
+PET_DETAIL = Shape(
+    Pet,
+    ['id', 'name', 'pet_profile_photo', 'birth_date', 'adoption_date', 'sex', 'sterilized',
+     'microchip_number', 'insurance_company', 'insurance_number'],
+    relationships={'species': SPECIES_REF, 'breed': BREED_REF, 'photos': PHOTO, 'logs': LOG},
+    computed={'age': Pet.age},
+)
+
+USER_EXPORT = Shape(User, ['id', 'username', 'email'], relationships={'pets': PET_DETAIL})
+
+TRACKER_ENTRY = {
+    WeightTracker: Shape(WeightTracker, ['id', 'pet_id', 'weight_in_kg', 'date', 'notes']),
+    VaccineTracker: Shape(VaccineTracker, ['id', 'pet_id', 'vaccine_name', 'date', 'next_dosis',
+                                           'administered_by', 'notes']),
+    InternalDewormingTracker: Shape(InternalDewormingTracker, ['id', 'pet_id', 'product_name', 'date',
+                                                               'next_dosis', 'notes']),
+    ExternalDewormingTracker: Shape(ExternalDewormingTracker, ['id', 'pet_id', 'product_name', 'date',
+                                                               'next_dosis', 'notes']),
+    MedicationTracker: Shape(MedicationTracker, ['id', 'pet_id', 'product_name', 'date', 'next_dosis', 'notes']),
+}
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def iter_json(value, depth=3):
+    """
+    Encode value as JSON fragments. The outer `depth` levels of dicts and lists
+    are walked in Python so output starts early, everything below them goes
+    through the C encoder in one call (iterencode alone is pure Python).
+    """
+    encode = _encoder.encode
+    if depth <= 0 or not isinstance(value, (dict, list, tuple)):
+        yield encode(value)
+    elif isinstance(value, dict):
+        separator = '{'
+        for key, item in value.items():
+            yield separator + encode(str(key)) + ':'
+            yield from iter_json(item, depth - 1)
+            separator = ','
+        yield '}' if separator == ',' else '{}'
+    else:
+        separator = '['
+        for item in value:
+            yield separator
+            yield from iter_json(item, depth - 1)
+            separator = ','
+        yield ']' if separator == ',' else '[]'
+
+
+def _chunked(fragments):
+    """Group small JSON fragments into larger writes"""
+    buffer, size = [], 0
+    for fragment in fragments:
+        buffer.append(fragment)
+        size += len(fragment)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def json_response(payload, status=200, headers=None):
+    """Stream payload to the client as JSON while it is being encoded"""
+    return current_app.response_class(
+        _chunked(iter_json(payload)), status=status, headers=headers, mimetype='application/json'
+    )
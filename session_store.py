@@ -0,0 +1,224 @@
+"""
+Server-side sessions in an indexed SQLite table.
+
+Flask-Session's filesystem backend wrote one file per visitor and never removed
+them. Sessions now live in one `sessions` table of their own database file
+(`SESSION_DB_PATH`), so session writes never wait on the application's write
+lock:
+  - A row is written only when the session data changed. Sessions without data
+    are never stored and get no cookie, so anonymous page views cost no I/O.
+  - Sessions expire `SESSION_TTL` seconds after their last use. The expiry of an
+    unchanged session is pushed back at most once per `SESSION_REFRESH_INTERVAL`.
+  - A background sweeper deletes expired rows in small batches through the
+    expiry index. Beyond `SESSION_MAX_ENTRIES` it also drops the sessions that
+    would expire first, so the table stays bounded.
+  - Session ids are random 256-bit tokens and only their SHA-256 is stored.
+    Clearing a session (login, logout) gives it a new id.
+
+Session interfaces as in:
+https://flask.palletsprojects.com/en/stable/api/#session-interface
+"""
+
+import hashlib
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from store_helpers import Counters, SqliteConnections
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS sessions ("
+    "key BLOB PRIMARY KEY, data TEXT NOT NULL, expires_at INTEGER NOT NULL) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at)",
+)
+
+
+class StoredSession(CallbackDict, SessionMixin):
+    """Session data with its id, and whether it changed during the request"""
+
+    def __init__(self, initial=None, sid=None, expires_at=0):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.modified = False
+        self.regenerate = False
+
+    def clear(self):
+        # A new id once the user changes, a stolen or planted id stops working
+        self.regenerate = self.sid is not None
+        super().clear()
+
+
+class SessionStore(Counters, SessionInterface):
+    """Flask session interface storing sessions in SQLite, with a background sweeper"""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, app=None):
+        self.app = None
+        # Sessions can be lost on power failure, never corrupted
+        self._connections = SqliteConnections(SCHEMA, timeout=10, synchronous='NORMAL')
+        self._stopping = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.reads = 0
+        self.writes = 0
+        self.refreshes = 0
+        self.deletes = 0
+        self.expired = 0
+        self.evicted = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SESSION_DB_PATH', os.path.join(app.instance_path, 'sessions.db'))
+        # Idle time after which a session is gone
+        app.config.setdefault('SESSION_TTL', 7 * 24 * 3600)
+        app.config.setdefault('SESSION_REFRESH_INTERVAL', 3600)
+        app.config.setdefault('SESSION_MAX_ENTRIES', 1_000_000)
+        # Seconds between sweeps, 0 disables the sweeper
+        app.config.setdefault('SESSION_SWEEP_INTERVAL', 300)
+        app.config.setdefault('SESSION_SWEEP_BATCH', 1000)
+
+        self.app = app
+        app.session_interface = self
+        app.extensions['session_store'] = self
+
+        # Start lazily on the first request, like the account purger
+        @app.before_request
+        def start_session_sweeper():
+            if self._thread is None and app.config['SESSION_SWEEP_INTERVAL']:
+                self.start()
+
+    def _connection(self):
+        """This thread's connection to the session database"""
+        return self._connections.get(self.app.config['SESSION_DB_PATH'])
+
+    @staticmethod
+    def _key(sid):
+        return hashlib.sha256(sid.encode()).digest()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid:
+            return StoredSession()
+        row = self._connection().execute(
+            "SELECT data, expires_at FROM sessions WHERE key = ? AND expires_at > ?",
+            (self._key(sid), int(time.time())),
+        ).fetchone()
+        self._count('reads')
+        if row is None:
+            return StoredSession()
+        data, expires_at = row
+        return StoredSession(self.serializer.loads(data), sid, expires_at)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.sid is not None and (session.regenerate or not session):
+            if session.modified:
+                self._connection().execute("DELETE FROM sessions WHERE key = ?", (self._key(session.sid),))
+                self._count('deletes')
+            if not session:
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app), httponly=self.get_cookie_httponly(app))
+                return
+            session.sid = None
+
+        # Nothing stored for sessions without data
+        if not session:
+            return
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        now = int(time.time())
+        expires_at = now + app.config['SESSION_TTL']
+        created = session.sid is None
+        if created:
+            session.sid = secrets.token_urlsafe(32)
+        if created or session.modified:
+            self._connection().execute(
+                "INSERT INTO sessions (key, data, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at",
+                (self._key(session.sid), self.serializer.dumps(dict(session)), expires_at),
+            )
+            self._count('writes')
+        elif session.expires_at + app.config['SESSION_REFRESH_INTERVAL'] <= expires_at:
+            self._connection().execute("UPDATE sessions SET expires_at = ? WHERE key = ?", (expires_at, self._key(session.sid)))
+            self._count('refreshes')
+
+        if created or self.should_set_cookie(app, session):
+            response.set_cookie(
+                name, session.sid, expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+                partitioned=self.get_cookie_partitioned(app),
+            )
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="session-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.app.config['SESSION_SWEEP_INTERVAL']):
+            try:
+                self.sweep()
+            except sqlite3.Error:
+                self.app.logger.exception("Session sweeper error")
+
+    def _delete_batches(self, condition, params, limit):
+        """Delete up to `limit` sessions matching `condition`, soonest to expire first, batch by batch"""
+        batch_size = self.app.config['SESSION_SWEEP_BATCH']
+        connection = self._connection()
+        deleted = 0
+        while deleted < limit:
+            batch = min(batch_size, limit - deleted)
+            cursor = connection.execute(
+                f"DELETE FROM sessions WHERE key IN (SELECT key FROM sessions WHERE {condition} "
+                f"ORDER BY expires_at LIMIT ?)", (*params, batch))
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch or self._stopping.is_set():
+                break
+        return deleted
+
+    def sweep(self):
+        """Delete the expired sessions, then the soonest to expire beyond SESSION_MAX_ENTRIES"""
+        expired = self._delete_batches("expires_at <= ?", (int(time.time()),), float('inf'))
+        entries = self._connection().execute("SELECT count(*) FROM sessions").fetchone()[0]
+        excess = entries - self.app.config['SESSION_MAX_ENTRIES']
+        evicted = self._delete_batches("1", (), excess) if excess > 0 else 0
+        self._count('expired', expired)
+        self._count('evicted', evicted)
+        return expired + evicted
+
+    def stats(self):
+        entries = self._connection().execute("SELECT count(*) FROM sessions").fetchone()[0]
+        with self._lock:
+            return {
+                "entries": entries, "reads": self.reads, "writes": self.writes, "refreshes": self.refreshes,
+                "deletes": self.deletes, "expired": self.expired, "evicted": self.evicted,
+            }
+
+
+session_store = SessionStore()
@@ -0,0 +1,126 @@
+"""
+SQLite engine profile for several server processes writing to one database.
+
+On every new connection the profile sets WAL journaling (readers and the writer
+no longer block each other), `synchronous=NORMAL` (no fsync per commit in WAL
+mode, still never corrupted), a page cache and memory-mapped reads of a set
+size, and `busy_timeout`.
+
+pysqlite opens a deferred transaction right before the first INSERT, UPDATE or
+DELETE, so reads run outside transactions. The profile opens that transaction
+itself with `BEGIN IMMEDIATE`, which takes the write lock first. A deferred
+transaction that starts writing after another process committed fails with
+SQLITE_BUSY at once, whatever the busy timeout. Nothing has run in the
+transaction yet when the lock is requested, so a BEGIN that still gets
+SQLITE_BUSY after the busy timeout is retried with jittered exponential backoff.
+
+Pragmas as in:
+https://www.sqlite.org/pragma.html
+Write-ahead logging and SQLITE_BUSY as in:
+https://www.sqlite.org/wal.html
+https://www.sqlite.org/rescode.html#busy
+"""
+
+import random
+import sqlite3
+import threading
+import time
+
+from sqlalchemy import event
+
+from extensions import db
+from store_helpers import Counters
+
+# Applied in this order on connect; cache_size is negative to be read in KiB
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+}
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def _is_write(statement):
+    return statement.lstrip()[:7].upper().startswith(WRITE_STATEMENTS)
+
+
+class SqliteProfile(Counters):
+    """Sets the pragmas of new SQLite connections and retries busy write transactions"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        self.busy_retries = 6
+        self.busy_backoff = 0.01
+        self._lock = threading.Lock()
+        self.immediate_begins = 0
+        self.busy_retried = 0
+        self.busy_failures = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQLITE_PROFILE_ENABLED', True)
+        app.config.setdefault('SQLITE_PRAGMAS', dict(DEFAULT_PRAGMAS))
+        # BEGIN IMMEDIATE attempts after the first, sleeping up to backoff * 2**attempt seconds
+        app.config.setdefault('SQLITE_BUSY_RETRIES', 6)
+        app.config.setdefault('SQLITE_BUSY_BACKOFF', 0.01)
+
+        self.app = app
+        self.pragmas = {**DEFAULT_PRAGMAS, **app.config['SQLITE_PRAGMAS']}
+        self.busy_retries = app.config['SQLITE_BUSY_RETRIES']
+        self.busy_backoff = app.config['SQLITE_BUSY_BACKOFF']
+        app.extensions['sqlite_profile'] = self
+
+        if app.config['SQLITE_PROFILE_ENABLED']:
+            # Engines exist once db.init_app() ran, their first connection is made later
+            with app.app_context():
+                for engine in db.engines.values():
+                    if engine.dialect.name == 'sqlite':
+                        self.configure(engine)
+
+    def configure(self, engine):
+        """Apply the profile to every connection `engine` opens from now on"""
+        event.listen(engine, 'connect', self._set_pragmas)
+        event.listen(engine, 'before_cursor_execute', self._begin_writes)
+
+    def _set_pragmas(self, dbapi_connection, connection_record):
+        for name, value in self.pragmas.items():
+            dbapi_connection.execute(f"PRAGMA {name} = {value}")
+
+    def _begin_writes(self, connection, cursor, statement, parameters, context, executemany):
+        dbapi_connection = connection.connection.driver_connection
+        if not dbapi_connection.in_transaction and _is_write(statement):
+            self.begin_immediate(dbapi_connection)
+
+    def begin_immediate(self, dbapi_connection):
+        """Start a write transaction, retrying while another process holds the write lock"""
+        for attempt in range(self.busy_retries + 1):
+            try:
+                dbapi_connection.execute("BEGIN IMMEDIATE")
+                self._count('immediate_begins')
+                return
+            except sqlite3.OperationalError as e:
+                # SQLITE_BUSY, the other errors are not worth a retry
+                if 'database is locked' not in str(e):
+                    raise
+                if attempt == self.busy_retries:
+                    self._count('busy_failures')
+                    raise
+                self._count('busy_retried')
+                # Full jitter, so processes that collided do not retry in step
+                time.sleep(random.uniform(0, self.busy_backoff * 2 ** attempt))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pragmas": self.pragmas,
+                "immediate_begins": self.immediate_begins,
+                "busy_retried": self.busy_retried,
+                "busy_failures": self.busy_failures,
+            }
+
+
+sqlite_profile = SqliteProfile()
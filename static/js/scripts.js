@@ -69,4 +69,44 @@ function showAlert(message) {
     setTimeout(function() {
         $('#customAlert').fadeOut();
     }, 5000);
-}
\ No newline at end of file
+}
+
+// Append the next page of `container` when `sentinel` comes into view or its button is clicked.
+// The sentinel holds the JSON endpoint in data-url and the next page's cursor in data-cursor.
+function infiniteScroll(container, sentinel, errorMessage) {
+    let loading = false;
+    let observer = null;
+
+    function loadMore() {
+        const cursor = sentinel.dataset.cursor;
+        if (loading || !cursor) return;
+        loading = true;
+
+        fetch(sentinel.dataset.url + '?cursor=' + encodeURIComponent(cursor), { headers: { 'Accept': 'application/json' } })
+            .then(response => {
+                if (!response.ok) throw new Error(response.statusText);
+                return response.json();
+            })
+            .then(data => {
+                container.insertAdjacentHTML('beforeend', data.html);
+                sentinel.dataset.cursor = data.next_cursor || '';
+                sentinel.classList.toggle('d-none', !data.next_cursor);
+                // Observing again reports whether the end is still in view after a short page
+                if (observer) {
+                    observer.unobserve(sentinel);
+                    observer.observe(sentinel);
+                }
+            })
+            .catch(() => showAlert(errorMessage || 'Could not load more, please try again.'))
+            .finally(() => { loading = false; });
+    }
+
+    sentinel.querySelector('button').addEventListener('click', loadMore);
+    if ('IntersectionObserver' in window) {
+        // Start loading a screen before the end of the list is reached
+        observer = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) loadMore();
+        }, { rootMargin: '0px 0px 800px 0px' });
+        observer.observe(sentinel);
+    }
+}
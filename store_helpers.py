@@ -0,0 +1,49 @@
+"""
+Pieces shared by the small stores and worker pools of the app.
+
+  - `SqliteConnections` opens one autocommit connection per thread to a small
+    SQLite database of its own (sessions, rate limits), in WAL mode, and creates
+    its schema on first use. Those databases never wait on the application's
+    write lock.
+  - `Counters` adds the thread-safe `_count()` behind the numbers of `stats()`.
+
+WAL mode as in:
+https://www.sqlite.org/wal.html
+"""
+
+import os
+import sqlite3
+import threading
+
+
+class SqliteConnections:
+    """Per-thread autocommit connections to one small SQLite database"""
+
+    def __init__(self, schema, timeout=5, synchronous='NORMAL'):
+        self.schema = schema
+        self.timeout = timeout
+        self.synchronous = synchronous
+        self._local = threading.local()
+
+    def get(self, path):
+        """This thread's connection to the database at `path`, created with its schema if needed"""
+        connections = self._local.__dict__.setdefault('connections', {})
+        connection = connections.get(path)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            # Autocommit: every statement is its own short transaction
+            connection = sqlite3.connect(path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute(f"PRAGMA synchronous = {self.synchronous}")
+            for statement in self.schema:
+                connection.execute(statement)
+            connections[path] = connection
+        return connection
+
+
+class Counters:
+    """Mixin for counters kept as attributes and guarded by `self._lock`"""
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
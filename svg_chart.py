@@ -0,0 +1,155 @@
+"""
+Small SVG line-chart engine used for the weight graphs.
+
+Scales, ticks and point coordinates are computed with vectorized NumPy and the
+SVG markup is written directly, so drawing a graph costs a fraction of a
+millisecond instead of building and serializing a matplotlib figure.
+
+Tick selection follows the "nice numbers" algorithm from:
+Paul Heckbert, "Nice Numbers for Graph Labels", Graphics Gems (1990).
+"""
+
+import math
+from html import escape
+
+import numpy as np
+
+# Single-letter colour codes accepted by matplotlib, so callers keep the same arguments
+COLOR_CODES = {
+    'b': '#0000ff', 'g': '#008000', 'r': '#ff0000', 'c': '#00bfbf',
+    'm': '#bf00bf', 'y': '#bfbf00', 'k': '#000000', 'w': '#ffffff',
+}
+
+# Candidate spacings (in days) for date ticks
+DATE_STEPS = (1, 2, 7, 14, 30, 61, 91, 182, 365, 730, 1826)
+
+WIDTH, HEIGHT = 720, 360
+MARGIN_LEFT, MARGIN_RIGHT, MARGIN_TOP, MARGIN_BOTTOM = 64, 20, 40, 62
+# Horizontal pixels available for data: more points than this cannot be told apart
+PLOT_WIDTH = WIDTH - MARGIN_LEFT - MARGIN_RIGHT
+AXIS_COLOR = '#000000'
+GRID_COLOR = '#b0b0b0'
+
+
+def nice_step(span, max_ticks):
+    """Round span / max_ticks up to 1, 2, 5 or 10 times a power of ten"""
+    raw = span / max_ticks
+    magnitude = 10 ** math.floor(math.log10(raw))
+    for factor in (1, 2, 5, 10):
+        if raw <= factor * magnitude:
+            return factor * magnitude
+    return 10 * magnitude
+
+
+def value_ticks(lo, hi, max_ticks=6):
+    """Nice tick values covering [lo, hi]"""
+    step = nice_step(hi - lo, max_ticks)
+    ticks = np.arange(math.ceil(lo / step) * step, hi + step * 1e-9, step)
+    decimals = max(0, -math.floor(math.log10(step)))
+    return ticks, [f"{tick:.{decimals}f}" for tick in ticks]
+
+
+def padded_range(values, margin=0.05):
+    """Data range with matplotlib-like 5% margins"""
+    lo, hi = float(values.min()), float(values.max())
+    if lo == hi:
+        # A single value still gets a visible band around it
+        pad = abs(lo) * 0.05 or 0.5
+        return lo - pad, hi + pad
+    pad = (hi - lo) * margin
+    return lo - pad, hi + pad
+
+
+def render_line_chart(dates, weights, title, xlabel, ylabel, color, show_days_only=False):
+    """Render a line chart with point markers as an SVG string.
+
+    `dates` are date/datetime objects and `weights` the matching values, where
+    None means no measurement. Only valid points are plotted and connected; with
+    `show_days_only` every date gets a tick labelled with its day number.
+    """
+    days = np.array(dates, dtype='datetime64[D]').astype(np.int64)
+    values = np.array([np.nan if weight is None else weight for weight in weights], dtype=float)
+    valid = ~np.isnan(values)
+    x_points, y_points = days[valid], values[valid]
+
+    plot_w = PLOT_WIDTH
+    plot_h = HEIGHT - MARGIN_TOP - MARGIN_BOTTOM
+
+    # Domains: with day ticks the x-axis spans every date passed in
+    x_source = days if show_days_only else x_points
+    x_lo, x_hi = padded_range(x_source.astype(float), margin=0.02 if show_days_only else 0.05)
+    y_lo, y_hi = padded_range(y_points) if y_points.size else (0.0, 1.0)
+
+    def scale_x(x):
+        return MARGIN_LEFT + (x - x_lo) / (x_hi - x_lo) * plot_w
+
+    def scale_y(y):
+        return MARGIN_TOP + plot_h - (y - y_lo) / (y_hi - y_lo) * plot_h
+
+    # Ticks and labels
+    y_ticks, y_labels = value_ticks(y_lo, y_hi)
+    if show_days_only:
+        x_ticks = days
+        calendar_days = days.astype('datetime64[D]')
+        day_of_month = (calendar_days - calendar_days.astype('datetime64[M]')).astype(np.int64) + 1
+        x_labels = [f"{day:02d}" for day in day_of_month.tolist()]
+    else:
+        span = max(x_hi - x_lo, 1)
+        step = next((s for s in DATE_STEPS if span / s <= 8), DATE_STEPS[-1])
+        x_ticks = np.arange(math.ceil(x_lo / step) * step, x_hi, step).astype(np.int64)
+        x_labels = [str(day) for day in x_ticks.astype('datetime64[D]')]
+
+    tick_x = scale_x(x_ticks.astype(float))
+    tick_y = scale_y(y_ticks)
+    px = np.round(scale_x(x_points.astype(float)), 1)
+    py = np.round(scale_y(y_points), 1)
+
+    stroke = COLOR_CODES.get(color, color)
+    bottom = MARGIN_TOP + plot_h
+    right = MARGIN_LEFT + plot_w
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {WIDTH} {HEIGHT}" '
+        f'width="{WIDTH}" height="{HEIGHT}" font-family="DejaVu Sans, Arial, sans-serif" font-size="11">',
+        f'<defs><marker id="dot" viewBox="0 0 8 8" refX="4" refY="4" markerWidth="8" markerHeight="8" '
+        f'markerUnits="userSpaceOnUse"><circle cx="4" cy="4" r="3.5" fill="{stroke}"/></marker></defs>',
+        f'<rect width="{WIDTH}" height="{HEIGHT}" fill="#ffffff"/>',
+    ]
+
+    # Grid
+    grid = ''.join(f'M{x:.1f} {MARGIN_TOP}V{bottom}' for x in tick_x)
+    grid += ''.join(f'M{MARGIN_LEFT} {y:.1f}H{right}' for y in tick_y)
+    parts.append(f'<path d="{grid}" stroke="{GRID_COLOR}" stroke-width="0.8" fill="none"/>')
+    parts.append(f'<rect x="{MARGIN_LEFT}" y="{MARGIN_TOP}" width="{plot_w}" height="{plot_h}" '
+                 f'fill="none" stroke="{AXIS_COLOR}" stroke-width="0.8"/>')
+
+    # Tick labels
+    if show_days_only:
+        parts.extend(
+            f'<text x="{x:.1f}" y="{bottom + 16}" text-anchor="end" '
+            f'transform="rotate(-45 {x:.1f} {bottom + 16})">{label}</text>'
+            for x, label in zip(tick_x, x_labels)
+        )
+    else:
+        parts.extend(
+            f'<text x="{x:.1f}" y="{bottom + 16}" text-anchor="middle">{label}</text>'
+            for x, label in zip(tick_x, x_labels)
+        )
+    parts.extend(
+        f'<text x="{MARGIN_LEFT - 6}" y="{y + 4:.1f}" text-anchor="end">{label}</text>'
+        for y, label in zip(tick_y, y_labels)
+    )
+
+    # Data line with a marker on every point
+    if px.size:
+        points = ' '.join(f'{x:g},{y:g}' for x, y in zip(px.tolist(), py.tolist()))
+        parts.append(f'<polyline points="{points}" fill="none" stroke="{stroke}" stroke-width="1.5" '
+                     f'marker-start="url(#dot)" marker-mid="url(#dot)" marker-end="url(#dot)"/>')
+
+    # Title and axis labels
+    parts.append(f'<text x="{MARGIN_LEFT + plot_w / 2:g}" y="{MARGIN_TOP - 14}" text-anchor="middle" '
+                 f'font-size="14">{escape(title)}</text>')
+    parts.append(f'<text x="{MARGIN_LEFT + plot_w / 2:g}" y="{HEIGHT - 6}" text-anchor="middle">{escape(xlabel)}</text>')
+    parts.append(f'<text x="14" y="{MARGIN_TOP + plot_h / 2:g}" text-anchor="middle" '
+                 f'transform="rotate(-90 14 {MARGIN_TOP + plot_h / 2:g})">{escape(ylabel)}</text>')
+    parts.append('</svg>')
+    return ''.join(parts)
@@ -10,6 +10,8 @@ CREATE TABLE users (
         username VARCHAR(120) NOT NULL,
         email VARCHAR(120) NOT NULL,
         pw_hash VARCHAR(120) NOT NULL,
+        deleted_at DATETIME,
+        version INTEGER NOT NULL DEFAULT 0,
         PRIMARY KEY (id),
         UNIQUE (email)
 );
@@ -43,6 +45,7 @@ CREATE TABLE pets (
     microchip_number VARCHAR(50),
     insurance_company VARCHAR(100),
     insurance_number VARCHAR(50),
+    version INTEGER NOT NULL DEFAULT 0,
     FOREIGN KEY (user_id) REFERENCES users(id),
     FOREIGN KEY (species_id) REFERENCES species(id),
     FOREIGN KEY (breed_id) REFERENCES breeds(id)
@@ -63,6 +66,7 @@ CREATE TABLE logs (
     title VARCHAR(150),
     date_uploaded DATE NOT NULL,
     content TEXT NOT NULL,
+    excerpt VARCHAR(151) NOT NULL DEFAULT '',
     FOREIGN KEY(pet_id) REFERENCES pets(id)
 );
 
@@ -109,4 +113,144 @@ CREATE TABLE medication_tracker (
     date DATE NOT NULL,
     next_dosis DATE,
     notes VARCHAR(100)
-);
\ No newline at end of file
+);
+
+CREATE UNIQUE INDEX ix_breeds_species_id_name ON breeds (species_id, name);
+CREATE INDEX ix_pets_user_id ON pets (user_id);
+CREATE INDEX ix_photos_pet_id_date_uploaded ON photos (pet_id, date_uploaded);
+CREATE INDEX ix_logs_pet_id_date_uploaded ON logs (pet_id, date_uploaded);
+CREATE INDEX ix_weight_tracker_pet_id_date ON weight_tracker (pet_id, date);
+CREATE INDEX ix_vaccine_tracker_pet_id_date ON vaccine_tracker (pet_id, date);
+CREATE INDEX ix_internal_deworming_tracker_pet_id_date ON internal_deworming_tracker (pet_id, date);
+CREATE INDEX ix_external_deworming_tracker_pet_id_date ON external_deworming_tracker (pet_id, date);
+CREATE INDEX ix_medication_tracker_pet_id_date ON medication_tracker (pet_id, date);
+CREATE INDEX ix_pets_pet_profile_photo ON pets (pet_profile_photo);
+CREATE INDEX ix_photos_image_url ON photos (image_url);
+
+CREATE TABLE email_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient VARCHAR(120) NOT NULL,
+    sender VARCHAR(120),
+    subject VARCHAR(200) NOT NULL,
+    html TEXT NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at DATETIME NOT NULL,
+    claim_token VARCHAR(32),
+    claimed_at DATETIME,
+    last_error VARCHAR(255),
+    created_at DATETIME NOT NULL
+);
+
+CREATE INDEX ix_email_outbox_status_next_attempt_at ON email_outbox (status, next_attempt_at);
+CREATE INDEX ix_email_outbox_claim_token ON email_outbox (claim_token);
+
+CREATE TABLE account_deletion_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending',
+    phase VARCHAR(40),
+    pets_total INTEGER,
+    pets_deleted INTEGER NOT NULL DEFAULT 0,
+    rows_total INTEGER,
+    rows_deleted INTEGER NOT NULL DEFAULT 0,
+    files_queued INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claim_token VARCHAR(32),
+    claimed_at DATETIME,
+    last_error VARCHAR(255),
+    created_at DATETIME NOT NULL,
+    finished_at DATETIME,
+    next_attempt_at DATETIME
+);
+
+CREATE INDEX ix_account_deletion_jobs_user_id ON account_deletion_jobs (user_id);
+CREATE INDEX ix_account_deletion_jobs_claim_token ON account_deletion_jobs (claim_token);
+CREATE INDEX ix_account_deletion_jobs_status_claimed_at ON account_deletion_jobs (status, claimed_at);
+
+-- Full-text search over logs and tracker entries (search.py), kept in sync by triggers
+CREATE VIRTUAL TABLE search_index USING fts5(title, body, day UNINDEXED, tokenize = 'porter unicode61 remove_diacritics 2', prefix = '2 3');
+
+CREATE TRIGGER logs_search_insert AFTER INSERT ON logs
+BEGIN
+    INSERT INTO search_index (rowid, title, body, day) SELECT ((new.pet_id << 32) | (new.id << 3) | 0), new.title, new.content, new.date_uploaded WHERE 1;
+END;
+CREATE TRIGGER logs_search_update AFTER UPDATE ON logs
+BEGIN
+    DELETE FROM search_index WHERE rowid = ((old.pet_id << 32) | (old.id << 3) | 0);
+    INSERT INTO search_index (rowid, title, body, day) SELECT ((new.pet_id << 32) | (new.id << 3) | 0), new.title, new.content, new.date_uploaded WHERE 1;
+END;
+CREATE TRIGGER logs_search_delete AFTER DELETE ON logs
+BEGIN
+    DELETE FROM search_index WHERE rowid = ((old.pet_id << 32) | (old.id << 3) | 0);
+END;
+
+CREATE TRIGGER weight_tracker_search_insert AFTER INSERT ON weight_tracker
+BEGIN
+    INSERT INTO search_index (rowid, title, body, day) SELECT ((new.pet_id << 32) | (new.id << 3) | 1), NULL, new.notes, new.date WHERE new.notes IS NOT NULL;
+END;
+CREATE TRIGGER weight_tracker_search_update AFTER UPDATE ON weight_tracker
+BEGIN
+    DELETE FROM search_index WHERE rowid = ((old.pet_id << 32) | (old.id << 3) | 1);
+    INSERT INTO search_index (rowid, title, body, day) SELECT ((new.pet_id << 32) | (new.id << 3) | 1), NULL, new.notes, new.date WHERE new.notes IS NOT NULL;
+END;
+CREATE TRIGGER weight_tracker_search_delete AFTER DELETE ON weight_tracker
+BEGIN
+    DELETE FROM search_index WHERE rowid = ((old.pet_id << 32) | (old.id << 3) | 1);
+END;
+
+CREATE TRIGGER vaccine_tracker_search_insert AFTER INSERT ON vaccine_tracker
+BEGIN
+    INSERT INTO search_index (rowid, title, body, day) SELECT ((new.pet_id << 32) | (new.id << 3) | 2), new.vaccine_name, coalesce(new.administered_by || ' ', '') || coalesce(new.notes, ''), new.date WHERE 1;
+END;
+CREATE TRIGGER vaccine_tracker_search_update AFTER UPDATE ON vaccine_tracker
+BEGIN
+    DELETE FROM search_index WHERE rowid = ((old.pet_id << 32) | (old.id << 3) | 2);
+    INSERT INTO search_index (rowid, title, body, day) SELECT ((new.pet_id << 32) | (new.id << 3) | 2), new.vaccine_name, coalesce(new.administered_by || ' ', '') || coalesce(new.notes, ''), new.date WHERE 1;
+END;
+CREATE TRIGGER vaccine_tracker_search_delete AFTER DELETE ON vaccine_tracker
+BEGIN
+    DELETE FROM search_index WHERE rowid = ((old.pet_id << 32) | (old.id << 3) | 2);
+END;
+
+CREATE TRIGGER internal_deworming_tracker_search_insert AFTER INSERT ON internal_deworming_tracker
+BEGIN
+    INSERT INTO search_index (rowid, title, body, day) SELECT ((new.pet_id << 32) | (new.id << 3) | 3), new.product_name, new.notes, new.date WHERE 1;
+END;
+CREATE TRIGGER internal_deworming_tracker_search_update AFTER UPDATE ON internal_deworming_tracker
+BEGIN
+    DELETE FROM search_index WHERE rowid = ((old.pet_id << 32) | (old.id << 3) | 3);
+    INSERT INTO search_index (rowid, title, body, day) SELECT ((new.pet_id << 32) | (new.id << 3) | 3), new.product_name, new.notes, new.date WHERE 1;
+END;
+CREATE TRIGGER internal_deworming_tracker_search_delete AFTER DELETE ON internal_deworming_tracker
+BEGIN
+    DELETE FROM search_index WHERE rowid = ((old.pet_id << 32) | (old.id << 3) | 3);
+END;
+
+CREATE TRIGGER external_deworming_tracker_search_insert AFTER INSERT ON external_deworming_tracker
+BEGIN
+    INSERT INTO search_index (rowid, title, body, day) SELECT ((new.pet_id << 32) | (new.id << 3) | 4), new.product_name, new.notes, new.date WHERE 1;
+END;
+CREATE TRIGGER external_deworming_tracker_search_update AFTER UPDATE ON external_deworming_tracker
+BEGIN
+    DELETE FROM search_index WHERE rowid = ((old.pet_id << 32) | (old.id << 3) | 4);
+    INSERT INTO search_index (rowid, title, body, day) SELECT ((new.pet_id << 32) | (new.id << 3) | 4), new.product_name, new.notes, new.date WHERE 1;
+END;
+CREATE TRIGGER external_deworming_tracker_search_delete AFTER DELETE ON external_deworming_tracker
+BEGIN
+    DELETE FROM search_index WHERE rowid = ((old.pet_id << 32) | (old.id << 3) | 4);
+END;
+
+CREATE TRIGGER medication_tracker_search_insert AFTER INSERT ON medication_tracker
+BEGIN
+    INSERT INTO search_index (rowid, title, body, day) SELECT ((new.pet_id << 32) | (new.id << 3) | 5), new.product_name, new.notes, new.date WHERE 1;
+END;
+CREATE TRIGGER medication_tracker_search_update AFTER UPDATE ON medication_tracker
+BEGIN
+    DELETE FROM search_index WHERE rowid = ((old.pet_id << 32) | (old.id << 3) | 5);
+    INSERT INTO search_index (rowid, title, body, day) SELECT ((new.pet_id << 32) | (new.id << 3) | 5), new.product_name, new.notes, new.date WHERE 1;
+END;
+CREATE TRIGGER medication_tracker_search_delete AFTER DELETE ON medication_tracker
+BEGIN
+    DELETE FROM search_index WHERE rowid = ((old.pet_id << 32) | (old.id << 3) | 5);
+END;
@@ -0,0 +1,149 @@
+"""
+Fixtures of the test suite: the app on a migrated database of its own, logged-in
+clients and a local SMTP server.
+
+Run from the project root with `python -m pytest`.
+"""
+
+import socketserver
+import threading
+
+import pytest
+from flask_migrate import upgrade
+
+from app_factory import init_app
+from bootstrap import clone_database, seed_catalog
+from extensions import db
+from models import Pet, Species, User
+
+# Switches read from the environment by init_app()
+ENVIRONMENT = {
+    'SECRET_KEY': 'test',
+    'OUTBOX_ENABLED': 'False',
+    'ACCOUNT_PURGE_ENABLED': 'False',
+    # Cheap hashes on the request thread
+    'PASSWORD_POOL_SIZE': '0',
+    'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+    'MAIL_DEFAULT_SENDER': 'petpal@example.com',
+}
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    """Minimal SMTP dialogue: accepts every message, or refuses the connection while `server.failing`"""
+
+    def handle(self):
+        if self.server.failing:
+            self.wfile.write(b"421 Service not available\r\n")
+            return
+        self.wfile.write(b"220 localhost test SMTP\r\n")
+        lines = None
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if lines is not None:
+                if line == b".\r\n":
+                    self.server.messages.append(b"".join(lines).decode())
+                    lines = None
+                    self.wfile.write(b"250 Queued\r\n")
+                else:
+                    lines.append(line)
+                continue
+            command = line[:4].upper()
+            if command == b"DATA":
+                lines = []
+                self.wfile.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+            elif command == b"QUIT":
+                self.wfile.write(b"221 Bye\r\n")
+                return
+            else:
+                self.wfile.write(b"250 OK\r\n")
+
+
+class SmtpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SmtpHandler)
+        self.messages = []
+        self.failing = False
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    """Local debugging SMTP server the app's Flask-Mail is pointed at"""
+    server = SmtpServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv('MAIL_SERVER', '127.0.0.1')
+    monkeypatch.setenv('MAIL_PORT', str(server.server_address[1]))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_app(folder, database, **config):
+    return init_app({
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        # Flask-Mail skips SMTP under TESTING; the outbox tests talk to a real server
+        'MAIL_SUPPRESS_SEND': False,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{database}",
+        'UPLOAD_FOLDER': str(folder / 'uploads'),
+        'SESSION_DB_PATH': str(folder / 'sessions.db'),
+        'SESSION_SWEEP_INTERVAL': 0,
+        'RATE_LIMIT_DB_PATH': str(folder / 'rate_limits.db'),
+        'THUMBNAIL_ENABLED': False,
+        **config,
+    })
+
+
+@pytest.fixture(scope='session')
+def template_database(tmp_path_factory):
+    """Database migrated and seeded once per run, copied for every test"""
+    folder = tmp_path_factory.mktemp('template')
+    database = folder / 'petpal.db'
+    with pytest.MonkeyPatch.context() as patch:
+        for name, value in ENVIRONMENT.items():
+            patch.setenv(name, value)
+        app = make_app(folder, database)
+        with app.app_context():
+            upgrade()
+            with db.engine.begin() as connection:
+                seed_catalog(connection)
+            db.engine.dispose()
+    return database
+
+
+@pytest.fixture
+def app(tmp_path, template_database, smtp_server, monkeypatch):
+    for name, value in ENVIRONMENT.items():
+        monkeypatch.setenv(name, value)
+    database = tmp_path / 'petpal.db'
+    clone_database(template_database, database)
+    app = make_app(tmp_path, database)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def owner(app):
+    """A user with one dog"""
+    user = User(username='owner', email='owner@example.com', pw_hash='unused')
+    db.session.add(user)
+    db.session.flush()
+    pet = Pet(user_id=user.id, name='Rex', sex='M', species_id=db.session.query(Species.id).first()[0])
+    db.session.add(pet)
+    db.session.commit()
+    return user, pet
+
+
+@pytest.fixture
+def client(app, owner):
+    """Test client logged in as the owner"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = owner[0].id
+    return client
@@ -0,0 +1,63 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import update
+
+from account_deletion import purger
+from extensions import db
+from models import AccountDeletionJob, Log, Pet, User, WeightTracker, utcnow
+
+
+@pytest.fixture
+def deleted_owner(app, client, owner):
+    """The owner with a few logs and weights, after asking to delete the account"""
+    user, pet = owner
+    for day in range(1, 6):
+        db.session.add(Log(pet_id=pet.id, title=f"Day {day}", content="Walk", date_uploaded=date(2024, 1, day)))
+        db.session.add(WeightTracker(pet_id=pet.id, weight_in_kg=10 + day, date=date(2024, 1, day)))
+    db.session.commit()
+    app.config['ACCOUNT_PURGE_BATCH_SIZE'] = 2
+    app.config['ACCOUNT_PURGE_PAUSE'] = 0
+    assert client.get(f"/delete_user/{user.id}").status_code == 302
+    return user.id
+
+
+def test_deletion_hides_the_account_and_purges_it_in_chunks(deleted_owner):
+    assert db.session.get(User, deleted_owner).deleted_at is not None
+
+    assert purger.run_once()
+
+    job = AccountDeletionJob.query.one()
+    assert (job.status, job.rows_total, job.rows_deleted, job.pets_deleted) == ('done', 10, 10, 1)
+    assert db.session.get(User, deleted_owner) is None
+    assert Pet.query.count() == Log.query.count() == 0
+    # One chunk to count, three each for the logs and weights, one for the pet and one for the user
+    assert purger.chunks == 9
+    assert not purger.run_once()
+
+
+def test_worker_stops_when_its_job_was_claimed_by_another(deleted_owner):
+    job = purger._claim()
+    token = job.claim_token
+    assert purger.purge_chunk(job, token)
+    # The lease ran out and another worker claimed the job
+    db.session.execute(update(AccountDeletionJob).values(claim_token="other"))
+    db.session.commit()
+
+    assert not purger.purge_chunk(job, token)
+
+    assert Log.query.count() == 5
+    assert db.session.get(AccountDeletionJob, job.id).rows_deleted == 0
+
+
+def test_failed_purge_is_retried_later(app, deleted_owner, monkeypatch):
+    def fail(job, token):
+        raise RuntimeError("disk I/O error")
+    monkeypatch.setattr(purger, 'purge_chunk', fail)
+
+    assert purger.run_once()
+
+    job = AccountDeletionJob.query.one()
+    assert (job.status, job.attempts, job.last_error) == ('pending', 1, "disk I/O error")
+    assert job.next_attempt_at > utcnow()
+    assert not purger.run_once()
@@ -0,0 +1,79 @@
+import time
+
+from extensions import db
+from mail_outbox import dispatcher, enqueue_email
+from models import OutboxEmail, utcnow
+
+
+def queue(count):
+    for i in range(count):
+        enqueue_email(f"user{i}@example.com", f"Subject {i}", f"<p>Body {i}</p>")
+    db.session.commit()
+
+
+def test_delivers_queued_emails(app, smtp_server):
+    queue(3)
+
+    assert dispatcher.drain_once() == 3
+
+    assert len(smtp_server.messages) == 3
+    assert "Subject 0" in smtp_server.messages[0]
+    assert OutboxEmail.query.count() == 0
+    assert dispatcher.stats()["queue_depth"] == 0
+
+
+def test_failed_delivery_is_retried_with_backoff(app, smtp_server):
+    app.config['OUTBOX_BACKOFF_BASE'] = 60
+    smtp_server.failing = True
+    queue(1)
+
+    dispatcher.drain_once()
+
+    email = db.session.get(OutboxEmail, 1)
+    assert (email.status, email.attempts) == ('pending', 1)
+    assert email.last_error
+    # Jitter keeps the first retry between half and all of the base delay
+    delay = (email.next_attempt_at - utcnow()).total_seconds()
+    assert 25 < delay <= 60
+    # Not due yet, so the next pass leaves it alone even with the relay back
+    smtp_server.failing = False
+    assert dispatcher.drain_once() == 0
+
+    email.next_attempt_at = utcnow()
+    db.session.commit()
+    assert dispatcher.drain_once() == 1
+    assert len(smtp_server.messages) == 1
+
+
+def test_gives_up_after_max_attempts(app, smtp_server):
+    app.config['OUTBOX_MAX_ATTEMPTS'] = 1
+    smtp_server.failing = True
+    queue(1)
+
+    dispatcher.drain_once()
+
+    assert db.session.get(OutboxEmail, 1).status == 'failed'
+    assert dispatcher.stats()["dead_letters"] == 1
+
+
+def test_circuit_breaker_opens_and_closes(app, smtp_server):
+    dispatcher.breaker.threshold = 2
+    dispatcher.breaker.cooldown = 0.2
+    app.config['OUTBOX_BACKOFF_BASE'] = 0
+    smtp_server.failing = True
+    queue(1)
+
+    dispatcher.drain_once()
+    assert dispatcher.breaker.state == 'closed'
+    dispatcher.drain_once()
+    assert dispatcher.breaker.state == 'open'
+    # While open the relay is not contacted at all
+    assert dispatcher.drain_once() == 0
+    assert db.session.get(OutboxEmail, 1).attempts == 2
+
+    smtp_server.failing = False
+    time.sleep(0.25)
+    assert dispatcher.breaker.state == 'half-open'
+    assert dispatcher.drain_once() == 1
+    assert dispatcher.breaker.state == 'closed'
+    assert len(smtp_server.messages) == 1
@@ -0,0 +1,20 @@
+COMPONENTS = {
+    'account_purger', 'breed_catalog', 'chart_pool', 'file_cleanup', 'graph_cache', 'mail_outbox', 'page_versions',
+    'password_pool', 'pet_list_cache', 'rate_limiter', 'session_store', 'sqlite_profile', 'thumbnails',
+}
+
+
+def test_stats_are_off_without_a_token(app):
+    client = app.test_client()
+    assert client.get("/ops/stats").status_code == 404
+    app.config['OPS_STATS_TOKEN'] = "s3cret"
+    assert client.get("/ops/stats").status_code == 404
+    assert client.get("/ops/stats", headers={"Authorization": "Bearer wrong"}).status_code == 404
+
+
+def test_stats_collect_every_component(app):
+    app.config['OPS_STATS_TOKEN'] = "s3cret"
+    response = app.test_client().get("/ops/stats", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert set(response.json) == COMPONENTS
+    assert response.json['mail_outbox']['queue_depth'] == 0
@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+from rate_limit import RateLimiter, rate_limiter
+
+
+@pytest.fixture
+def limits(app):
+    """Small buckets for login: 3 requests per IP and 1 per email an hour"""
+    app.config['RATE_LIMITS'] = {'login': {'ip': (3, 3600), 'email': (1, 3600)}}
+    rate_limiter.init_app(app)
+    return rate_limiter
+
+
+def test_empty_bucket_takes_no_token_from_the_others(limits):
+    assert limits.check('login', ip="203.0.113.7", email="a@example.com") is None
+    # The email bucket is empty, so the IP keeps its two tokens
+    for _ in range(5):
+        assert limits.check('login', ip="203.0.113.7", email="a@example.com") > 0
+    assert limits.check('login', ip="203.0.113.7", email="b@example.com") is None
+    assert limits.check('login', ip="203.0.113.7", email="c@example.com") is None
+    assert limits.check('login', ip="203.0.113.7", email="d@example.com") > 0
+
+
+def test_emails_are_case_insensitive(limits):
+    assert limits.check('login', email="Owner@Example.com") is None
+    assert limits.check('login', email="owner@example.com") > 0
+
+
+def test_buckets_refill(app, limits):
+    app.config['RATE_LIMITS'] = {'login': {'ip': (1, 0.2)}}
+    limits.init_app(app)
+    assert limits.check('login', ip="203.0.113.7") is None
+    retry_after = limits.check('login', ip="203.0.113.7")
+    assert 0 < retry_after <= 0.2
+    time.sleep(retry_after + 0.05)
+    assert limits.check('login', ip="203.0.113.7") is None
+
+
+def test_buckets_are_shared_between_processes(app, limits):
+    limits.check('login', email="a@example.com")
+    # Another worker process has a limiter of its own on the same database
+    other = RateLimiter(app)
+    assert other.check('login', email="a@example.com") > 0
+    assert other.stats()["limited"] == 1
+    assert other.check('login', email="a@example.com") > 0
+    assert other.stats()["limited_locally"] == 1
+
+
+def test_login_answers_429_with_retry_after(app, limits):
+    client = app.test_client()
+    form = {"email": "nobody@example.com", "password": "wrong"}
+    assert client.post("/login", data=form).status_code == 403
+    response = client.post("/login", data=form)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
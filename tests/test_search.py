@@ -0,0 +1,79 @@
+from datetime import date
+
+from extensions import db
+from helpers import delete_pets_from_db
+from models import Log, Pet, VaccineTracker, WeightTracker
+from search import PETS_PER_QUERY, search_entries
+
+
+def add_log(pet, title, content):
+    log = Log(pet_id=pet.id, title=title, content=content, date_uploaded=date(2024, 3, 1))
+    db.session.add(log)
+    db.session.commit()
+    return log
+
+
+def test_index_follows_inserts_updates_and_deletes(owner):
+    user, pet = owner
+    log = add_log(pet, "Park", "Long walk in the rain")
+    db.session.add(VaccineTracker(pet_id=pet.id, vaccine_name="Rabies", date=date(2024, 3, 2)))
+    # Weights without notes are not indexed
+    db.session.add(WeightTracker(pet_id=pet.id, weight_in_kg=12, date=date(2024, 3, 3)))
+    db.session.commit()
+
+    [result] = search_entries("walking", [pet.id])
+    assert (result.kind, result.source_id, result.pet_id) == ('log', log.id, pet.id)
+    assert "<mark>walk</mark>" in result.snippet
+    assert search_entries("rabies", [pet.id])[0].kind == 'vaccine'
+
+    log.content = "Nap on the sofa"
+    db.session.commit()
+    assert search_entries("walk", [pet.id]) == []
+    assert len(search_entries("sofa", [pet.id])) == 1
+
+    db.session.delete(log)
+    db.session.commit()
+    assert search_entries("sofa", [pet.id]) == []
+
+
+def test_bulk_pet_deletion_empties_the_index(owner):
+    user, pet = owner
+    add_log(pet, "Vet", "Checkup")
+    delete_pets_from_db([pet.id], db)
+    db.session.commit()
+    assert search_entries("checkup", [pet.id]) == []
+
+
+def test_searches_are_scoped_to_the_pets_given(owner):
+    user, pet = owner
+    other = Pet(user_id=user.id, name="Tom", sex='M', species_id=pet.species_id)
+    db.session.add(other)
+    db.session.commit()
+    add_log(pet, "Ball", "Played ball")
+    add_log(other, "Ball", "Ball in the garden, ball again")
+
+    assert [result.pet_id for result in search_entries("ball", [pet.id])] == [pet.id]
+    # Both pets in one statement, the entry with more matches first
+    assert [result.pet_id for result in search_entries("ball", [pet.id, other.id])] == [other.id, pet.id]
+    assert [result.pet_id for result in search_entries("bal*", [pet.id, other.id])] == [other.id, pet.id]
+
+
+def test_users_with_many_pets_are_searched_in_several_statements(owner):
+    user, pet = owner
+    pets = [Pet(user_id=user.id, name=f"Pet {i}", sex='F', species_id=pet.species_id)
+            for i in range(PETS_PER_QUERY + 5)]
+    db.session.add_all(pets)
+    db.session.commit()
+    add_log(pets[0], "Treat", "Treat")
+    add_log(pets[-1], "Treat", "Treat")
+
+    results = search_entries("treat", [p.id for p in pets])
+    assert {result.pet_id for result in results} == {pets[0].id, pets[-1].id}
+
+
+def test_search_page_lists_the_users_matches(client, owner):
+    user, pet = owner
+    add_log(pet, "Grooming", "Brushed the coat")
+    response = client.get("/search?q=brush")
+    assert response.status_code == 200
+    assert b"<mark>Brushed</mark>" in response.data
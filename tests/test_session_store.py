@@ -0,0 +1,76 @@
+import time
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from extensions import db
+from session_store import session_store
+
+
+@pytest.fixture
+def login(app, owner):
+    """Log the owner in with a real password; returns the client's session id"""
+    user, pet = owner
+    user.pw_hash = generate_password_hash("correct horse", "pbkdf2:sha256:1000")
+    db.session.commit()
+
+    def login(client):
+        response = client.post("/login", data={"email": user.email, "password": "correct horse"})
+        assert response.status_code == 302
+        return client.get_cookie("session").value
+    return login
+
+
+def stored():
+    return session_store.stats()["entries"]
+
+
+def test_anonymous_visits_store_nothing(app):
+    client = app.test_client()
+    assert client.get("/login").status_code == 200
+    assert client.get_cookie("session") is None
+    assert stored() == 0
+
+
+def test_login_gives_a_planted_session_a_new_id(app, login):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["theme"] = "dark"
+    planted = client.get_cookie("session").value
+    assert stored() == 1
+
+    sid = login(client)
+
+    assert sid != planted
+    assert stored() == 1
+    # The old id no longer opens the logged-in session
+    client.set_cookie("session", planted)
+    with client.session_transaction() as session:
+        assert "user_id" not in session
+
+
+def test_logout_forgets_the_session(app, login):
+    client = app.test_client()
+    sid = login(client)
+    assert client.get("/").status_code == 200
+
+    client.get("/logout")
+
+    assert client.get_cookie("session") is None
+    assert stored() == 0
+    client.set_cookie("session", sid)
+    assert client.get("/").status_code == 302
+
+
+def test_sweep_removes_expired_and_excess_sessions(app, login):
+    app.config['SESSION_TTL'] = 1
+    for _ in range(3):
+        login(app.test_client())
+    time.sleep(1.1)
+    app.config['SESSION_TTL'] = 3600
+    app.config['SESSION_MAX_ENTRIES'] = 1
+    for _ in range(2):
+        login(app.test_client())
+
+    assert session_store.sweep() == 4
+    assert stored() == 1
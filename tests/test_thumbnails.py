@@ -0,0 +1,62 @@
+import io
+import os
+import time
+
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+from thumbnails import thumbnails
+from upload_store import store_upload
+
+
+@pytest.fixture
+def pipeline(app):
+    app.config.update(THUMBNAIL_ENABLED=True, THUMBNAIL_WIDTHS=(160, 320), THUMBNAIL_RETRY_AFTER=0.5)
+    thumbnails.init_app(app)
+    with app.test_request_context():
+        yield thumbnails
+    thumbnails.shutdown()
+
+
+def stored(app, data):
+    return store_upload(FileStorage(io.BytesIO(data), filename="photo.png"), app.config['UPLOAD_FOLDER'])
+
+
+def png(width, height):
+    image = io.BytesIO()
+    Image.new('RGB', (width, height), 'green').save(image, 'PNG')
+    return image.getvalue()
+
+
+def test_derivatives_are_made_and_cached(app, pipeline):
+    name = stored(app, png(400, 200))
+    assert pipeline.variants(name) is None
+
+    pipeline.shutdown()
+
+    variants = pipeline.variants(name)
+    assert (variants.width, variants.height) == (400, 200)
+    assert variants.webp_srcset.endswith(f"{name}.320.webp 320w")
+    assert os.path.exists(os.path.join(pipeline.derived_folder, f"{name}.160.jpg"))
+    assert pipeline.stats()["cached"] == 1
+
+
+def test_failed_files_are_reported_and_retried_later(app, pipeline):
+    # A PNG signature on bytes Pillow cannot decode
+    name = stored(app, b'\x89PNG\r\n\x1a\n' + b'broken' * 100)
+    pipeline.variants(name)
+    pipeline.shutdown()
+
+    stats = pipeline.stats()
+    assert (stats["failed"], stats["errors"]) == (1, 1)
+    assert stats["recent_failures"][0]["name"] == name
+    # Not queued again before THUMBNAIL_RETRY_AFTER
+    assert pipeline.variants(name) is None
+    assert pipeline.stats()["pending"] == 0
+
+    time.sleep(0.6)
+    assert pipeline.variants(name) is None
+    assert pipeline.stats()["pending"] == 1
+    pipeline.shutdown()
+    assert pipeline.stats()["errors"] == 2
@@ -0,0 +1,97 @@
+import hashlib
+import io
+import os
+from datetime import date
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from extensions import db
+from file_cleanup import file_cleaner
+from models import Photo
+from upload_store import UnsupportedUpload, content_name, store_upload
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'pixels' * 1000
+
+
+def upload(data, filename="IMG_0001.png"):
+    return FileStorage(io.BytesIO(data), filename=filename)
+
+
+def stored_files(app):
+    folder = app.config['UPLOAD_FOLDER']
+    return sorted(os.path.relpath(os.path.join(root, name), folder)
+                  for root, _, names in os.walk(folder) for name in names)
+
+
+def post_photo(client, pet, data):
+    return client.post(f"/upload_photo/{pet.id}", content_type="multipart/form-data", data={
+        "title": "Sofa", "date_uploaded": "2024-03-01", "image": (io.BytesIO(data), "IMG_0001.png"),
+    })
+
+
+def test_same_bytes_are_stored_once(app, client, owner):
+    user, pet = owner
+    assert post_photo(client, pet, PNG).status_code == 302
+    assert post_photo(client, pet, PNG).status_code == 302
+
+    names = [photo.image_url for photo in Photo.query.all()]
+    assert len(names) == 2 and names[0] == names[1]
+    assert names[0].count('/') == 2 and names[0].endswith('.png')
+    assert stored_files(app) == [names[0]]
+
+
+def test_file_is_removed_with_its_last_reference(app, client, owner):
+    user, pet = owner
+    post_photo(client, pet, PNG)
+    post_photo(client, pet, PNG)
+    first, second = Photo.query.all()
+
+    client.get(f"/delete_photo/{first.id}")
+    file_cleaner.join()
+    assert stored_files(app) == [second.image_url]
+
+    client.get(f"/delete_photo/{second.id}")
+    file_cleaner.join()
+    assert stored_files(app) == []
+
+
+def test_rolled_back_upload_is_cleaned_up(app, owner):
+    user, pet = owner
+    folder = app.config['UPLOAD_FOLDER']
+    name = store_upload(upload(PNG), folder, db.session)
+    assert os.path.exists(os.path.join(folder, name))
+
+    db.session.rollback()
+    file_cleaner.join()
+
+    assert stored_files(app) == []
+
+
+def test_rolled_back_duplicate_keeps_the_stored_file(app, owner):
+    user, pet = owner
+    folder = app.config['UPLOAD_FOLDER']
+    name = store_upload(upload(PNG), folder, db.session)
+    db.session.add(Photo(pet_id=pet.id, image_url=name, date_uploaded=date(2024, 3, 1)))
+    db.session.commit()
+
+    assert store_upload(upload(PNG, "copy.png"), folder, db.session) == name
+    db.session.rollback()
+    file_cleaner.join()
+
+    # Only the spare copy of the duplicate went away
+    assert stored_files(app) == [name]
+
+
+def test_non_images_are_refused(app):
+    folder = app.config['UPLOAD_FOLDER']
+    with pytest.raises(UnsupportedUpload):
+        store_upload(upload(b"#!/bin/sh\necho hi\n", "script.png"), folder)
+    assert stored_files(app) == []
+
+
+def test_names_follow_the_content(app):
+    folder = app.config['UPLOAD_FOLDER']
+    name = store_upload(upload(PNG), folder)
+    assert name == content_name(hashlib.sha256(PNG).hexdigest(), '.png')
+    assert store_upload(upload(PNG + b'!'), folder) != name
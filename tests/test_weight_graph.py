@@ -0,0 +1,53 @@
+from datetime import date
+
+import pytest
+
+from extensions import db
+from models import WeightTracker
+
+
+@pytest.fixture
+def weights(owner):
+    user, pet = owner
+    for month in range(1, 13):
+        db.session.add(WeightTracker(pet_id=pet.id, weight_in_kg=10 + month / 10, date=date(2024, month, 5)))
+    db.session.commit()
+    return pet
+
+
+def history(client, pet, **params):
+    response = client.get(f"/{pet.id}/weight_history.json", query_string=params)
+    assert response.status_code == 200
+    return response
+
+
+def test_history_only_depends_on_the_views_parameters(client, weights):
+    every = [history(client, weights, view='all', year=year, month=month)
+             for year, month in ((2023, 1), (2024, 6), (2025, 12))]
+    assert (every[0].json["year"], every[0].json["month"]) == (None, None)
+    assert len(every[0].json["points"]) == 12
+    assert len({response.headers["ETag"] for response in every}) == 1
+
+    year = [history(client, weights, view='year', year=2024, month=month) for month in (1, 7)]
+    assert (year[0].json["year"], year[0].json["month"]) == (2024, None)
+    assert year[0].headers["ETag"] == year[1].headers["ETag"]
+
+    month = [history(client, weights, view='month', year=2024, month=month) for month in (1, 2)]
+    assert month[0].json["points"] == [["2024-01-05", 10.1]]
+    assert month[0].headers["ETag"] != month[1].headers["ETag"]
+
+
+def test_history_revalidates(client, weights):
+    etag = history(client, weights, view='all').headers["ETag"]
+    response = client.get(f"/{weights.id}/weight_history.json", query_string={"view": 'all'},
+                          headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_graph_image_etag_ignores_unused_parameters(client, weights):
+    etags = {
+        client.get(f"/{weights.id}/weight_graph.svg", query_string={"view": 'year', "year": 2024, "month": month},
+                   headers={"If-None-Match": "stale"}).headers["ETag"]
+        for month in (1, 7)
+    }
+    assert len(etags) == 1
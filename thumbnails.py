@@ -0,0 +1,299 @@
+"""
+Responsive derivatives of uploaded photos.
+
+Uploads are stored as sent (up to `MAX_CONTENT_LENGTH`), but pages show them as
+150px avatars and gallery cards. After the upload commits, each file is handed to
+a small process pool that writes EXIF-stripped WebP and JPEG copies at the
+`THUMBNAIL_WIDTHS` (never upscaled) under `uploads/derived/`, next to the same
+shard path as the original, followed by a JSON manifest. Stored names never
+change content (see `upload_store.py`), so a manifest stays valid for good.
+
+Templates ask `image_variants(name)` for `srcset` strings and fall back to the
+original until the manifest exists. Files uploaded before the pipeline existed
+are queued the first time a page shows them. A file whose derivatives could not
+be made is shown as the original and queued again by the first page showing it
+after `THUMBNAIL_RETRY_AFTER` seconds; the latest failures are listed in
+`stats()`. Once a manifest is written, the versions of the pets showing the
+photo are bumped (see `page_versions.py`), so their pages get a new ETag and
+stop being reused with the original file.
+
+Decoding and resizing run in separate processes (as in `chart_pool.py`) so large
+photos never hold the GIL of the web workers. JPEG sources are decoded with
+`Image.draft()`, which lets libjpeg scale down by a power of two while decoding:
+https://pillow.readthedocs.io/en/stable/reference/Image.html#PIL.Image.Image.draft
+"""
+
+import atexit
+import glob
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import url_for
+from sqlalchemy import event, select, union
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from extensions import db
+from file_cleanup import file_cleaner
+from models import Pet, Photo
+from page_versions import bump_versions
+
+DERIVED_FOLDER = 'derived'
+
+# (Pillow format, extension, save options) of every derivative
+FORMATS = (
+    ('WEBP', 'webp', {'method': 4}),
+    ('JPEG', 'jpg', {'optimize': True, 'progressive': True}),
+)
+
+Variants = namedtuple('Variants', ['src', 'jpeg_srcset', 'webp_srcset', 'width', 'height'])
+# Failures listed by stats()
+REPORTED_FAILURES = 20
+
+
+def make_derivatives(source, target_prefix, widths, quality):
+    """Write the resized copies of source and their manifest; runs in a pool process"""
+    from PIL import Image, ImageOps
+
+    os.makedirs(os.path.dirname(target_prefix), exist_ok=True)
+    with Image.open(source) as image:
+        # Let the JPEG decoder skip detail that no derivative needs
+        largest = max(widths)
+        image.draft('RGB', (largest, largest))
+        # Apply the EXIF orientation to the pixels; the copies are saved without EXIF
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        produced = []
+        for width in sorted({min(width, image.width) for width in widths}):
+            height = max(1, round(image.height * width / image.width))
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            for pil_format, extension, options in FORMATS:
+                path = f"{target_prefix}.{width}.{extension}"
+                resized.save(path + '.tmp', pil_format, quality=quality, **options)
+                os.replace(path + '.tmp', path)
+            produced.append(width)
+
+    # The manifest is written last: its presence means every copy is in place
+    manifest = {"widths": produced, "width": image.width, "height": image.height}
+    manifest_path = f"{target_prefix}.json"
+    with open(manifest_path + '.tmp', 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return manifest
+
+
+def queue_derivatives(session, names):
+    """Make derivatives of the uploaded files once `session` commits"""
+    session.info.setdefault('thumbnails_to_make', set()).update(name for name in names if name)
+
+
+class ThumbnailPipeline:
+    """Process pool producing derivatives and the cache of finished manifests"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = True
+        self.widths = (160, 320, 640, 1280)
+        self.quality = 80
+        self.upload_folder = None
+        self._executor = None
+        self._pending = set()
+        # Name: (monotonic time of the next try, error), oldest first
+        self._failed = OrderedDict()
+        self.retry_after = 3600
+        self._variants = OrderedDict()
+        self._max_cached = 4096
+        self._lock = threading.Lock()
+        self.made = 0
+        self.errors = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('THUMBNAIL_ENABLED', True)
+        app.config.setdefault('THUMBNAIL_WIDTHS', self.widths)
+        app.config.setdefault('THUMBNAIL_QUALITY', self.quality)
+        app.config.setdefault('THUMBNAIL_WORKERS', 1)
+        # Worker processes are replaced after this many photos to return decoder memory
+        app.config.setdefault('THUMBNAIL_MAX_TASKS', 200)
+        # Seconds before a file whose derivatives failed is tried again
+        app.config.setdefault('THUMBNAIL_RETRY_AFTER', self.retry_after)
+        app.config.setdefault('THUMBNAIL_START_METHOD',
+                              'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+        self.app = app
+        self.enabled = app.config['THUMBNAIL_ENABLED']
+        self.widths = tuple(app.config['THUMBNAIL_WIDTHS'])
+        self.quality = app.config['THUMBNAIL_QUALITY']
+        self.retry_after = app.config['THUMBNAIL_RETRY_AFTER']
+        self.upload_folder = app.config['UPLOAD_FOLDER']
+        os.makedirs(self.derived_folder, exist_ok=True)
+        app.extensions['thumbnails'] = self
+        app.add_template_global(self.variants, 'image_variants')
+        # Derivatives are deleted together with their original
+        file_cleaner.add_companions(self.derivative_paths)
+
+    @property
+    def derived_folder(self):
+        return os.path.join(self.upload_folder, DERIVED_FOLDER)
+
+    def _start(self):
+        with self._lock:
+            if self._executor is None:
+                config = self.app.config
+                self._executor = ProcessPoolExecutor(
+                    max_workers=config['THUMBNAIL_WORKERS'],
+                    mp_context=multiprocessing.get_context(config['THUMBNAIL_START_METHOD']),
+                    max_tasks_per_child=config['THUMBNAIL_MAX_TASKS'],
+                )
+                atexit.register(self.shutdown)
+        return self._executor
+
+    def submit(self, names):
+        """Queue stored files for processing, unless their derivatives already exist"""
+        if not self.enabled:
+            return
+        executor = self._start()
+        for name in names:
+            name = name.replace('\\', '/')
+            if os.path.exists(self._manifest_path(name)):
+                continue
+            with self._lock:
+                if name in self._pending:
+                    continue
+                self._pending.add(name)
+                self._failed.pop(name, None)
+            future = executor.submit(make_derivatives, os.path.join(self.upload_folder, name),
+                                     os.path.join(self.derived_folder, name), self.widths, self.quality)
+            future.add_done_callback(lambda future, name=name: self._done(name, future))
+
+    def _done(self, name, future):
+        with self._lock:
+            self._pending.discard(name)
+            if future.exception() is None:
+                self.made += 1
+            else:
+                self.errors += 1
+                self._failed[name] = (time.monotonic() + self.retry_after, str(future.exception())[:255])
+                if len(self._failed) > self._max_cached:
+                    self._failed.popitem(last=False)
+        if future.exception() is None:
+            self._bump_pages(name)
+        else:
+            self.app.logger.warning("Could not make derivatives of %s: %s", name, future.exception())
+
+    def _bump_pages(self, name):
+        """New ETags for the pages of the pets showing this file, which can now use its derivatives"""
+        try:
+            with self.app.app_context(), Session(db.engine) as session, session.begin():
+                pet_ids = set(session.scalars(union(
+                    select(Photo.pet_id).where(Photo.image_url == name),
+                    select(Pet.id).where(Pet.pet_profile_photo == name),
+                )))
+                bump_versions(session, pet_ids)
+        except SQLAlchemyError as e:
+            # Pages keep the original file until the pet changes again
+            self.app.logger.warning("Could not bump the pages showing %s: %s", name, e)
+
+    def _manifest_path(self, name):
+        return os.path.join(self.derived_folder, f"{name}.json")
+
+    def variants(self, name):
+        """Variants of an uploaded file for `srcset`, or None while only the original exists"""
+        if not name:
+            return None
+        name = name.replace('\\', '/')
+        with self._lock:
+            variants = self._variants.get(name)
+            if variants is not None:
+                self._variants.move_to_end(name)
+                return variants
+            if name in self._pending:
+                return None
+            failure = self._failed.get(name)
+            if failure is not None and failure[0] > time.monotonic():
+                return None
+
+        try:
+            with open(self._manifest_path(name)) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            # Uploaded before the pipeline existed, or failed a while ago: make them in the background
+            if os.path.exists(os.path.join(self.upload_folder, name)):
+                self.submit([name])
+            return None
+
+        variants = self._build_variants(name, manifest)
+        with self._lock:
+            self._variants[name] = variants
+            if len(self._variants) > self._max_cached:
+                self._variants.popitem(last=False)
+        return variants
+
+    @staticmethod
+    def _build_variants(name, manifest):
+        def url(width, extension):
+            return url_for('static', filename=f"uploads/{DERIVED_FOLDER}/{name}.{width}.{extension}")
+
+        def srcset(extension):
+            return ', '.join(f"{url(width, extension)} {width}w" for width in manifest['widths'])
+
+        # Browsers without srcset get a mid-sized copy
+        fallback = manifest['widths'][min(1, len(manifest['widths']) - 1)]
+        return Variants(url(fallback, 'jpg'), srcset('jpg'), srcset('webp'), manifest['width'], manifest['height'])
+
+    def derivative_paths(self, path):
+        """Derivative and manifest files of an uploaded file"""
+        if self.upload_folder is None:
+            return []
+        name = os.path.relpath(os.path.abspath(path), os.path.abspath(self.upload_folder)).replace(os.sep, '/')
+        if name.startswith(('../', DERIVED_FOLDER + '/')):
+            return []
+        with self._lock:
+            self._variants.pop(name, None)
+        return glob.glob(os.path.join(glob.escape(self.derived_folder), glob.escape(name) + '.*'))
+
+    def shutdown(self):
+        """Finish the queued files and stop the worker processes"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "widths": list(self.widths),
+                "pending": len(self._pending),
+                "failed": len(self._failed),
+                "recent_failures": [
+                    {"name": name, "error": error}
+                    for name, (_, error) in list(self._failed.items())[-REPORTED_FAILURES:]
+                ],
+                "cached": len(self._variants),
+                "made": self.made,
+                "errors": self.errors,
+            }
+
+
+thumbnails = ThumbnailPipeline()
+
+
+@event.listens_for(Session, 'after_commit')
+def _make_committed_derivatives(session):
+    names = session.info.pop('thumbnails_to_make', None)
+    if names:
+        thumbnails.submit(names)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_derivatives(session):
+    session.info.pop('thumbnails_to_make', None)
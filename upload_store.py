@@ -0,0 +1,330 @@
+"""
+Content-addressed storage of uploaded files.
+
+Uploads are stored under the SHA-256 of their bytes, sharded in two levels of
+subdirectories (`ab/cd/abcd...ef.jpg`) so no directory grows past a few hundred
+entries. Two users uploading `IMG_0001.jpg` no longer overwrite each other, the
+same bytes are stored once, and a name always means the same content, so the
+derivatives and caches keyed by it never go stale.
+
+References are counted from the rows that hold the names, `Photo.image_url` and
+`Pet.pet_profile_photo` (both indexed). Code dropping a reference calls
+`release_uploads()` in its transaction. Just before the commit, released names
+that no row uses any more are passed to `remove_after_commit()`, so a file is
+unlinked only with its last reference, and never if the transaction rolls back.
+
+`store_upload()` ties the new file to the session. When the same bytes are
+already stored, the upload is kept aside until the commit: the stored file may
+be on its way out with its last old reference (the file cleaner checks the
+references again before removing it), and it is put back from the spare copy
+if it is gone by then. Files stored by a transaction that rolls back (or is
+closed without a commit) go to the file cleaner, which deletes them unless a
+committed row uses them; a duplicate only loses its spare copy.
+
+Uploads are never buffered whole: `UploadRequest` hands werkzeug's multipart
+parser an `IngestingFile` for every file part. The parser feeds it the body chunk
+by chunk; each chunk is hashed and checked against the image signatures in the
+request thread, then written with `os.pwrite` by a small I/O thread pool while
+the next chunk is read from the socket. At most `UPLOAD_MAX_PENDING_CHUNKS` chunks
+per upload are held in memory. The file is fsynced and renamed into place on the
+same pool, so each upload is written to disk once instead of being spooled,
+copied and read again for the hash.
+
+Sharded layout as in git's object store:
+https://git-scm.com/book/en/v2/Git-Internals-Git-Objects
+Stream factory hook:
+https://werkzeug.palletsprojects.com/en/stable/wrappers/#werkzeug.wrappers.Request._get_file_stream
+"""
+
+import atexit
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from flask import current_app
+from flask.wrappers import Request
+from sqlalchemy import event, select, union
+from sqlalchemy.orm import Session, scoped_session
+
+from extensions import db
+from file_cleanup import file_cleaner, remove_after_commit
+from models import Pet, Photo
+
+# Names checked per reference query, below SQLite's bound parameter limit
+REFERENCE_BATCH_SIZE = 400
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Chunks of one upload waiting for the I/O pool before the parser has to wait
+UPLOAD_MAX_PENDING_CHUNKS = 4
+UPLOAD_IO_WORKERS = 4
+
+# Leading bytes of the formats accepted by helpers.allowed_photo_file
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+)
+SIGNATURE_LENGTH = max(len(signature) for signature, _ in IMAGE_SIGNATURES)
+
+
+class UnsupportedUpload(ValueError):
+    """The uploaded bytes are not a JPEG, PNG or GIF image"""
+
+
+_io_pool = None
+_io_pool_lock = threading.Lock()
+
+
+def io_pool():
+    """Thread pool doing the disk writes, fsyncs and renames of uploads"""
+    global _io_pool
+    with _io_pool_lock:
+        if _io_pool is None:
+            _io_pool = ThreadPoolExecutor(max_workers=UPLOAD_IO_WORKERS, thread_name_prefix='upload-io')
+            atexit.register(_io_pool.shutdown)
+        return _io_pool
+
+
+def _write_at(fd, data, offset):
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view, offset = view[written:], offset + written
+
+
+class IngestingFile:
+    """
+    Writable and readable upload stream that hashes and sniffs the bytes as they
+    arrive and writes them to a temporary file in the upload folder off-thread.
+    """
+
+    def __init__(self, upload_folder):
+        fd, self.temp_path = tempfile.mkstemp(dir=upload_folder, prefix='.upload-')
+        self._file = os.fdopen(fd, 'w+b')
+        self._hash = hashlib.sha256()
+        self._header = b''
+        self._size = 0
+        self._pending = []
+
+    def write(self, data):
+        data = bytes(data)
+        self._hash.update(data)
+        if len(self._header) < SIGNATURE_LENGTH:
+            self._header += data[:SIGNATURE_LENGTH - len(self._header)]
+        # Writes at explicit offsets, so the pool may run them in any order
+        self._pending.append(io_pool().submit(_write_at, self._file.fileno(), data, self._size))
+        self._size += len(data)
+        if len(self._pending) >= UPLOAD_MAX_PENDING_CHUNKS:
+            self._pending.pop(0).result()
+        return len(data)
+
+    def _drain(self):
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def digest(self):
+        return self._hash.hexdigest()
+
+    @property
+    def extension(self):
+        """Extension of the sniffed image format, None if it is not an accepted image"""
+        for signature, extension in IMAGE_SIGNATURES:
+            if self._header.startswith(signature):
+                return extension
+        return None
+
+    # Reading is only needed by code that treats the upload as a regular file
+    def seek(self, offset, whence=os.SEEK_SET):
+        self._drain()
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        self._drain()
+        return self._file.tell()
+
+    def read(self, size=-1):
+        self._drain()
+        return self._file.read(size)
+
+    def readline(self, size=-1):
+        self._drain()
+        return self._file.readline(size)
+
+    def flush(self):
+        self._drain()
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def store(self, upload_folder, session=None):
+        """Move the finished file to its content-addressed name and return that name"""
+        extension = self.extension
+        if extension is None:
+            raise UnsupportedUpload("Only JPEG, PNG and GIF images can be uploaded")
+        self._drain()
+        name = content_name(self.digest, extension)
+        path = os.path.join(upload_folder, name)
+        spare = io_pool().submit(self._place, path, session is not None).result()
+        if session is not None:
+            if session.get_transaction() is None:
+                # So that a rollback or close without commit ends a transaction (no connection yet)
+                session.begin()
+            session.info.setdefault('uploads_stored', []).append((path, spare))
+        return name
+
+    def _place(self, path, keep_spare):
+        """Put the file at `path`, returns the temporary copy kept when the bytes were already stored"""
+        spare = None
+        if os.path.exists(path):
+            # Same bytes already stored
+            if keep_spare:
+                spare = self.temp_path
+            else:
+                os.remove(self.temp_path)
+        else:
+            os.fsync(self._file.fileno())
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self.temp_path, path)
+        self.temp_path = None
+        self._file.close()
+        return spare
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._drain()
+        self._file.close()
+        if self.temp_path is not None:
+            os.remove(self.temp_path)
+            self.temp_path = None
+
+
+class UploadRequest(Request):
+    """Request that streams uploaded files into the upload folder while they are parsed"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return IngestingFile(current_app.config['UPLOAD_FOLDER'])
+
+
+def content_name(digest, extension):
+    """Sharded relative path of a file with this hash"""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+def store_upload(file_storage, upload_folder, session=None):
+    """
+    Store an uploaded file under its content hash and return its name relative to upload_folder.
+    With a session the file is only final once it commits, without one (scripts) it is at once.
+    """
+    if isinstance(session, scoped_session):
+        session = session()
+    upload = file_storage.stream
+    if isinstance(upload, IngestingFile):
+        return upload.store(upload_folder, session)
+
+    # Parsed without UploadRequest: stream it through an IngestingFile all the same
+    upload = IngestingFile(upload_folder)
+    try:
+        for chunk in iter(partial(file_storage.stream.read, UPLOAD_CHUNK_SIZE), b''):
+            upload.write(chunk)
+        return upload.store(upload_folder, session)
+    finally:
+        upload.close()
+
+
+def release_uploads(session, names):
+    """Drop references to stored files; files left without references are deleted after commit"""
+    session.info.setdefault('uploads_released', set()).update(name for name in names if name)
+
+
+def referenced_uploads(session, names):
+    """Names among `names` still used by a photo or a pet profile"""
+    names = list(names)
+    referenced = set()
+    for start in range(0, len(names), REFERENCE_BATCH_SIZE):
+        batch = names[start:start + REFERENCE_BATCH_SIZE]
+        referenced.update(session.scalars(union(
+            select(Photo.image_url).where(Photo.image_url.in_(batch)),
+            select(Pet.pet_profile_photo).where(Pet.pet_profile_photo.in_(batch)),
+        )))
+    return referenced
+
+
+@event.listens_for(Session, 'before_commit')
+def _remove_unreferenced_uploads(session):
+    names = session.info.pop('uploads_released', None)
+    if not names:
+        return
+    # The query autoflushes, so references removed or added in this transaction count
+    unreferenced = names - referenced_uploads(session, names)
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    remove_after_commit(session, [os.path.join(upload_folder, name) for name in unreferenced])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_released_uploads(session):
+    session.info.pop('uploads_released', None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _keep_stored_uploads(session):
+    for path, spare in session.info.pop('uploads_stored', ()):
+        if spare is None:
+            continue
+        if os.path.exists(path):
+            os.remove(spare)
+        else:
+            # Removed with its old references before this commit made it used again
+            with open(spare, 'rb') as copy:
+                os.fsync(copy.fileno())
+            os.replace(spare, path)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _abandon_stored_uploads(session, transaction):
+    # After a rollback, or a close without commit (after_commit has taken them otherwise)
+    if transaction.parent is not None:
+        return
+    stored = session.info.pop('uploads_stored', None)
+    if not stored:
+        return
+    placed = []
+    for path, spare in stored:
+        if spare is None:
+            placed.append(path)
+        else:
+            # The stored file is someone else's: only the spare copy was ours
+            os.remove(spare)
+    file_cleaner.submit(placed)
+
+
+def _upload_in_use(path):
+    """Whether a committed photo or pet profile uses the stored file at `path`"""
+    upload_folder = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+    name = os.path.relpath(os.path.abspath(path), upload_folder)
+    if name.startswith(os.pardir):
+        return False
+    with Session(db.engine) as session:
+        return bool(referenced_uploads(session, [name.replace(os.sep, '/')]))
+
+
+file_cleaner.add_reference_check(_upload_in_use)